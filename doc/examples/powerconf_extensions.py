@@ -1,10 +1,10 @@
 import logging
 from pathlib import Path
 
-import numpy
 import yaml
 from powerconf.units import Q_
 from powerconf.utils import get_id
+from retina_therm import utils
 
 logging.basicConfig(filename="powerconf_extensions.log", level=logging.INFO)
 
@@ -20,7 +20,8 @@ def get_scale(filename):
 
 
 def get_peak_temperature(filename):
-    data = numpy.loadtxt(filename)
+    filepath = Path(filename)
+    data = utils.read_Tvst_from_file(filepath, filepath.suffix[1:])
     v = max(data[:, 1])
 
     return Q_(v, "degC")
@@ -89,3 +89,36 @@ tp_min = (1.86 / mua**2 / alpha).to("s")
 
 
 print("tp_min:", tp_min)
+
+
+# Accuracy of the double precision erfcx kernel used by
+# LargeBeamAbsorbingLayerGreensFunction (use_multi_precision = False) compared
+# to the mpmath implementation. The double precision exp(alpha*tp*mua^2) term
+# overflows for tp > tp_max computed above, the erfcx kernel does not.
+from retina_therm.greens_functions import LargeBeamAbsorbingLayerGreensFunction
+
+mpmath.mp.dps = 1500
+for mua in ["53 1/cm", "310 1/cm", "720 1/cm", "5000 1/cm"]:
+    layer_config = {
+        "mua": mua,
+        "k": str(k),
+        "rho": str(rho),
+        "c": str(c),
+        "E0": "1 W/cm^2",
+        "d": "10 um",
+        "z0": "0 um",
+        "use_approximations": False,
+    }
+    G_float = LargeBeamAbsorbingLayerGreensFunction(layer_config)
+    G_mp = LargeBeamAbsorbingLayerGreensFunction(
+        dict(layer_config, use_multi_precision=True)
+    )
+    max_error = 0
+    for z in numpy.linspace(-0.01, 0.01, 21):
+        for t in numpy.logspace(-10, 2, 40):
+            exact = float(G_mp(z, 0, t))
+            if exact < 1e-250:
+                continue
+            max_error = max(max_error, percent_error(G_float(z, 0, t), exact))
+
+    print("mua:", mua, "max relative error:", max_error)
@@ -1,37 +1,21 @@
-import copy
-import importlib
+import importlib.metadata
 import itertools
+import math
 import multiprocessing
+import os
 import pprint
-import shutil
-import subprocess
 import sys
-from pathlib import Path, PosixPath
-from typing import Annotated, List, Literal, Optional, Union
+from multiprocessing import connection
+from pathlib import Path
+from typing import Annotated, List
 
-import numpy
-import powerconf
 import rich
 import rich.console
-import scipy
 import typer
-import yaml
-from fspathtree import fspathtree
-from mpmath import mp
-from pydantic import BeforeValidator, ValidationError
-from tqdm import tqdm
-
-import retina_therm
-from retina_therm import (
-    config,
-    greens_functions,
-    multi_pulse_builder,
-    signals,
-    units,
-    utils,
-)
-
-from . import parallel_jobs, utils
+
+# the numerical libraries, configuration models, and job processes are imported by the
+# commands that use them (most are in retina_therm.jobs) so that commands like `status`
+# and `--version` start quickly.
 
 __version__ = importlib.metadata.version("retina-therm")
 
@@ -40,11 +24,51 @@ app = typer.Typer()
 console = rich.console.Console()
 
 
-def path_representer(dumper, data):
-    return dumper.represent_scalar("tag:yaml.org,2002:str", str(data))
+def __getattr__(name):
+    # the models, processes, and helper functions that used to be defined here
+    # are still available from this module.
+    if name.startswith("__"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from . import jobs
+
+    try:
+        return getattr(jobs, name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_result_cache(cache_dir, cache_max_size):
+    "Return the ResultCache to use, or None if no cache directory was given."
+    if cache_dir is None:
+        return None
+    from .result_cache import ResultCache
+
+    return ResultCache(cache_dir, int(cache_max_size * 2**20))
+
+
+def get_pool_authkey():
+    """
+    Return the key that `serve` and its clients use to authenticate each other.
+
+    The key is taken from the RETINA_THERM_POOL_AUTHKEY environment variable, or from a key
+    file in the user's config directory that only they can read (it is created the first time).
+    """
+    key = os.environ.get("RETINA_THERM_POOL_AUTHKEY", None)
+    if key is not None:
+        return key.encode("utf-8")
 
+    config_dir = Path(
+        os.environ.get("XDG_CONFIG_HOME", Path.home() / ".config")
+    ) / "retina-therm"
+    config_dir.mkdir(parents=True, exist_ok=True)
+    key_file = config_dir / "pool-authkey"
+    if not key_file.exists():
+        import secrets
 
-yaml.add_representer(PosixPath, path_representer)
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    return key_file.read_text().strip().encode("utf-8")
 
 
 def version_callback(value: bool):
@@ -53,12 +77,6 @@ def version_callback(value: bool):
         raise typer.Exit()
 
 
-def q2str(p, v):
-    if hasattr(v, "magnitude"):
-        return str(v)
-    return v
-
-
 @app.callback()
 def main(
     ctx: typer.Context,
@@ -69,76 +87,6 @@ def main(
     pass
 
 
-def compute_evaluation_times(config):
-    # if times are given in the config, just them
-    if "ts" in config:
-        t = numpy.array([units.Q_(time).to("s").magnitude for time in config["ts"]])
-    else:
-        # we want to support specifying the times as a single range,
-        # i.e. "from tmin to tmax by steps of dt"
-        # or multiple ranges
-        # i.e. "from tmin_1 to tmax_1 by steps of dt_1 AND from tmin_2 to tmax_2 by steps of dt_2"
-        # this is usefull for sampling the start of a long exposure at higher resolution than the end.
-        time_configs = []
-        if type(config.tree) == dict:
-            time_configs.append(config)
-        else:
-            for c in config:
-                time_configs.append(c)
-
-        time_arrays = []
-        for i, time_config in enumerate(time_configs):
-            dt = units.Q_(time_config.get("resolution", "1 us"))
-            # if tmin is given, use it
-            # if it is not given and this is the first config, use 0 s
-            # if it is not given and this is not the first config, use the last config's tmax plus our dt
-            #     if the previous config does not have a tmax, use 10 s...
-            tmin = units.Q_(
-                time_config.get(
-                    "min",
-                    (
-                        units.Q_(time_configs[i - 1].get("max", "10 second")) + dt
-                        if i > 0
-                        else "0 second"
-                    ),
-                )
-            )
-            tmax = units.Q_(time_config.get("max", "10 second"))
-
-            dt = dt.to("s").magnitude
-            tmin = tmin.to("s").magnitude
-            tmax = tmax.to("s").magnitude
-
-            # adding dt/2 here so that tmax will be included in the array
-            t = numpy.arange(tmin, tmax + dt / 2, dt)
-            time_arrays.append(t)
-        t = numpy.concatenate(time_arrays)
-
-    return t
-
-
-temperature_rise_integration_methods = ["quad", "trap"]
-
-
-def compute_tissue_properties(config):
-    """
-    Loops through all tissue property config keys and checks if parameter
-    was given as a model instead of a specific value. If so, we call the model
-    and replace the parameter value with the result of model.
-    """
-    for layer in config.get("layers", []):
-        if "{wavelength}" in layer["mua"]:
-            if "laser/wavelength" not in config:
-                raise RuntimeError(
-                    "Config must include `laser/wavelength` to compute absorption coefficient."
-                )
-            mua = eval(
-                layer["mua"].format(wavelength="'" + config["/laser/wavelength"] + "'")
-            )
-            layer["mua"] = str(mua)  # config validators expect strings for quantities
-    return config
-
-
 #  _____                                   _                  ____  _
 # |_   _|__ _ __ ___  _ __   ___ _ __ __ _| |_ _   _ _ __ ___|  _ \(_)___  ___
 #   | |/ _ \ '_ ` _ \| '_ \ / _ \ '__/ _` | __| | | | '__/ _ \ |_) | / __|/ _ \
@@ -147,169 +95,6 @@ def compute_tissue_properties(config):
 #                    |_|
 
 
-class SensorConfig(config.BaseModel):
-    z: config.QuantityWithUnit("cm")
-    r: config.QuantityWithUnit("cm")
-
-
-class TemperatureRiseConfig(config.BaseModel):
-    output_file: Path
-    output_config_file: Path
-    output_file_format: Optional[Literal["txt"] | Literal["hdf5"]] = None
-    sensor: SensorConfig
-    method: Optional[Literal["trap"] | Literal["quad"]] = "quad"
-
-    class TimeConfig(config.BaseModel):
-        max: config.QuantityWithUnit("s")
-        resolution: config.QuantityWithUnit("s")
-
-    time: Optional[TimeConfig | List[TimeConfig]] = None
-
-
-class TemperatureRiseCmdConfig(config.BaseModel):
-    temperature_rise: TemperatureRiseConfig
-    laser: config.LaserConfig
-    layers: list[config.LayerConfig]
-    thermal: config.ThermalPropertiesConfig
-
-
-class TemperatureRiseGreensFunctionProcess(parallel_jobs.JobProcessorBase):
-    """
-    For running green's functino calculations in a separate process.
-
-    This will return time-temperature pairs, it will _not_ write to files.
-    """
-
-    def __init__(self):
-        super().__init__()
-
-    def run_job(self, config):
-        # Greens function classes expect simulation config params to be in /simulation
-        config["/simulation"] = config["/temperature_rise"].tree
-        G = greens_functions.CWRetinaLaserExposure(config.tree)
-        z = config["/temperature_rise/sensor/z"]
-        z = units.Q_(z).to("cm").magnitude
-        r = config["/temperature_rise/sensor/r"]
-        r = units.Q_(r).to("cm").magnitude
-
-        # times are already computed by the parent process, we just need to grab them.
-        t = config["/temperature_rise/time/ts"]
-        self.status.emit("Computing temperature rise")
-        G.progress.connect(lambda i, n: self.progress.emit(i, n))
-        T = G.temperature_rise(z, r, t, method=config["/temperature_rise/method"])
-        self.status.emit("done")
-
-        return list(zip(t, T))
-
-
-class TemperatureRiseSingleConfigProcess(parallel_jobs.JobProcessorBase):
-    """
-    For running a full simulation in a separate process.
-
-    This uses the TemperatureRiseGreensFunctionProcess class to do the acual
-    calculations, collects the time-temperature pairs and writes them to the
-    output_file given in the configuration. Also writes the output_config_file.
-    """
-
-    def __init__(self, njobs=1):
-        super().__init__()
-        self.njobs = njobs
-        self.controller = None
-
-    def _start(self):  # Runs in CHILD
-        if self.controller is None:
-            self.controller = parallel_jobs.BatchJobController(
-                TemperatureRiseGreensFunctionProcess, njobs=self.njobs
-            )
-            self.controller.start()
-        self.jobs_progress = [[0, 1]] * self.njobs
-        self.total_progress = [0, 1]
-
-        def update_jobs_progress(proc, prog):
-            self.jobs_progress[proc] = prog
-
-        def compute_total_progress():
-            a = 0
-            b = 0
-            for p in self.jobs_progress:
-                a += p[0]
-                b += p[1]
-            return [a, b]
-
-        # self.controller.status.connect(
-        #     lambda proc, msg: parallel_jobs.pprint(">>>>", msg)
-        # )
-        self.controller.progress.connect(
-            lambda proc, prog: update_jobs_progress(proc, prog)
-        )
-        self.controller.progress.connect(
-            lambda *args: self.progress.emit(*compute_total_progress())
-        )
-
-    def _stop(self):  # Runs in CHILD
-        if self.controller is not None:
-            self.controller.stop()
-            self.controller.wait()
-
-    def run_job(self, config):  # Runs in CHILD
-        # check if output files exist
-        output_paths = {}
-        for k in [
-            "output_file",
-            "output_config_file",
-        ]:
-            filename = config["/temperature_rise"][k]
-            if filename is not None:
-                path = Path(filename)
-                output_paths[k + "_path"] = path
-                if path.parent != Path():
-                    path.parent.mkdir(parents=True, exist_ok=True)
-            else:
-                output_paths[k + "_path"] = None
-
-        if config.get("/skip_existing_outputs", False):
-            if all(map(lambda k: output_paths[k].exists(), output_paths)):
-                self.status.emit("Output files already exists. Skipping.")
-                return
-
-        # split the configuration up into multiple configurations over sub-intervals of the time range
-        t = compute_evaluation_times(config["/temperature_rise/time"])
-        t_chunks = numpy.array_split(t, self.njobs)
-        configs = []
-        for chunk in t_chunks:
-            c = copy.deepcopy(config)
-            c["/temperature_rise/time"] = {"ts": chunk}
-            configs.append(c)
-
-        # run the configurations, blocking
-        results = self.controller.run_jobs(configs)
-
-        # results will be returned in a list of lists
-        # each process returns results into corresponding index of top-level list.
-        # each element is a list that contains all results returned by the process,
-        # one item for each time the process ran a job.
-        data = list(itertools.chain(*results))
-        if len(t) != len(data):  # sanity check...
-            raise RuntimeError(
-                f"Something went wrong. The number of computed temperature returned by subprocesses ({len(data)}) does not match the number of time points ({len(t)})"
-            )
-        T = numpy.array(list(map(lambda item: item[1], data)))
-
-        self.status.emit("Writing output files...")
-
-        if output_paths["output_config_file_path"] is not None:
-            output_paths["output_config_file_path"].write_text(yaml.dump(config.tree))
-
-        fmt = config["/temperature_rise/output_file_format"]
-        if fmt is None:
-            fmt = output_paths["output_file_path"].suffix[1:]
-        if fmt is None:
-            fmt = "txt"
-
-        utils.write_to_file(output_paths["output_file_path"], numpy.c_[t, T], fmt)
-        self.status.emit("done")
-
-
 @app.command()
 def temperature_rise(
     config_file: Path,
@@ -329,7 +114,53 @@ def temperature_rise(
     ] = False,
     verbose: Annotated[bool, typer.Option(help="Print extra information")] = False,
     quiet: Annotated[bool, typer.Option(help="Don't print to console.")] = False,
+    cache_dir: Annotated[
+        Path,
+        typer.Option(
+            help="Directory of a result cache. Results that were already computed from the same inputs are taken from the cache instead of being computed again.",
+            envvar="RETINA_THERM_CACHE_DIR",
+        ),
+    ] = None,
+    cache_max_size: Annotated[
+        float,
+        typer.Option(
+            help="Maximum size of the result cache in MB. The least recently used results are removed when it is full.",
+            envvar="RETINA_THERM_CACHE_MAX_SIZE",
+        ),
+    ] = 1024,
+    pool: Annotated[
+        Path,
+        typer.Option(
+            help="Run the simulations on the worker pool of a `retina-therm serve` process listening on this socket."
+        ),
+    ] = None,
+    extend: Annotated[
+        bool,
+        typer.Option(
+            help="Extend existing output files to the configured time range by only computing the times after the last time in the file. The configuration must be the same as the one the file was computed with, except for the time range."
+        ),
+    ] = False,
+    batch_file: Annotated[
+        Path,
+        typer.Option(
+            help="Write the results of all configurations to this HDF5 file, in a group named by the configuration id, instead of their output files."
+        ),
+    ] = None,
 ):
+    import powerconf
+    from fspathtree import fspathtree
+    from mpmath import mp
+    from pydantic import ValidationError
+
+    from . import parallel_jobs
+    from .jobs import (
+        TemperatureRiseCmdConfig,
+        TemperatureRiseGreensFunctionProcess,
+        q2str,
+        run_temperature_rise_configs,
+        temperature_rise_integration_methods,
+    )
+
     if list_methods:
         print("Available inegration methods:")
         for m in temperature_rise_integration_methods:
@@ -397,183 +228,184 @@ def temperature_rise(
         for c in configs:
             c["/skip_existing_outputs"] = True
 
-    # determine how to split up work.
-    # we have a TemperatureRiseSingleConfigProcess that runs a single simulation.
-    # internally, it will split the work up into chunks and use subprocesses to do the computation.
-    num_jobs = multiprocessing.cpu_count()
-    num_main_jobs = len(configs)
-    num_sub_jobs = int(num_jobs / num_main_jobs)
-
-    if njobs is not None:
-        if ":" in njobs:
-            num_main_jobs, num_sub_jobs = list(map(int, njobs.split(":")))
-        else:
-            num_jobs = int(njobs)
-            num_main_jobs = len(configs)
-            num_sub_jobs = int(num_jobs / num_main_jobs)
-
-    controller = parallel_jobs.BatchJobController(
-        TemperatureRiseSingleConfigProcess,
-        njobs=num_main_jobs,
-        args={"njobs": num_sub_jobs},
-    )
-    controller.start()
-
-    progress_display = (
-        parallel_jobs.SilentProgressDisplay()
-        if quiet
-        else parallel_jobs.ProgressDisplay()
-    )
-    progress_display.setup_new_bar("Total")
-    progress_display.set_total("Total", len(configs))
-    for i in range(num_main_jobs):
-        progress_display.setup_new_bar(f"Job-{i:03}")
-    for i in range(num_main_jobs):
-        progress_display.set_progress(f"Job-{i:03}", 0, 1)
+    if pool is not None:
+        # send the configs to a `retina-therm serve` process
+        try:
+            with connection.Client(
+                str(pool), family="AF_UNIX", authkey=get_pool_authkey()
+            ) as conn:
+                conn.send(
+                    {
+                        "command": "temperature-rise",
+                        "cwd": str(Path.cwd()),
+                        "configs": [c.tree for c in configs],
+                        "cache": get_result_cache(cache_dir, cache_max_size),
+                        "extend": extend,
+                        "batch_file": batch_file,
+                    }
+                )
+                reply = conn.recv()
+        except (
+            FileNotFoundError,
+            ConnectionRefusedError,
+            connection.AuthenticationError,
+        ) as e:
+            econsole.print(f"[red]Could not connect to worker pool at {pool}: {e}[/red]")
+            raise typer.Exit(1)
+        num_failed = reply["failed"]
+        if reply.get("error", None) is not None:
+            econsole.print(f"[red]The worker pool reported an error: {reply['error']}[/red]")
+            num_failed = max(num_failed, 1)
+    else:
+        num_jobs = multiprocessing.cpu_count()
+        if njobs is not None:
+            if ":" in njobs:
+                # legacy format for giving the number of main jobs and sub jobs
+                num_jobs = math.prod(map(int, njobs.split(":")))
+            else:
+                num_jobs = int(njobs)
 
-    controller.progress.connect(
-        lambda proc, prog: progress_display.set_progress(f"Job-{proc:03}", *prog)
-    )
-    controller.status.connect(
-        lambda proc, msg: (
-            progress_display.update_progress("Total") if msg == "done" else None
+        controller = parallel_jobs.BatchJobController(
+            TemperatureRiseGreensFunctionProcess, njobs=num_jobs
         )
-    )
+        controller.start()
+        try:
+            num_failed = run_temperature_rise_configs(
+                controller,
+                configs,
+                quiet,
+                cache=get_result_cache(cache_dir, cache_max_size),
+                extend=extend,
+                batch_file=batch_file,
+            )
+        finally:
+            controller.stop()
+            controller.wait()
 
-    # controller.status.connect(lambda *args: print("STATUS", args))
-    # controller.progress.connect(lambda *args: print("PROGRESS", args))
-    results = controller.run_jobs(configs)
-    controller.stop()
-    controller.wait()
+    if num_failed > 0:
+        econsole.print(f"[red]{num_failed} configuration(s) failed.[/red]")
+        raise typer.Exit(1)
 
     raise typer.Exit(0)
 
 
-#  __  __       _ _   _       _                        _
-# |  \/  |_   _| | |_(_)_ __ | | ___       _ __  _   _| |___  ___
-# | |\/| | | | | | __| | '_ \| |/ _ \_____| '_ \| | | | / __|/ _ \
-# | |  | | |_| | | |_| | |_) | |  __/_____| |_) | |_| | \__ \  __/
-# |_|  |_|\__,_|_|\__|_| .__/|_|\___|     | .__/ \__,_|_|___/\___|
-#                      |_|                |_|
-
-
-class PulseConfig(config.BaseModel):
-    arrival_time: config.QuantityWithUnit("s")
-    duration: config.QuantityWithUnit("s")
-    scale: float
-
-
-class MultiplePulseConfig(config.BaseModel):
-    input_file: Path
-    output_file: Path
-    output_file_format: Optional[Literal["txt"] | Literal["hdf5"]] = None
-    output_config_file: Path
-    pulses: list[PulseConfig]
-
-    class TimeConfig(config.BaseModel):
-        max: Optional[config.QuantityWithUnit("s")] = None
-        resolution: Optional[config.QuantityWithUnit("s")] = None
-
-    time: Optional[TimeConfig] = TimeConfig()
-
-
-class MultiplePulseCmdConfig(config.BaseModel):
-    multiple_pulse: MultiplePulseConfig
-
+@app.command()
+def serve(
+    address: Annotated[
+        Path, typer.Argument(help="Path of the socket to listen on.")
+    ] = Path("retina-therm.sock"),
+    njobs: Annotated[int, typer.Option(help="Number of worker processes.")] = None,
+    dps: Annotated[
+        int,
+        typer.Option(help="The precision to use for calculations when mpmath is used."),
+    ] = 100,
+):
+    """
+    Start a pool of worker processes that `temperature-rise --pool ADDRESS` can run simulations on.
 
-class MultiplePulseProcess(parallel_jobs.JobProcessorBase):
-    def run_job(self, config):
-        # check if output paths exist
-        output_paths = {}
-        for k in ["output_file", "output_config_file"]:
-            filename = config["/multiple_pulse"][k]
-            output_paths[k + "_path"] = Path("/dev/stdout")
-            if filename is not None:
-                path = Path(filename)
-                output_paths[k + "_path"] = path
-                if path.parent != Path():
-                    path.parent.mkdir(parents=True, exist_ok=True)
+    The workers stay alive between runs, so modules only need to be imported once and
+    the exposure objects they have constructed are reused by later runs with the same configuration.
+    Requests are handled one at a time. Stop the server with Ctrl-C or `serve-stop`.
+    """
+    from fspathtree import fspathtree
+    from mpmath import mp
 
-        if config.get("/skip_existing_outputs", False):
-            if all(map(lambda k: output_paths[k].exists(), output_paths)):
-                self.status.emit("Output files already exists. Skipping.")
-                return
+    from . import parallel_jobs
+    from .jobs import (
+        TemperatureRiseGreensFunctionProcess,
+        run_temperature_rise_configs,
+    )
 
-        self.status.emit(
-            "Loading base temperature history for building multiple-pulse history."
-        )
-        input_file = Path(config["/multiple_pulse/input_file"])
-        data = utils.read_from_file(
-            input_file,
-            config.get("/multiple_pulse/input_file_format", input_file.suffix[1:]),
-        )
+    mp.dps = dps
+    iconsole = rich.console.Console(stderr=False)
 
-        self.status.emit("Resampling temeprature history to regularized grid")
-        imax = len(data)
-        tmax = units.Q_(data[-1, 0], "s")
-        # if tmax is given in the config file, we want to trucate
-        # the input data to include the first time >= tmax
-        # this is an optimization reduces the size of the array we
-        # are working.
-        if config["/multiple_pulse/time/max"] is not None:
-            tmax = units.Q_(config["/multiple_pulse/time/max"])
-            if tmax.to("s").magnitude < data[0, 0]:
-                raise RuntimeError(
-                    f"/tmax ({tmax}) cannot be less than first time in history ({data[0, 0]})."
-                )
-            if tmax.to("s").magnitude < data[-1, 0]:
-                while imax > 0 and data[imax - 1, 0] > tmax.to("s").magnitude:
-                    imax -= 1
-        if imax < len(data):
-            data = data[:imax, :]
-
-        t = data[:, 0]
-        T = data[:, 1]
-
-        # regularize the time samples.
-        # need times to be uniformly spaced apart.
-        resolution = t[1] - t[0]
-        if config["/multiple_pulse/time/resolution"] is not None:
-            resolution = (
-                units.Q_(config["/multiple_pulse/time/resolution"]).to("s").magnitude
+    controller = parallel_jobs.BatchJobController(
+        TemperatureRiseGreensFunctionProcess, njobs=njobs or multiprocessing.cpu_count()
+    )
+    controller.start()
+    try:
+        # only the owner may connect to the socket, and clients must know the key
+        umask = os.umask(0o177)
+        try:
+            listener = connection.Listener(
+                str(address), family="AF_UNIX", authkey=get_pool_authkey()
             )
+        finally:
+            os.umask(umask)
+        with listener:
+            os.chmod(address, 0o600)
+            iconsole.print(f"Listening on {address}")
+            running = True
+            while running:
+                try:
+                    conn = listener.accept()
+                except (connection.AuthenticationError, OSError, EOFError):
+                    continue
+                with conn:
+                    try:
+                        request = conn.recv()
+                    except EOFError:
+                        continue
+                    configs = []
+                    try:
+                        if not isinstance(request, dict):
+                            raise RuntimeError(f"Invalid request: {request!r}")
+                        configs = request.get("configs", [])
+                        command = request.get("command", None)
+                        if command == "shutdown":
+                            running = False
+                            reply = {"failed": 0}
+                        elif command == "temperature-rise":
+                            # output paths are relative to the client's directory
+                            cwd = Path.cwd()
+                            os.chdir(request["cwd"])
+                            try:
+                                num_failed = run_temperature_rise_configs(
+                                    controller,
+                                    list(map(fspathtree, configs)),
+                                    quiet=True,
+                                    cache=request.get("cache", None),
+                                    extend=request.get("extend", False),
+                                    batch_file=request.get("batch_file", None),
+                                )
+                            finally:
+                                os.chdir(cwd)
+                            reply = {"failed": num_failed}
+                        else:
+                            raise RuntimeError(f"Unknown command '{command}'")
+                    except Exception as e:
+                        reply = {"failed": max(len(configs), 1), "error": str(e)}
+                    try:
+                        conn.send(reply)
+                    except OSError:
+                        pass
+    finally:
+        controller.stop()
+        controller.wait()
 
-        if not multi_pulse_builder.is_resolution(t, resolution):
-            tp = multi_pulse_builder.regularize_grid(t, resolution)
-            Tp = multi_pulse_builder.interpolate_temperature_history(t, T, tp)
-            t = tp
-            T = Tp
-            data = numpy.zeros([len(tp), 2])
-            data[:, 0] = t
-
-        builder = multi_pulse_builder.MultiPulseBuilder()
-        builder.progress.connect(lambda i, n: self.progress.emit(i, n))
 
-        builder.set_temperature_history(t, T)
-
-        for pulse in config["/multiple_pulse/pulses"]:
-            t1 = units.Q_(pulse["arrival_time"]).to("s")
-            t2 = t1 + units.Q_(pulse["duration"]).to("s")
-            scale = pulse["scale"]
-            builder.add_contribution(t1.magnitude, scale)
-            builder.add_contribution(t2.magnitude, -scale)
-
-        self.status.emit("Building temperature history")
-        Tmp = builder.build()
-
-        self.status.emit("Writing temperature history")
-
-        data[:, 1] = Tmp
+@app.command()
+def serve_stop(
+    address: Annotated[
+        Path, typer.Argument(help="Path of the socket the server is listening on.")
+    ] = Path("retina-therm.sock"),
+):
+    """
+    Stop a `retina-therm serve` process.
+    """
+    with connection.Client(
+        str(address), family="AF_UNIX", authkey=get_pool_authkey()
+    ) as conn:
+        conn.send({"command": "shutdown"})
+        conn.recv()
 
-        output_paths["output_config_file_path"].write_text(yaml.dump(config.tree))
-        fmt = config["/multiple_pulse/output_file_format"]
-        if fmt is None:
-            fmt = output_paths["output_file_path"].suffix[1:]
-        if fmt is None:
-            fmt = "txt"
 
-        utils.write_to_file(output_paths["output_file_path"], data, fmt)
-        self.status.emit("done")
+#  __  __       _ _   _       _                        _
+# |  \/  |_   _| | |_(_)_ __ | | ___       _ __  _   _| |___  ___
+# | |\/| | | | | | __| | '_ \| |/ _ \_____| '_ \| | | | / __|/ _ \
+# | |  | | |_| | | |_| | |_) | |  __/_____| |_) | |_| | \__ \  __/
+# |_|  |_|\__,_|_|\__|_| .__/|_|\___|     | .__/ \__,_|_|___/\___|
+#                      |_|                |_|
 
 
 @app.command()
@@ -588,7 +420,28 @@ def multiple_pulse(
     ] = False,
     verbose: Annotated[bool, typer.Option(help="Print extra information")] = False,
     quiet: Annotated[bool, typer.Option(help="Don't print to console.")] = False,
+    cache_dir: Annotated[
+        Path,
+        typer.Option(
+            help="Directory of a result cache. Results that were already computed from the same inputs are taken from the cache instead of being computed again.",
+            envvar="RETINA_THERM_CACHE_DIR",
+        ),
+    ] = None,
+    cache_max_size: Annotated[
+        float,
+        typer.Option(
+            help="Maximum size of the result cache in MB. The least recently used results are removed when it is full.",
+            envvar="RETINA_THERM_CACHE_MAX_SIZE",
+        ),
+    ] = 1024,
 ):
+    import powerconf
+    from fspathtree import fspathtree
+    from pydantic import ValidationError
+
+    from . import parallel_jobs
+    from .jobs import MultiplePulseCmdConfig, MultiplePulseProcess, q2str
+
     iconsole = rich.console.Console(stderr=False, quiet=quiet)
     vconsole = rich.console.Console(
         stderr=False, quiet=True if quiet or not verbose else False
@@ -639,7 +492,11 @@ def multiple_pulse(
         njobs = min(multiprocessing.cpu_count(), len(configs))
 
     iconsole.print("Setting up parallel job processor and running configs")
-    controller = parallel_jobs.BatchJobController(MultiplePulseProcess, njobs=njobs)
+    controller = parallel_jobs.BatchJobController(
+        MultiplePulseProcess,
+        njobs=njobs,
+        args={"cache": get_result_cache(cache_dir, cache_max_size)},
+    )
     controller.start()
 
     progress_display = (
@@ -678,24 +535,10 @@ def multiple_pulse(
     raise typer.Exit(0)
 
 
-class DamageConfig(config.BaseModel):
-    input_file: Path
-    output_config_file: Path
-    output_file: Path
-
-    A: config.QuantityWithUnit("1/s")
-    Ea: config.QuantityWithUnit("J/mol")
-    T0: config.QuantityWithUnit("K")
-
-
-class DamageCmdConfig(config.BaseModel):
-    damage: DamageConfig
-
-
 @app.command()
 def damage(
     config_file: Path,
-    njobs: Annotated[str, typer.Option(help="Number of parallel jobs to run.")] = None,
+    njobs: Annotated[int, typer.Option(help="Number of parallel jobs to run.")] = None,
     skip_existing_outputs: Annotated[
         bool,
         typer.Option(
@@ -710,20 +553,33 @@ def damage(
     ] = False,
     verbose: Annotated[bool, typer.Option(help="Print extra information")] = False,
     quiet: Annotated[bool, typer.Option(help="Don't print to console.")] = False,
+    cache_dir: Annotated[
+        Path,
+        typer.Option(
+            help="Directory of a result cache. Results that were already computed from the same inputs are taken from the cache instead of being computed again.",
+            envvar="RETINA_THERM_CACHE_DIR",
+        ),
+    ] = None,
+    cache_max_size: Annotated[
+        float,
+        typer.Option(
+            help="Maximum size of the result cache in MB. The least recently used results are removed when it is full.",
+            envvar="RETINA_THERM_CACHE_MAX_SIZE",
+        ),
+    ] = 1024,
 ):
+    import powerconf
+    from fspathtree import fspathtree
+    from pydantic import ValidationError
+
+    from . import parallel_jobs
+    from .jobs import DamageCmdConfig, DamageProcess, q2str
+
     iconsole = rich.console.Console(stderr=False, quiet=quiet)
     vconsole = rich.console.Console(
         stderr=False, quiet=True if quiet or not verbose else False
     )
     econsole = rich.console.Console(stderr=True)
-    arrhenius_cli_exec = shutil.which("Arrhenius-cli")
-    if arrhenius_cli_exec is None:
-        econsole.print("[red]`Arrhenius-cli` not found.[/red]")
-        econsole.print(
-            "`retina-therm damage` uses `Arrhenius-cli` to compute damage thresholds. Please install it."
-        )
-        econsole.print("see https://github.com/CD3/libArrhenius")
-        raise typer.Exit(1)
 
     try:
         # we need to convert all quantities to strings because they will ahve been created
@@ -756,63 +612,49 @@ def damage(
             econsole.print("\n\n")
             raise typer.Exit(1)
 
-    cmds = []
-    for config in configs:
-        output_file = config["/damage/output_file"]
-        if skip_existing_outputs and output_file.exists():
-            console.print(f"Output file `{output_file}` already exists. Skipping.")
-            continue
-        output_config_file = config["/damage/output_config_file"]
-
-        Tvst_file = config["/damage/input_file"]
-        A = units.Q_(config["/damage/A"]).magnitude
-        Ea = units.Q_(config["/damage/Ea"]).magnitude
-        T0 = units.Q_(config["/damage/T0"]).magnitude
-        cmd = f"Arrhenius-cli calc-threshold '{Tvst_file}' --A {A} --Ea {Ea} --T0 {T0}"
-        if write_threshold_profiles:
-            cmd += " --write-threshold-profiles"
-        iconsole.print(f"Running `{cmd}`")
-        output = subprocess.check_output(cmd, shell=True).decode()
-        scale = output.split("\n")[1].split("|")[-1].strip()
-
-        output_file.write_text(f"scale: {scale}\n")
-        output_config_file.write_text(yaml.dump(config.tree))
-
-    print()
-
-
-class TruncateTemperatureProfileProcess(parallel_jobs.JobProcessorBase):
-    def run_job(self, config):
-        file = config["file"]
-        threshold = config["threshold"]
-
-        self.status.emit(f"Truncating temperature_history in {file}.")
-
-        self.progress.emit(0, 4)
-        data = numpy.loadtxt(file)
-        data = utils.read_from_file(
-            file, config.get("file_format", Path(file).suffix[1:])
+    if skip_existing_outputs:
+        for c in configs:
+            c["/skip_existing_outputs"] = True
+
+    if njobs is None:
+        njobs = min(multiprocessing.cpu_count(), len(configs))
+
+    controller = parallel_jobs.BatchJobController(
+        DamageProcess,
+        njobs=njobs,
+        args={
+            "cache": get_result_cache(cache_dir, cache_max_size),
+            "write_threshold_profiles": write_threshold_profiles,
+        },
+    )
+    controller.status.connect(
+        lambda proc, msg: vconsole.print(msg) if msg != "done" else None
+    )
+    controller.start()
+
+    progress_display = (
+        parallel_jobs.SilentProgressDisplay()
+        if quiet
+        else parallel_jobs.ProgressDisplay()
+    )
+    progress_display.setup_new_bar("Total")
+    progress_display.set_total("Total", len(configs))
+    controller.status.connect(
+        lambda proc, msg: (
+            progress_display.update_progress("Total") if msg == "done" else None
         )
-        self.progress.emit(1, 4)
-        threshold = units.Q_(threshold)
-        if threshold.check(""):
-            Tmax = max(data[:, 1])
-            Tthreshold = threshold.magnitude * Tmax
-        elif threshold.check("K"):
-            Tthreshold = threshold.magnitude
-
-        if data[-1, 1] > Tthreshold:
-            self.status.emit(f"{file} already trucated...skipping.")
-            self.progress.emit(4, 4)
-            return
-
-        self.progress(2, 4)
-        idx = numpy.argmax(numpy.flip(data[:, 1]) > Tthreshold)
-        self.progress(3, 4)
-        self.status.emit(f"Saving trucated history back to {file}.")
-        numpy.savetxt(file, data[:-idx, :])
-        self.progress.emit(4, 4)
-        self.status.emit(f"done")
+    )
+
+    try:
+        results = controller.run_jobs(configs)
+    finally:
+        controller.stop()
+        controller.wait()
+
+    num_failed = results.count(None)
+    if num_failed > 0:
+        econsole.print(f"[red]{num_failed} configuration(s) failed.[/red]")
+        raise typer.Exit(1)
 
 
 @app.command()
@@ -825,18 +667,28 @@ def truncate_temperature_history_file(
             help="Threshold temperature for truncating. Can be a temperature or a fraction. If a fraction is given, the threshold temperature will be computed as threshold*Tmax."
         ),
     ] = "0.001",
+    file_format: Annotated[
+        str,
+        typer.Option(
+            "--format",
+            help="Format of the temperature history files (txt, hdf5, or rt). Determined from the file extension by default.",
+        ),
+    ] = None,
 ):
     """
     Truncate a temperature history file, removing all point in the end of the history where the temperature is below threshold*Tmax.
     This is used to decrease the size of the temperature history so that computing damage thresholds is faster.
     """
+    from . import parallel_jobs, units
+    from .jobs import TruncateTemperatureProfileProcess
+
     threshold = units.Q_(threshold)
     if not threshold.check("") and not threshold.check("K"):
         raise typer.Exit(f"threshold must be a temperature or dimensionless")
 
     configs = []
     for file in temperature_history_file:
-        configs.append({"file": file, "threshold": threshold})
+        configs.append({"file": file, "threshold": threshold, "file_format": file_format})
 
     if njobs is None:
         njobs = multiprocessing.cpu_count()
@@ -852,6 +704,143 @@ def truncate_temperature_history_file(
     controller.wait()
 
 
+#  ____  _            _ _
+# |  _ \(_)_ __   ___| (_)_ __   ___
+# | |_) | | '_ \ / _ \ | | '_ \ / _ \
+# |  __/| | |_) |  __/ | | | | |  __/
+# |_|   |_| .__/ \___|_|_|_| |_|\___|
+#         |_|
+
+
+@app.command()
+def pipeline(
+    config_file: Path,
+    njobs: Annotated[int, typer.Option(help="Number of parallel jobs to run.")] = None,
+    dps: Annotated[
+        int,
+        typer.Option(help="The precision to use for calculations when mpmath is used."),
+    ] = 100,
+    write: Annotated[
+        List[str],
+        typer.Option(
+            help="Stage (temperature_rise, multiple_pulse, or damage) to write the output files for. Can be given more than once."
+        ),
+    ] = ["damage"],
+    skip_existing_outputs: Annotated[
+        bool,
+        typer.Option(
+            help="Don't run stages if the output files that would be written by them (and the stages after them) already exist."
+        ),
+    ] = False,
+    verbose: Annotated[bool, typer.Option(help="Print extra information")] = False,
+    quiet: Annotated[bool, typer.Option(help="Don't print to console.")] = False,
+    cache_dir: Annotated[
+        Path,
+        typer.Option(
+            help="Directory of a result cache. Results that were already computed from the same inputs are taken from the cache instead of being computed again.",
+            envvar="RETINA_THERM_CACHE_DIR",
+        ),
+    ] = None,
+    cache_max_size: Annotated[
+        float,
+        typer.Option(
+            help="Maximum size of the result cache in MB. The least recently used results are removed when it is full.",
+            envvar="RETINA_THERM_CACHE_MAX_SIZE",
+        ),
+    ] = 1024,
+):
+    """
+    Run the temperature-rise, multiple-pulse, and damage stages in CONFIG_FILE as one pipeline.
+
+    A stage depends on the stage (in any configuration) that writes its input file. Each stage
+    is started as soon as the stage it depends on is done, the temperature histories are
+    passed between stages in memory, and only the outputs of the stages given with --write are
+    written. Stages that are the same for several configurations (i.e. a temperature rise used
+    by several multiple-pulse histories) are only run once.
+    """
+    import powerconf
+    from mpmath import mp
+    from pydantic import ValidationError
+
+    from . import parallel_jobs
+    from .jobs import (
+        PipelineProcess,
+        build_pipeline_graph,
+        pipeline_stages,
+        q2str,
+        run_pipelines,
+    )
+
+    for stage in write:
+        if stage not in pipeline_stages:
+            raise typer.BadParameter(
+                f"Unknown stage '{stage}'. Stages are: {', '.join(pipeline_stages)}"
+            )
+
+    mp.dps = dps
+
+    iconsole = rich.console.Console(stderr=False, quiet=quiet)
+    vconsole = rich.console.Console(
+        stderr=False, quiet=True if quiet or not verbose else False
+    )
+    econsole = rich.console.Console(stderr=True)
+
+    try:
+        # we need to convert all quantities to strings because they will ahve been created
+        # with a different unit registry than the models are using.
+        configs = powerconf.yaml.powerload(
+            config_file, njobs=multiprocessing.cpu_count(), transform=q2str
+        )
+    except KeyError as e:
+        econsole.print(
+            "[red]A configuration parameter references another non-existent parameter.[/red]"
+        )
+
+        econsole.print("\n\n[red]" + str(e) + "[/red]\n\n")
+        raise typer.Exit(1)
+
+    # validate configs and find the stages that depend on each other
+    try:
+        nodes = build_pipeline_graph(configs, write)
+    except ValidationError as e:
+        econsole.print("[red]There was an error reading the configuration file.[/red]")
+        econsole.print("\n\nPydantic Error Message:")
+        econsole.print(e)
+        econsole.print("\n\n")
+        raise typer.Exit(1)
+    except RuntimeError as e:
+        econsole.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+    vconsole.print(f"Running {len(configs)} configuration(s) as {len(nodes)} stage(s).")
+
+    if njobs is None:
+        njobs = multiprocessing.cpu_count()
+
+    controller = parallel_jobs.BatchJobController(PipelineProcess, njobs=njobs)
+    controller.status.connect(
+        lambda proc, msg: vconsole.print(msg) if msg != "done" else None
+    )
+    controller.start()
+    try:
+        num_failed = run_pipelines(
+            controller,
+            nodes,
+            write,
+            quiet,
+            skip_existing_outputs,
+            cache=get_result_cache(cache_dir, cache_max_size),
+        )
+    finally:
+        controller.stop()
+        controller.wait()
+
+    if num_failed > 0:
+        econsole.print(f"[red]{num_failed} stage(s) failed.[/red]")
+        raise typer.Exit(1)
+
+    raise typer.Exit(0)
+
+
 # _            _                           _     _
 # | |_ ___   __| | ___ _   _ __   ___  _ __| |_  | |_ ___    _ __   _____      __
 # | __/ _ \ / _` |/ _ (_) | '_ \ / _ \| '__| __| | __/ _ \  | '_ \ / _ \ \ /\ / /
@@ -1173,6 +1162,8 @@ def truncate_temperature_history_file(
 def status(
     config_file: Path,
 ):
+    import powerconf
+
     iconsole = rich.console.Console(stderr=False)
     econsole = rich.console.Console(stderr=True)
 
@@ -1226,6 +1217,8 @@ def report(
         str, typer.Argument(help="Report format. Currently only 'txt' is supported.")
     ] = "txt",
 ):
+    import powerconf
+
     iconsole = rich.console.Console(stderr=False)
     econsole = rich.console.Console(stderr=True)
     iconsole.print("Loading configuration(s)")
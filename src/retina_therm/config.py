@@ -81,10 +81,19 @@ class CWLaserConfig(LaserConfig):
     duration: QuantityWithUnit("s") = Field(default="1 year", validate_default=True)
 
 
+class MultiplePulseContribution(BaseModel):
+    arrival_time: QuantityWithUnit("s")
+    scale: float
+
+
 class PulsedLaserConfig(CWLaserConfig):
     pulse_duration: QuantityWithUnit("s")
     pulse_period: QuantityWithUnit("s") = Field(default="1 year", validate_default=True)
 
+    # pulses with arbitrary arrival times and scales. if given, these
+    # replace the regular train given by start, pulse_period and duration.
+    contributions: List[MultiplePulseContribution] = []
+
 
 class ThermalPropertiesConfig(BaseModel):
     rho: QuantityWithUnit("g/cm^3")
@@ -103,10 +112,14 @@ class LargeBeamAbsorbingLayerGreensFunctionConfig(LayerConfig):
     use_approximations: bool = True
 
 
+MarcumQBackend = Literal["numpy", "python", "native", "wasm"]
+
+
 class FlatTopBeamAbsorbingLayerGreensFunctionConfig(
     LargeBeamAbsorbingLayerGreensFunctionConfig
 ):
     one_over_e_radius: QuantityWithUnit("cm")
+    marcum_q_backend: MarcumQBackend | None = None
 
 
 class GaussianBeamAbsorbingLayerGreensFunctionConfig(
@@ -119,6 +132,22 @@ class PrecisionConfig(BaseModel):
     use_multi_precision: bool = False
     use_approximations: bool = True
     with_units: bool = False
+    marcum_q_backend: MarcumQBackend | None = None
+
+
+class TimeKernelCacheConfig(BaseModel):
+    """
+    Settings for tabulating the Green's function on a logarithmic time grid.
+
+    The table is refined until the interpolation error at the grid midpoints
+    is less than rtol times the largest tabulated value.
+    """
+
+    enabled: bool = False
+    tmin: QuantityWithUnit("s") = Field(default="1 ns", validate_default=True)
+    points_per_decade: int = 64
+    rtol: float = 1e-6
+    max_refinements: int = 6
 
 
 class MultiLayerGreensFunctionConfig(BaseModel):
@@ -127,7 +156,7 @@ class MultiLayerGreensFunctionConfig(BaseModel):
     layers: List[LayerConfig]
 
     class SimulationConfig(PrecisionConfig):
-        pass
+        time_kernel_cache: TimeKernelCacheConfig = TimeKernelCacheConfig()
 
     simulation: SimulationConfig
 
@@ -140,11 +169,6 @@ class PulsedRetinaLaserExposureConfig(MultiLayerGreensFunctionConfig):
     laser: PulsedLaserConfig
 
 
-class MultiplePulseContribution(BaseModel):
-    arrival_time: QuantityWithUnit("s")
-    scale: float
-
-
 class MultiplePulseCmdConfig(BaseModel):
     input_file: pathlib.Path
     output_file: pathlib.Path
@@ -0,0 +1,285 @@
+"""
+Arrhenius damage integrals and damage thresholds for temperature histories.
+
+The damage for a temperature history T(t) (in K) is
+
+    Omega = integral A exp(-Ea / (R T(t))) dt
+
+and the damage threshold for a temperature rise history dT(t) on top of a baseline temperature T0
+is the scale s for which the damage of T0 + s dT(t) is one.
+"""
+
+import math
+
+import numpy
+import scipy
+
+from . import utils
+
+# gas constant in J/mol/K
+R = 8.31446261815324
+
+
+def get_trapezoid_weights(t: numpy.array):
+    """
+    Return the weights w so that sum(w*f) is the trapezoid rule integral of f sampled at t.
+    """
+    w = numpy.zeros(len(t))
+    if len(t) < 2:
+        return w
+    dt = numpy.diff(t)
+    w[:-1] += dt / 2
+    w[1:] += dt / 2
+    return w
+
+
+def compute_log_damage_integrand(T: numpy.array, A: float, Ea: float):
+    """
+    Return the log of the damage integrand, log(A) - Ea/(R T), for temperatures T in K.
+
+    Working with the log avoids the overflow/underflow of A and exp(-Ea/(R T)), which are
+    both far outside the range of a double for typical damage parameters.
+    """
+    return math.log(A) - Ea / (R * T)
+
+
+def compute_log_damage(t: numpy.array, T: numpy.array, A: float, Ea: float):
+    """
+    Return the log of the damage integral for the temperature history T(t) (in K).
+    """
+    w = get_trapezoid_weights(t)
+    return scipy.special.logsumexp(compute_log_damage_integrand(T, A, Ea), b=w)
+
+
+def compute_damage(t: numpy.array, T: numpy.array, A: float, Ea: float):
+    """
+    Return the damage integral for the temperature history T(t) (in K).
+    """
+    return math.exp(compute_log_damage(t, T, A, Ea))
+
+
+def compute_damage_history(t: numpy.array, T: numpy.array, A: float, Ea: float):
+    """
+    Return the damage integral from 0 to each time in t for the temperature history T(t) (in K).
+    """
+    return scipy.integrate.cumulative_trapezoid(
+        numpy.exp(compute_log_damage_integrand(T, A, Ea)), t, initial=0
+    )
+
+
+def compute_log_damage_batch(
+    t: numpy.array,
+    dT: numpy.array,
+    A: float,
+    Ea: float,
+    T0: float,
+    scales: numpy.array,
+    rtol: float = 1e-12,
+):
+    """
+    Return the log of the damage integral for the temperature histories T0 + s*dT(t) for each
+    (positive) scale s in `scales`, in a single pass over the history.
+
+    If `rtol` is given, samples whose contribution to the integral is less than `rtol`/N of the
+    largest contribution at both the smallest and largest scale are skipped (see
+    get_significant_samples).
+    """
+    scales = numpy.asarray(scales, dtype=float)
+    log_w = _log_trapezoid_weights(t)
+    if rtol is not None:
+        keep = get_significant_samples(
+            log_w, dT, A, Ea, T0, [scales.min(), scales.max()], rtol
+        )
+        log_w = log_w[keep]
+        dT = dT[keep]
+    return _log_damage_batch(log_w, dT, math.log(A), Ea, T0, scales)[0]
+
+
+def get_significant_samples(log_w, dT, A, Ea, T0, scales, rtol):
+    """
+    Return a mask of the samples in a temperature rise history that contribute more than
+    `rtol`/N of the largest contribution to the damage integral for any of the (positive)
+    `scales`, where `log_w` are the log of the integration weights.
+
+    The gap between the log contribution of a sample and the peak of the history first grows
+    and then shrinks as the scale increases, so it is smallest at one of the ends of a range of
+    scales, and checking the smallest and largest scales covers the scales between them.
+    """
+    log_A = math.log(A)
+    log_cutoff = math.log(rtol) - math.log(max(len(dT), 1))
+    keep = numpy.zeros(len(dT), dtype=bool)
+    for s in scales:
+        terms = log_A - Ea / (R * (T0 + s * dT)) + log_w
+        keep |= terms >= terms.max() + log_cutoff
+    return keep
+
+
+def _log_trapezoid_weights(t):
+    with numpy.errstate(divide="ignore"):
+        return numpy.log(get_trapezoid_weights(t))
+
+
+def _log_damage_batch(log_w, dT, log_A, Ea, T0, scales, block_size=2**16):
+    """
+    Return the log of the damage integral and its derivative with respect to the scale
+    for each scale.
+    """
+    # the log-sum-exp is accumulated a block of samples at a time so the (scale x sample)
+    # arrays stay small.
+    block_size = max(block_size // max(len(scales), 1), 1)
+    m = numpy.full(len(scales), -numpy.inf)
+    S = numpy.zeros(len(scales))
+    G = numpy.zeros(len(scales))
+    for i in range(0, len(dT), block_size):
+        T = T0 + scales[:, None] * dT[None, i : i + block_size]
+        terms = log_A - Ea / (R * T) + log_w[None, i : i + block_size]
+        m_block = terms.max(axis=1)
+        m_new = numpy.maximum(m, m_block)
+        e = numpy.exp(terms - m_new[:, None])
+        # d(terms)/ds
+        g = Ea * dT[None, i : i + block_size] / (R * T**2)
+        shift = numpy.exp(m - m_new)
+        S = S * shift + e.sum(axis=1)
+        G = G * shift + (e * g).sum(axis=1)
+        m = m_new
+    return m + numpy.log(S), G / S
+
+
+def _bound_threshold_scale(log_A, log_weight, Ea, T0, dTmax):
+    """
+    Return the scale at which a single sample with the peak temperature rise and integration
+    weight exp(log_weight) gives a damage of one, or None if there isn't one.
+    """
+    denom = R * (log_A + log_weight)
+    if denom <= 0:
+        return None
+    s = (Ea / denom - T0) / dTmax
+    return s if s > 0 else None
+
+
+def compute_threshold_scale(
+    t: numpy.array,
+    dT: numpy.array,
+    A: float,
+    Ea: float,
+    T0: float,
+    tol: float = 1e-10,
+    rtol: float = 1e-12,
+    max_iter: int = 100,
+):
+    """
+    Return the scale s that gives a damage of one for the temperature history T0 + s*dT(t).
+
+    The damage is bounded above by the damage of holding the peak temperature for the whole
+    history, and below by the damage from the peak sample alone, which gives a bracket for the
+    scale without evaluating the integral. Samples that don't contribute to the integral
+    anywhere in the bracket are dropped (see get_significant_samples), and the scale is found
+    with Newton's method on the log of the damage integral, which gets the value and the
+    derivative from a single pass over the history (falling back to bisection if a step leaves
+    the bracket). It usually takes a handful of passes to find the scale to within `tol`
+    (relative).
+    """
+    if not numpy.any(dT > 0):
+        raise RuntimeError(
+            "Cannot compute a damage threshold for a temperature history that does not rise above the baseline temperature."
+        )
+
+    log_w = _log_trapezoid_weights(t)
+    log_A = math.log(A)
+    imax = numpy.argmax(dT)
+    a = _bound_threshold_scale(
+        log_A, math.log(t[-1] - t[0]) if len(t) > 1 else -numpy.inf, Ea, T0, dT[imax]
+    )
+    b = _bound_threshold_scale(log_A, log_w[imax], Ea, T0, dT[imax])
+    if a is None or b is None:
+        a, b = _bracket_threshold_scale(t, dT, A, Ea, T0)
+
+    keep = get_significant_samples(log_w, dT, A, Ea, T0, [a, b], rtol)
+    log_w = log_w[keep]
+    dT = dT[keep]
+
+    s = (a + b) / 2
+    for i in range(max_iter):
+        f, df = _log_damage_batch(log_w, dT, log_A, Ea, T0, numpy.array([s]))
+        f, df = f[0], df[0]
+        if f == 0:
+            return s
+        if f > 0:
+            b = s
+        else:
+            a = s
+        s_next = s - f / df if df > 0 else (a + b) / 2
+        if not a < s_next < b:
+            s_next = (a + b) / 2
+        if abs(s_next - s) <= tol * s_next:
+            return s_next
+        s = s_next
+
+    raise RuntimeError(
+        f"Damage threshold scale did not converge in {max_iter} iterations."
+    )
+
+
+def _bracket_threshold_scale(t, dT, A, Ea, T0, max_iter=1000):
+    """
+    Return a bracket [a,b] for the damage threshold scale by doubling (or halving) a guess of one.
+    """
+
+    def f(s):
+        return compute_log_damage(t, T0 + s * dT, A, Ea)
+
+    a = b = 1.0
+    fa = fb = f(a)
+    num_iter = 0
+    while fa > 0:
+        if num_iter > max_iter or a == 0:
+            raise RuntimeError(
+                "Could not bracket the damage threshold, the baseline temperature alone causes damage."
+            )
+        num_iter += 1
+        b = a
+        a /= 2
+        fa = f(a)
+    while fb < 0:
+        if num_iter > max_iter or math.isinf(b):
+            raise RuntimeError("Could not bracket the damage threshold.")
+        num_iter += 1
+        a = b
+        b *= 2
+        fb = f(b)
+    return a, b
+
+
+def compute_threshold_scale_bisect(
+    t: numpy.array,
+    dT: numpy.array,
+    A: float,
+    Ea: float,
+    T0: float,
+    tol: float = 1e-10,
+    max_iter: int = 1000,
+):
+    """
+    Return the scale s that gives a damage of one for the temperature history T0 + s*dT(t).
+
+    This brackets the scale by doubling (or halving) a guess of one and finds it with
+    utils.bisect on the log of the damage integral, evaluating the full integral for every
+    trial scale. `tol` is (about) the relative tolerance on the damage at the returned scale.
+    compute_threshold_scale gives the same result much faster. This is kept as a reference.
+    """
+    if not numpy.any(dT > 0):
+        raise RuntimeError(
+            "Cannot compute a damage threshold for a temperature history that does not rise above the baseline temperature."
+        )
+
+    def f(s):
+        return compute_log_damage(t, T0 + s * dT, A, Ea)
+
+    a, b = _bracket_threshold_scale(t, dT, A, Ea, T0, max_iter)
+    if f(a) == 0:
+        return a
+    if f(b) == 0:
+        return b
+
+    a, b = utils.bisect(f, a, b, tol=tol, max_iter=max_iter)
+    return (a + b) / 2
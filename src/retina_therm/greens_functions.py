@@ -4,12 +4,26 @@ import math
 import numpy
 import scipy
 from mpmath import mp
-from tqdm import tqdm
 
 from .config import *
 from .signals import Signal
 from .units import *
-from .utils import MarcumQFunction
+from .utils import erfcx, get_marcum_q_function
+
+
+def is_array(*args) -> bool:
+    """Return True if any of the arguments is a numpy array."""
+    return any(isinstance(arg, numpy.ndarray) for arg in args)
+
+
+def gauss_legendre_panels(edges: numpy.ndarray, n: int = 16):
+    """Return the nodes and weights of n-point Gauss-Legendre rules on each panel between edges."""
+    x, w = numpy.polynomial.legendre.leggauss(n)
+    a = edges[:-1, None]
+    b = edges[1:, None]
+    nodes = (a + b) / 2 + (b - a) / 2 * x
+    weights = (b - a) / 2 * w
+    return nodes.ravel(), weights.ravel()
 
 
 class LargeBeamAbsorbingLayerGreensFunction:
@@ -52,9 +66,16 @@ class LargeBeamAbsorbingLayerGreensFunction:
             self.sqrt = math.sqrt
             self.exp = math.exp
 
+    def supports_arrays(self) -> bool:
+        """Return True if the Green's function can be evaluated on numpy arrays directly."""
+        return not self.use_multi_precision and not self.with_units
+
     def __call__(
         self, z: float | mp.mpf | Q_, r: float | mp.mpf | Q_, tp: float | mp.mpf | Q_
     ) -> float | mp.mpf | Q_:
+        if self.supports_arrays() and is_array(z, r, tp):
+            return self.evaluate_array(z, r, tp)
+
         if self.use_approximations and False:
             # Large time approximation...
             # This approximates the exponential in the integrand (before integration)
@@ -111,9 +132,15 @@ class LargeBeamAbsorbingLayerGreensFunction:
                     return approx
 
         term1 = self.mua * self.E0 / self.rho / self.c / 2
-        term2 = self.exp(-self.mua * (z - self.z0))
         if tp == 0:
-            return term1 * term2
+            return term1 * self.exp(-self.mua * (z - self.z0))
+
+        # the erfcx formulation is stable for floats over the whole parameter space,
+        # so the asymptotic approximation below is only used with units or multi-precision.
+        if not self.use_multi_precision and not self.with_units:
+            return term1 * self.scaled_erf_difference(z, tp)
+
+        term2 = self.exp(-self.mua * (z - self.z0))
 
         if self.use_approximations:
             # Asymptotic approximation for erf
@@ -162,6 +189,173 @@ class LargeBeamAbsorbingLayerGreensFunction:
 
         return term1 * term2 * term3 * term4
 
+    def scaled_erf_difference(self, z: float, tp: float) -> float:
+        """
+        Compute exp(-mua*(z-z0)) * exp(alpha*tp*mua**2) * (erf(arg1) - erf(arg2))
+        in double precision without overflowing.
+
+        With s = sqrt(4*alpha*tp), m = mua*sqrt(alpha*tp), B1 = (z0-z)/s, and
+        B2 = (z0+d-z)/s, the erf arguments are a1 = B2 + m and a2 = B1 + m,
+        and the combined exponent is m**2 + 2*m*B1 = a2**2 - B1**2 = a1**2 - B2**2 - mua*d.
+        If both arguments have the same sign, the erf difference is a difference of
+        erfc's, and writing erfc(a) = erfcx(a)*exp(-a**2) cancels the large exponent:
+
+            exp(-B1**2) * erfcx(a2) - exp(-B2**2 - mua*d) * erfcx(a1)
+
+        (negated, with |a|, if both are negative). If the arguments have different signs,
+        the combined exponent is <= 0 and the direct expression is safe.
+        """
+        s = self.sqrt(4 * self.alpha * tp)
+        m = self.mua * self.sqrt(self.alpha * tp)
+        B1 = (self.z0 - z) / s
+        B2 = (self.z0 + self.d - z) / s
+        a1 = B2 + m
+        a2 = B1 + m
+
+        if a2 < 0 < a1:
+            return self.exp(m * m + 2 * m * B1) * (self.erf(a1) - self.erf(a2))
+
+        diff = self.exp(-B1 * B1) * erfcx(abs(a2)) - self.exp(
+            -B2 * B2 - self.mua * self.d
+        ) * erfcx(abs(a1))
+        return diff if a2 >= 0 else -diff
+
+    def evaluate_array(
+        self, z: numpy.ndarray, r: numpy.ndarray, tp: numpy.ndarray
+    ) -> numpy.ndarray:
+        """
+        Evaluate the Green's function for arrays of z, r, and tp.
+
+        The arguments are broadcast against each other and the same expression
+        used by __call__ is evaluated with numpy ufuncs, so there is no per-sample
+        Python call. Only supported for plain floats (no units or multi-precision).
+        """
+        z, r, tp = numpy.broadcast_arrays(
+            numpy.asarray(z, dtype=float),
+            numpy.asarray(r, dtype=float),
+            numpy.asarray(tp, dtype=float),
+        )
+
+        term1 = self.mua * self.E0 / self.rho / self.c / 2
+        result = numpy.empty(z.shape)
+
+        mask = tp == 0
+        result[mask] = term1 * numpy.exp(-self.mua * (z[mask] - self.z0))
+
+        # see scaled_erf_difference(...)
+        mask = ~mask
+        z = z[mask]
+        tp = tp[mask]
+        s = numpy.sqrt(4 * self.alpha * tp)
+        m = self.mua * numpy.sqrt(self.alpha * tp)
+        B1 = (self.z0 - z) / s
+        B2 = (self.z0 + self.d - z) / s
+        a1 = B2 + m
+        a2 = B1 + m
+
+        # the branches that are not selected may overflow
+        with numpy.errstate(over="ignore", invalid="ignore"):
+            diff = numpy.exp(-B1 * B1) * scipy.special.erfcx(numpy.abs(a2)) - numpy.exp(
+                -B2 * B2 - self.mua * self.d
+            ) * scipy.special.erfcx(numpy.abs(a1))
+            mixed = numpy.exp(m * m + 2 * m * B1) * (
+                scipy.special.erf(a1) - scipy.special.erf(a2)
+            )
+        result[mask] = term1 * numpy.where(
+            (a2 < 0) & (a1 > 0), mixed, numpy.where(a2 >= 0, diff, -diff)
+        )
+
+        return result
+
+    def step_response(
+        self, z: float | numpy.ndarray, r: float | numpy.ndarray, t: float | numpy.ndarray
+    ) -> float | numpy.ndarray:
+        """
+        Compute the time integral of the Green's function from 0 to t in closed form.
+
+        This is the temperature rise caused by turning the laser on at t = 0 and leaving
+        it on. With u = alpha*t and x = z - z0, the integral is
+
+            E0 / (mua rho c alpha) * ( h(x, u) - exp(-mua d) h(x - d, u) )
+
+        where h is the step response of an absorber that fills the half space x > 0 (see
+        half_space_step_response(...)). Only supported for plain floats (no units or
+        multi-precision).
+        """
+        z, r, t = numpy.broadcast_arrays(
+            numpy.asarray(z, dtype=float),
+            numpy.asarray(r, dtype=float),
+            numpy.asarray(t, dtype=float),
+        )
+        u = self.alpha * t
+        x = z - self.z0
+
+        result = numpy.zeros(z.shape)
+        # the closed form loses about eps / (mua^2 u) of relative precision to cancellation,
+        # so very short times are integrated with Gauss-Legendre quadrature instead.
+        # substituting t' = t s^2 removes the sqrt(t') behavior of the integrand at t' = 0,
+        # and the panels are graded towards s = 0 to resolve the layer boundaries.
+        short = (u > 0) & (self.mua**2 * u < 1e-6)
+        if numpy.any(short):
+            s, w = gauss_legendre_panels(numpy.array([0, 1e-4, 1e-3, 1e-2, 1e-1, 1]))
+            tp = t[short][:, None] * s**2
+            integrand = LargeBeamAbsorbingLayerGreensFunction.evaluate_array(
+                self, z[short][:, None], 0, tp
+            )
+            result[short] = numpy.sum(integrand * 2 * t[short][:, None] * s * w, axis=-1)
+
+        mask = self.mua**2 * u >= 1e-6
+        result[mask] = (
+            self.E0
+            / (self.mua * self.rho * self.c * self.alpha)
+            * (
+                self.half_space_step_response(x[mask], u[mask])
+                - numpy.exp(-self.mua * self.d)
+                * self.half_space_step_response(x[mask] - self.d, u[mask])
+            )
+        )
+
+        if result.ndim == 0:
+            return float(result)
+        return result
+
+    def half_space_step_response(self, x: numpy.ndarray, u: numpy.ndarray) -> numpy.ndarray:
+        """
+        Compute the (scaled) step response of an absorber that fills the half space x > 0.
+
+        The step response h satisfies dh/du = d^2h/dx^2 + 2 exp(-mua x) H(x), h(x, 0) = 0.
+        Writing h = P + W, with P'' = -2 exp(-mua x) H(x), gives W as the heat kernel applied
+        to -P. With q = x / (2 sqrt(u)) and a = mua sqrt(u) - q,
+
+            h = exp(-q^2) (0.5 erfcx(a) + mua sqrt(u / pi)) - exp(-mua x) + 0.5 (1 - mua x) erfc(q)
+
+        The terms are rearranged with erfc(q) = 2 - erfc(-q) to avoid cancellation:
+        for x < 0 the last two terms are -0.5 (1 - mua x) erfc(-q), and for a < 0,
+        0.5 exp(-q^2) erfcx(a) - exp(-mua x) = expm1(mua^2 u) exp(-mua x) - 0.5 exp(-q^2) erfcx(-a),
+        which is also the form that does not overflow.
+        """
+        q = x / (2 * numpy.sqrt(u))
+        a = self.mua * numpy.sqrt(u) - q
+        exp_q2 = numpy.exp(-q * q)
+
+        # the branches that are not selected may overflow
+        with numpy.errstate(over="ignore", invalid="ignore"):
+            h = numpy.where(
+                x < 0,
+                exp_q2 * (0.5 * scipy.special.erfcx(a) + self.mua * numpy.sqrt(u / numpy.pi))
+                - 0.5 * (1 - self.mua * x) * scipy.special.erfc(-q),
+                numpy.where(
+                    a >= 0,
+                    exp_q2 * 0.5 * scipy.special.erfcx(a) - numpy.exp(-self.mua * x),
+                    numpy.expm1(self.mua**2 * u) * numpy.exp(-self.mua * x)
+                    - exp_q2 * 0.5 * scipy.special.erfcx(-a),
+                )
+                + exp_q2 * self.mua * numpy.sqrt(u / numpy.pi)
+                + 0.5 * (1 - self.mua * x) * scipy.special.erfc(q),
+            )
+
+        return h
+
 
 class FlatTopBeamAbsorbingLayerGreensFunction(LargeBeamAbsorbingLayerGreensFunction):
     """
@@ -177,6 +371,9 @@ class FlatTopBeamAbsorbingLayerGreensFunction(LargeBeamAbsorbingLayerGreensFunct
         super().__init__(config.model_dump())
 
         self.R = config.one_over_e_radius
+        # the implementation is looked up when it is called so that compiled
+        # backends are loaded in the process that uses them.
+        self.marcum_q_backend = config.marcum_q_backend
 
         if not self.with_units:
             for param in ["R"]:
@@ -189,6 +386,9 @@ class FlatTopBeamAbsorbingLayerGreensFunction(LargeBeamAbsorbingLayerGreensFunct
     def __call__(
         self, z: float | mp.mpf, r: float | mp.mpf, tp: float | mp.mpf = None
     ) -> float | mp.mpf:
+        if self.supports_arrays() and is_array(z, r, tp):
+            return self.evaluate_array(z, r, tp)
+
         # special conditions
         # if the sensor is outside of the beam at t = 0,
         # the temperature rise will be zero
@@ -207,10 +407,9 @@ class FlatTopBeamAbsorbingLayerGreensFunction(LargeBeamAbsorbingLayerGreensFunct
             rfactor = 1 - self.exp(-(self.R**2) / 4 / self.alpha / tp)
         else:
             # If we are calculating the temperature off axis, we have no choice
-            # but to call the expensive function
-            # TODO: add support for calling a WASM-commpiled version of this function. Initial testing indicates
-            #       it could be 10x faster.
-            rfactor = 1 - MarcumQFunction(
+            # but to call the expensive function. A compiled implementation
+            # can be selected with marcum_q_backend (see utils.get_marcum_q_function).
+            rfactor = 1 - get_marcum_q_function(self.marcum_q_backend)(
                 1,
                 r / self.sqrt(2 * self.alpha * tp),
                 self.R / self.sqrt(2 * self.alpha * tp),
@@ -218,6 +417,127 @@ class FlatTopBeamAbsorbingLayerGreensFunction(LargeBeamAbsorbingLayerGreensFunct
 
         return zfactor * rfactor
 
+    def evaluate_array(
+        self, z: numpy.ndarray, r: numpy.ndarray, tp: numpy.ndarray
+    ) -> numpy.ndarray:
+        z, r, tp = numpy.broadcast_arrays(
+            numpy.asarray(z, dtype=float),
+            numpy.asarray(r, dtype=float),
+            numpy.asarray(tp, dtype=float),
+        )
+        zfactor = super().evaluate_array(z, r, tp)
+        return zfactor * self.radial_factor(r, tp)
+
+    def radial_factor(self, r: numpy.ndarray, tp: numpy.ndarray) -> numpy.ndarray:
+        """Return the factor that multiplies the large beam Green's function, see evaluate_array(...)."""
+        r, tp = numpy.broadcast_arrays(
+            numpy.asarray(r, dtype=float), numpy.asarray(tp, dtype=float)
+        )
+        # at t = 0 the sensor is either inside the beam (same as on axis)
+        # or outside of it (no temperature rise)
+        rfactor = numpy.where(r > self.R, 0.0, 1.0)
+        mask = tp != 0
+        on_axis = mask & (r == 0)
+        off_axis = mask & (r != 0)
+        rfactor[on_axis] = 1 - numpy.exp(-(self.R**2) / 4 / self.alpha / tp[on_axis])
+        if numpy.any(off_axis):
+            rfactor[off_axis] = 1 - get_marcum_q_function(self.marcum_q_backend)(
+                1,
+                r[off_axis] / numpy.sqrt(2 * self.alpha * tp[off_axis]),
+                self.R / numpy.sqrt(2 * self.alpha * tp[off_axis]),
+            )
+        return rfactor
+
+    def radial_factor_derivative(
+        self, r: numpy.ndarray, tp: numpy.ndarray
+    ) -> numpy.ndarray:
+        """
+        Return the time derivative of the radial factor.
+
+        With a = r/sqrt(2 alpha tp) and b = R/sqrt(2 alpha tp), dQ_1(a,b)/dtp = b/(2 tp) exp(-(a^2+b^2)/2) (b I_0(ab) - a I_1(ab)),
+        which is evaluated with the exponentially scaled Bessel functions.
+        """
+        r, tp = numpy.broadcast_arrays(
+            numpy.asarray(r, dtype=float), numpy.asarray(tp, dtype=float)
+        )
+        a = r / numpy.sqrt(2 * self.alpha * tp)
+        b = self.R / numpy.sqrt(2 * self.alpha * tp)
+        return (
+            -b
+            / (2 * tp)
+            * numpy.exp(-((a - b) ** 2) / 2)
+            * (b * scipy.special.i0e(a * b) - a * scipy.special.i1e(a * b))
+        )
+
+    def step_response(
+        self, z: float | numpy.ndarray, r: float | numpy.ndarray, t: float | numpy.ndarray
+    ) -> float | numpy.ndarray:
+        """
+        Compute the time integral of the Green's function from 0 to t.
+
+        The large beam part has a closed form integral S(t), so the integral is done by parts,
+
+            int_0^t S'(t') R(t') dt' = S(t) R(t) - int_0^t S(t') R'(t') dt'
+
+        and only the last (smooth) integral, which involves the radial factor R, is done numerically.
+        The integral is accumulated with 4-point Gauss-Legendre rules on panels between the requested
+        times, refined so that no panel is wider than 1/32 of a decade, so each unique time costs a
+        single panel.
+        """
+        z, r, t = numpy.broadcast_arrays(
+            numpy.asarray(z, dtype=float),
+            numpy.asarray(r, dtype=float),
+            numpy.asarray(t, dtype=float),
+        )
+        result = numpy.zeros(z.shape)
+        mask = t > 0
+        if not numpy.any(mask):
+            return float(result) if result.ndim == 0 else result
+
+        S = super().step_response
+
+        # usually all times are requested at a single position
+        if numpy.all(z == z.flat[0]) and numpy.all(r == r.flat[0]):
+            positions = [(z.flat[0], r.flat[0], mask)]
+        else:
+            positions = [
+                (zj, rj, mask & (z == zj) & (r == rj))
+                for zj, rj in numpy.unique(
+                    numpy.stack([z[mask], r[mask]], axis=-1), axis=0
+                )
+            ]
+
+        for zj, rj, selected in positions:
+            tj, index = numpy.unique(t[selected], return_inverse=True)
+
+            # tmin is chosen so that R' is negligible before it.
+            # the integrand is zero at t' = 0, so the first panel is [0, tmin]
+            tmax = tj[-1]
+            tmin = min(tj[0], self.R**2 / (4 * self.alpha) * 1e-3, 1e-12 * tmax)
+            num_panels = max(1, math.ceil(32 * math.log10(tmax / tmin)))
+            edges = numpy.unique(
+                numpy.concatenate([[0], numpy.geomspace(tmin, tmax, num_panels + 1), tj])
+            )
+
+            nodes, weights = gauss_legendre_panels(edges, 4)
+            integrand = S(zj, 0, nodes) * self.radial_factor_derivative(rj, nodes)
+            panels = numpy.sum(
+                (numpy.nan_to_num(integrand, nan=0.0) * weights).reshape(
+                    len(edges) - 1, -1
+                ),
+                axis=-1,
+            )
+            cumulative = numpy.concatenate([[0], numpy.cumsum(panels)])
+            integral = cumulative[numpy.searchsorted(edges, tj)]
+
+            result[selected] = (S(zj, 0, tj) * self.radial_factor(rj, tj) - integral)[
+                index.ravel()
+            ]
+
+        if result.ndim == 0:
+            return float(result)
+        return result
+
 
 class GaussianBeamAbsorbingLayerGreensFunction(FlatTopBeamAbsorbingLayerGreensFunction):
     def __init__(
@@ -230,6 +550,9 @@ class GaussianBeamAbsorbingLayerGreensFunction(FlatTopBeamAbsorbingLayerGreensFu
     def __call__(
         self, z: float | mp.mpf, r: float | mp.mpf, tp: float | mp.mpf = None
     ) -> float | mp.mpf:
+        if self.supports_arrays() and is_array(z, r, tp):
+            return self.evaluate_array(z, r, tp)
+
         zfactor = super().__call__(z, r, tp)
 
         if r == 0:
@@ -242,6 +565,136 @@ class GaussianBeamAbsorbingLayerGreensFunction(FlatTopBeamAbsorbingLayerGreensFu
 
         return zfactor * rfactor
 
+    def evaluate_array(
+        self, z: numpy.ndarray, r: numpy.ndarray, tp: numpy.ndarray
+    ) -> numpy.ndarray:
+        z, r, tp = numpy.broadcast_arrays(
+            numpy.asarray(z, dtype=float),
+            numpy.asarray(r, dtype=float),
+            numpy.asarray(tp, dtype=float),
+        )
+        zfactor = super().evaluate_array(z, r, tp)
+
+        tmp1 = 1 / (1 + 4 * self.alpha * tp / self.R**2)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            tmp2 = self.R**2 / 4 / self.alpha / tp
+            rfactor = numpy.where(r == 0, tmp1, tmp1 * numpy.exp(tmp2 * (tmp1 - 1)))
+
+        return zfactor * rfactor
+
+    def radial_factor(self, r: numpy.ndarray, tp: numpy.ndarray) -> numpy.ndarray:
+        r, tp = numpy.broadcast_arrays(
+            numpy.asarray(r, dtype=float), numpy.asarray(tp, dtype=float)
+        )
+        # tmp2 * (tmp1 - 1) = -tmp1, see evaluate_array(...)
+        tmp1 = 1 / (1 + 4 * self.alpha * tp / self.R**2)
+        rfactor = numpy.where(r == 0, tmp1, tmp1 * numpy.exp(-tmp1))
+        return super().radial_factor(r, tp) * rfactor
+
+    def radial_factor_derivative(
+        self, r: numpy.ndarray, tp: numpy.ndarray
+    ) -> numpy.ndarray:
+        r, tp = numpy.broadcast_arrays(
+            numpy.asarray(r, dtype=float), numpy.asarray(tp, dtype=float)
+        )
+        tmp1 = 1 / (1 + 4 * self.alpha * tp / self.R**2)
+        dtmp1 = -4 * self.alpha / self.R**2 * tmp1**2
+        rfactor = numpy.where(r == 0, tmp1, tmp1 * numpy.exp(-tmp1))
+        drfactor = numpy.where(r == 0, dtmp1, (1 - tmp1) * numpy.exp(-tmp1) * dtmp1)
+        return (
+            super().radial_factor_derivative(r, tp) * rfactor
+            + super().radial_factor(r, tp) * drfactor
+        )
+
+
+class TabulatedTimeKernel:
+    """
+    A Green's function at a fixed position tabulated on a logarithmic time grid.
+
+    Values are interpolated with a cubic spline in log(t). The grid density is doubled
+    until the interpolation error at the grid midpoints is below rtol times the largest
+    tabulated value, and the table is extended by whole decades when a time past the
+    end of it is requested. Times before tmin are evaluated directly. If the error is still
+    above rtol after max_refinements doublings, the table is not used and all times are
+    evaluated directly.
+    """
+
+    def __init__(
+        self, f, tmin: float, points_per_decade=64, rtol=1e-6, max_refinements=6
+    ) -> None:
+        self.f = f
+        self.tmin = tmin
+        self.points_per_decade = points_per_decade
+        self.rtol = rtol
+        self.max_refinements = max_refinements
+
+        self.tmax = None
+        self.spline = None
+        self.error = None
+        self.converged = None
+
+    def build(self, tmax: float) -> None:
+        decades = max(1, math.ceil(math.log10(tmax / self.tmin)))
+        n = decades * self.points_per_decade + 1
+        x = numpy.linspace(
+            math.log(self.tmin), math.log(self.tmin) + decades * math.log(10), n
+        )
+        y = self.f(numpy.exp(x))
+        for i in range(self.max_refinements + 1):
+            spline = scipy.interpolate.CubicSpline(x, y)
+            xm = (x[1:] + x[:-1]) / 2
+            ym = self.f(numpy.exp(xm))
+            self.error = numpy.max(abs(spline(xm) - ym))
+            self.converged = bool(
+                self.error <= self.rtol * max(numpy.max(abs(y)), numpy.max(abs(ym)))
+            )
+            if self.converged or i == self.max_refinements:
+                break
+            # the midpoints are the new grid points of the refined grid
+            x = numpy.insert(x, range(1, len(x)), xm)
+            y = numpy.insert(y, range(1, len(y)), ym)
+            self.points_per_decade *= 2
+
+        self.spline = spline
+        self.tmax = math.exp(x[-1])
+
+    def __call__(self, tp: float | numpy.ndarray) -> float | numpy.ndarray:
+        t = numpy.atleast_1d(numpy.asarray(tp, dtype=float))
+        if (
+            len(t) > 0
+            and self.converged is not False
+            and (self.tmax is None or numpy.max(t) > self.tmax)
+        ):
+            self.build(numpy.max(t))
+
+        # the table could not be made accurate enough
+        if self.converged is False:
+            T = numpy.asarray(self.f(t), dtype=float)
+            if not is_array(tp):
+                return float(T[0])
+            return T
+
+        T = numpy.empty(t.shape)
+        tabulated = t >= self.tmin
+        T[tabulated] = self.spline(numpy.log(t[tabulated]))
+        if not numpy.all(tabulated):
+            T[~tabulated] = self.f(t[~tabulated])
+
+        if not is_array(tp):
+            return float(T[0])
+        return T
+
+
+# time kernels are shared by all MultiLayerGreensFunction instances in a process
+# that describe the same physics, so a batch of configurations that only differ in
+# exposure timing or irradiance only tabulates each kernel once.
+_time_kernel_cache = {}
+time_kernel_cache_max_size = 64
+
+
+def clear_time_kernel_cache() -> None:
+    _time_kernel_cache.clear()
+
 
 class MultiLayerGreensFunction:
     def __init__(self, config: dict | MultiLayerGreensFunctionConfig) -> None:
@@ -270,6 +723,7 @@ class MultiLayerGreensFunction:
         self.layers = []
 
         E0 = config.laser.irradiance
+        self.E0 = E0 if self.with_units else E0.magnitude
         for layer in sorted(config.layers, key=lambda l: l.position.magnitude):
             # create a config dict that we will pass to the layer
             # and fill in the keys needed by a layer
@@ -318,11 +772,91 @@ class MultiLayerGreensFunction:
                         f"ERROR: Layer {i} overlaps with layer {i-1}. z_{i} = {self.layers[i].z0}, z_{i-1} + d_{i-1} = {self.layers[i-1].z0+ self.layers[i-1].d}"
                     )
 
-    def __call__(
+        self.time_kernel_cache = None
+        if config.simulation.time_kernel_cache.enabled:
+            if self.use_multi_precision or self.with_units:
+                raise RuntimeError(
+                    "ERROR: The time kernel cache can only be used with double precision calculations without units."
+                )
+            self.time_kernel_cache = config.simulation.time_kernel_cache
+            # everything that determines the Green's function, except the irradiance.
+            # the Green's function is linear in the irradiance, so the kernel is tabulated
+            # for unit irradiance and scaled.
+            self.time_kernel_key = (
+                config.laser.profile,
+                (
+                    None
+                    if config.laser.profile == "1d"
+                    else config.laser.one_over_e_radius.to("cm").magnitude
+                ),
+                tuple(
+                    (
+                        layer.position.to("cm").magnitude,
+                        layer.thickness.to("cm").magnitude,
+                        layer.absorption_coeffcient.to("1/cm").magnitude,
+                    )
+                    for layer in config.layers
+                ),
+                config.thermal.rho.to("g/cm^3").magnitude,
+                config.thermal.c.to("J/g/K").magnitude,
+                config.thermal.k.to("W/cm/K").magnitude,
+                self.use_approximations,
+                self.time_kernel_cache.tmin.to("s").magnitude,
+                self.time_kernel_cache.points_per_decade,
+                self.time_kernel_cache.rtol,
+                self.time_kernel_cache.max_refinements,
+            )
+
+    def supports_arrays(self) -> bool:
+        """Return True if all layers can be evaluated on numpy arrays directly."""
+        return all(G.supports_arrays() for G in self.layers)
+
+    def time_kernel(self, z: float, r: float) -> TabulatedTimeKernel:
+        """Return the tabulated (unit irradiance) time kernel at position (z, r)."""
+        key = (self.time_kernel_key, float(z), float(r))
+        if key in _time_kernel_cache:
+            # move to the end so that the least recently used kernel is evicted first
+            kernel = _time_kernel_cache.pop(key)
+        else:
+            if self.supports_arrays():
+                f = lambda t: self.evaluate(z, r, t) / self.E0
+            else:
+                f = numpy.vectorize(lambda t: self.evaluate(z, r, t) / self.E0)
+            kernel = TabulatedTimeKernel(
+                f,
+                self.time_kernel_cache.tmin.to("s").magnitude,
+                points_per_decade=self.time_kernel_cache.points_per_decade,
+                rtol=self.time_kernel_cache.rtol,
+                max_refinements=self.time_kernel_cache.max_refinements,
+            )
+            while len(_time_kernel_cache) >= time_kernel_cache_max_size:
+                _time_kernel_cache.pop(next(iter(_time_kernel_cache)))
+        _time_kernel_cache[key] = kernel
+        return kernel
+
+    def evaluate(
         self, z: float | mp.mpf, r: float | mp.mpf, tp: float | mp.mpf = None
     ) -> float | mp.mpf:
+        """Evaluate the Green's function directly, by summing the contributions from all layers."""
         return sum([G(z, r, tp) for G in self.layers])
 
+    def step_response(
+        self, z: float | numpy.ndarray, r: float | numpy.ndarray, t: float | numpy.ndarray
+    ) -> float | numpy.ndarray:
+        """Compute the time integral of the Green's function from 0 to t, summed over all layers."""
+        if not self.supports_arrays():
+            raise RuntimeError(
+                "ERROR: The step response can only be computed with double precision calculations without units."
+            )
+        return sum([G.step_response(z, r, t) for G in self.layers])
+
+    def __call__(
+        self, z: float | mp.mpf, r: float | mp.mpf, tp: float | mp.mpf = None
+    ) -> float | mp.mpf:
+        if self.time_kernel_cache is not None and not is_array(z, r):
+            return self.E0 * self.time_kernel(z, r)(tp)
+        return self.evaluate(z, r, tp)
+
 
 class GreensFunctionIntegrator:
     def __init__(self, G) -> None:
@@ -332,16 +866,60 @@ class GreensFunctionIntegrator:
 
 
 class GreensFunctionTrapezoidIntegrator(GreensFunctionIntegrator):
-    def __init__(self, G) -> None:
+    """
+    Integrates the Green's function on a uniform time grid.
+
+    The Green's function is evaluated on the whole grid at once and integrated cumulatively with
+    the trapezoid rule, or with a higher order rule ("simpson" or "gauss-legendre") so that dt can
+    be coarser for the same accuracy. A pulse is the window C(t - ton) - C(t - ton - tau) of the
+    cumulative integral C, and pulse trains are built by convolving the pulse with the comb of
+    pulse arrivals.
+    """
+
+    rules = ["trapezoid", "simpson", "gauss-legendre"]
+
+    def __init__(self, G, rule="trapezoid") -> None:
         super().__init__(G)
         self.dt = Q_(0.1, "us")
+        if rule not in self.rules:
+            raise RuntimeError(
+                f"ERROR: Unknown integration rule '{rule}'. Expected one of {self.rules}."
+            )
+        self.rule = rule
+
+    def evaluate(self, z, r, t):
+        """Evaluate the Green's function at an array of times."""
+        if getattr(self.G, "supports_arrays", lambda: False)():
+            return self.G(z, r, t)
+        return numpy.vectorize(lambda x: float(self.G(z, r, x)))(t)
+
+    def temperature_rise_on_grid(self, z, r, tmax, dt):
+        """
+        Compute the integral of the Green's function from 0 to each time of a uniform grid that covers [0, tmax].
+
+        The simpson rule integrates each interval with the quadratic through it and its neighbor,
+        dt/12 (5 f_k + 8 f_k+1 - f_k+2) (mirrored for the last interval), and the gauss-legendre
+        rule uses a 3-point rule on each interval.
+        """
+        n = int(round(tmax / dt)) + 2
+        t = dt * numpy.arange(n)
+        if self.rule == "gauss-legendre":
+            x, w = numpy.polynomial.legendre.leggauss(3)
+            nodes = t[:-1, None] + dt / 2 * (x + 1)
+            intervals = numpy.sum(
+                self.evaluate(z, r, nodes.ravel()).reshape(nodes.shape) * dt / 2 * w,
+                axis=-1,
+            )
+        else:
+            f = self.evaluate(z, r, t)
+            if self.rule == "simpson":
+                intervals = numpy.empty([n - 1])
+                intervals[:-1] = dt / 12 * (5 * f[:-2] + 8 * f[1:-1] - f[2:])
+                intervals[-1] = dt / 12 * (-f[-3] + 8 * f[-2] + 5 * f[-1])
+            else:
+                intervals = dt / 2 * (f[:-1] + f[1:])
 
-    def temperature_rise_on_grid(self, z, r, tmin, tmax, dt):
-        """Compute the temperature rise at uniformly spaced times so that we can build the temperature rise caused by an exposure."""
-        t = numpy.arange(tmin, tmax + 2 * dt, dt)
-        T = numpy.vectorize(lambda x: self.G(z, r, x))(t)
-        T = scipy.integrate.cumulative_trapezoid(T, t)
-        return t[:-1], T
+        return t, numpy.concatenate([[0], numpy.cumsum(intervals)])
 
     def temperature_rise(
         self,
@@ -351,38 +929,34 @@ class GreensFunctionTrapezoidIntegrator(GreensFunctionIntegrator):
         config: dict,
     ):
         """Compute the temperature rise caused by an exposure descibed in config."""
-        tmin = min(ts)
-        tmax = max(ts)
+        ts = numpy.array(ts, dtype=float)
         dt = self.dt.to("s").magnitude
-        t, dTheta = self.temperature_rise_on_grid(z, r, tmin, tmax, dt)
+        t, C = self.temperature_rise_on_grid(z, r, numpy.max(ts), dt)
 
         ton = Q_(config.get("ton", "0 s")).to("s").magnitude
         tau = Q_(config.get("tau", "1 year")).to("s").magnitude
         t0 = Q_(config.get("t0", "1 year")).to("s").magnitude
         T = Q_(config.get("T", "1 year")).to("s").magnitude
 
-        dTheta_sp = numpy.zeros([len(t)])
-        i_start = int(ton / dt)
-        i_stop = min(int((ton + tau) / dt), len(t) - 1)
-
-        for i in range(i_start, i_stop + 1):
-            dTheta_sp[i] = dTheta[i - i_start]
-        for i in range(i_stop + 1, len(t)):
-            # dT = int_{t-tau}^t G(t') dt'
-            dTheta_sp[i] = (
-                dTheta[i - i_start]
-                - dTheta[i - i_stop]  # i - i_start - (i_stop-i_start)
-            )
-        dTheta_mp = dTheta_sp
-        N = math.ceil(T / t0)
-        for n in range(1, N):
-            i_start = int((ton + n * t0) / dt)
-            dTheta_mp[i_start:] += dTheta_sp[:-i_start]
-
-        _is = numpy.searchsorted(t, ts)
-        Theta = dTheta_mp[_is]
+        # dT = int_{t-tau}^t G(t') dt' for a pulse that starts at t = 0
+        n = len(t)
+        i_tau = int(round(tau / dt))
+        pulse = C.copy()
+        if i_tau < n:
+            pulse[i_tau:] -= C[: n - i_tau]
+
+        # the comb of pulse arrivals
+        arrivals = numpy.rint((ton + t0 * numpy.arange(math.ceil(T / t0))) / dt).astype(int)
+        arrivals = arrivals[arrivals < n]
+        if len(arrivals) == 1:
+            dTheta = numpy.zeros([n])
+            dTheta[arrivals[0] :] = pulse[: n - arrivals[0]]
+        else:
+            comb = numpy.bincount(arrivals, minlength=n).astype(float)
+            m = 2 * n
+            dTheta = numpy.fft.irfft(numpy.fft.rfft(comb, m) * numpy.fft.rfft(pulse, m), m)[:n]
 
-        return Theta
+        return numpy.interp(ts, t, dTheta)
 
 
 class GreensFunctionQuadIntegrator(GreensFunctionIntegrator):
@@ -455,6 +1029,221 @@ class GreensFunctionQuadIntegrator(GreensFunctionIntegrator):
         return dTheta
 
 
+class GreensFunctionStepResponseIntegrator(GreensFunctionIntegrator):
+    """
+    Integrates the Green's function using its step response, the time integral from 0 to t
+    (see MultiLayerGreensFunction.step_response(...)).
+
+    A pulse that turns on at ton and lasts tau contributes S(t - ton) - S(t - ton - tau),
+    so an exposure is a sum of differences of step responses. Every unique time shift is
+    only evaluated once.
+    """
+
+    def __init__(self, G) -> None:
+        super().__init__(G)
+
+    def temperature_rise(
+        self,
+        z: float,
+        r: float,
+        ts: list[float],
+        config: dict,
+    ):
+        ton = Q_(config.get("ton", "0 s")).to("s").magnitude
+        tau = Q_(config.get("tau", "1 year")).to("s").magnitude
+        t0 = Q_(config.get("t0", "1 year")).to("s").magnitude
+        T = Q_(config.get("T", "1 year")).to("s").magnitude
+
+        ts = numpy.asarray(ts, dtype=float)
+        dTheta = numpy.zeros([len(ts)])
+        if len(ts) == 0:
+            return dTheta
+
+        # pulses that start after the last time do not contribute
+        N = min(math.ceil(T / t0), math.ceil((numpy.max(ts) - ton) / t0))
+        if N < 1:
+            return dTheta
+        shifts = ts[:, None] - (ton + t0 * numpy.arange(N))[None, :]
+        args = numpy.concatenate([shifts, shifts - tau], axis=-1).clip(min=0)
+        unique_args, inverse = numpy.unique(args, return_inverse=True)
+
+        S = self.G.step_response(z, r, unique_args)[inverse.ravel()].reshape(args.shape)
+        dTheta = numpy.sum(S[:, :N] - S[:, N:], axis=-1)
+        self.progress.emit(len(ts), len(ts))
+
+        return dTheta
+
+
+class GreensFunctionSuperpositionIntegrator(GreensFunctionIntegrator):
+    """
+    Integrates the Green's function for pulse trains by superposition.
+
+    The response to a single pulse, S(t) - S(t - tau), is computed once on a uniform time
+    grid using the step response (see MultiLayerGreensFunction.step_response(...)), and the
+    train is built by convolving it with the comb of pulse arrivals using an FFT.
+
+    Regular trains (ton, t0, T) use a grid that puts every arrival on a grid point. Arbitrary
+    schedules can be given with "arrival_times" (and optional "scales") in the config (set from
+    laser.contributions by PulsedRetinaLaserExposure), and the arrivals are distributed to the
+    neighboring grid points. The result is linearly interpolated
+    to the output times.
+
+    The grid resolves the pulse, so long trains of short pulses would need more than
+    `max_grid_points` points. For these, the response to a pulse is split into the part
+    within a short window after its arrival, which is tabulated finely and summed directly
+    at the output times, and the smooth tail, which is convolved on a coarse grid.
+    """
+
+    def __init__(self, G) -> None:
+        super().__init__(G)
+        self.dt = Q_(1, "us")
+        self.max_grid_points = 2**18
+        self.num_table_points = 2**12
+
+    def temperature_rise(
+        self,
+        z: float,
+        r: float,
+        ts: list[float],
+        config: dict,
+    ):
+        ton = Q_(config.get("ton", "0 s")).to("s").magnitude
+        tau = Q_(config.get("tau", "1 year")).to("s").magnitude
+        t0 = Q_(config.get("t0", "1 year")).to("s").magnitude
+        T = Q_(config.get("T", "1 year")).to("s").magnitude
+
+        ts = numpy.asarray(ts, dtype=float)
+        dTheta = numpy.zeros([len(ts)])
+        if len(ts) == 0:
+            return dTheta
+        tmax = numpy.max(ts)
+
+        # resolve the pulse shape
+        dt = min(self.dt.to("s").magnitude, tau / 10)
+        if "arrival_times" in config:
+            arrivals = numpy.array(
+                [Q_(a).to("s").magnitude for a in config["arrival_times"]]
+            )
+            scales = numpy.array(config.get("scales", numpy.ones(len(arrivals))))
+        else:
+            N = math.ceil(T / t0)
+            arrivals = ton + t0 * numpy.arange(N)
+            scales = numpy.ones(N)
+            if N > 1:
+                dt = t0 / math.ceil(t0 / dt)
+        scales = scales[arrivals <= tmax]
+        arrivals = arrivals[arrivals <= tmax]
+        if len(arrivals) == 0:
+            return dTheta
+
+        # the grid starts at the first arrival
+        tstart = numpy.min(arrivals)
+        n = int((tmax - tstart) / dt) + 2
+        if n > self.max_grid_points:
+            dTheta = self._temperature_rise_two_scale(
+                z, r, ts, arrivals, scales, tau, dt
+            )
+            self.progress.emit(len(ts), len(ts))
+            return dTheta
+        t = dt * numpy.arange(n)
+
+        self.status.emit("Computing single pulse response")
+        S = self.G.step_response(z, r, numpy.concatenate([t, (t - tau).clip(min=0)]))
+        pulse = S[:n] - S[n:]
+
+        comb = numpy.zeros([n])
+        f = (arrivals - tstart) / dt
+        # arrivals of regular trains are on the grid, up to round off
+        f = numpy.where(abs(f - numpy.round(f)) < 1e-9, numpy.round(f), f)
+        i = numpy.floor(f).astype(int)
+        w = f - i
+        numpy.add.at(comb, i, scales * (1 - w))
+        numpy.add.at(comb, (i + 1)[i + 1 < n], (scales * w)[i + 1 < n])
+
+        self.status.emit("Superimposing pulses")
+        m = 2 * n
+        train = numpy.fft.irfft(numpy.fft.rfft(comb, m) * numpy.fft.rfft(pulse, m), m)[:n]
+        dTheta = numpy.interp(ts, tstart + t, train, left=0)
+        self.progress.emit(len(ts), len(ts))
+
+        return dTheta
+
+    def _temperature_rise_two_scale(self, z, r, ts, arrivals, scales, tau, dt):
+        """
+        Compute the temperature rise from a pulse train on a grid of at most `max_grid_points`.
+
+        The response to a pulse is split into near(s) + far(s), where s is the time since the
+        arrival. far(s) is the response for s >= w and a cubic that joins it smoothly to zero
+        for s < w, so the tail can be convolved on a coarse grid. near(s) is the rest of the
+        response, which is zero for s >= w, and is summed over the arrivals in the window
+        before each output time.
+        """
+        order = numpy.argsort(arrivals)
+        arrivals = arrivals[order]
+        scales = scales[order]
+        tstart = arrivals[0]
+        tmax = numpy.max(ts)
+
+        n = self.max_grid_points
+        dtc = (tmax - tstart) / (n - 2)
+        # the tail must be smooth on the coarse grid
+        w = max(32 * dtc, 2 * tau)
+
+        def pulse(s):
+            S = self.G.step_response(z, r, numpy.concatenate([s, (s - tau).clip(min=0)]))
+            return S[: len(s)] - S[len(s) :]
+
+        # cubic P x^2 + D x^3 terms that match the tail's value and slope at w
+        h = 1e-3 * w
+        p = pulse(numpy.array([w - h, w, w + h]))
+        P = p[1]
+        D = w * (p[2] - p[0]) / (2 * h)
+
+        def far(s):
+            x = s / w
+            f = numpy.zeros([len(s)])
+            i = x < 1
+            f[i] = (3 * P - D) * x[i] ** 2 + (D - 2 * P) * x[i] ** 3
+            f[~i] = pulse(s[~i])
+            return f
+
+        self.status.emit("Computing single pulse response")
+        K = self.num_table_points
+        s = numpy.concatenate(
+            [
+                dt * numpy.arange(K),
+                tau + dt * numpy.arange(K),
+                numpy.geomspace(dt, w, K),
+            ]
+        )
+        s = numpy.unique(s[s <= w])
+        near = pulse(s) - far(s)
+
+        t = dtc * numpy.arange(n)
+        tail = far(t)
+
+        self.status.emit("Superimposing pulses")
+        comb = numpy.zeros([n])
+        f = (arrivals - tstart) / dtc
+        i = numpy.floor(f).astype(int)
+        weight = f - i
+        numpy.add.at(comb, i, scales * (1 - weight))
+        numpy.add.at(comb, (i + 1)[i + 1 < n], (scales * weight)[i + 1 < n])
+        m = 2 * n
+        train = numpy.fft.irfft(numpy.fft.rfft(comb, m) * numpy.fft.rfft(tail, m), m)[:n]
+        dTheta = numpy.interp(ts, tstart + t, train, left=0)
+
+        # arrivals in (t - w, t] contribute to the near part
+        lo = numpy.searchsorted(arrivals, ts - w, side="right")
+        hi = numpy.searchsorted(arrivals, ts, side="right")
+        for j in range(numpy.max(hi - lo)):
+            k = lo + j
+            i = k < hi
+            dTheta[i] += scales[k[i]] * numpy.interp(ts[i] - arrivals[k[i]], s, near)
+
+        return dTheta
+
+
 class CWRetinaLaserExposure:
     """
     Class for configuring and computing the temperature rise from a CW exposure to a retina model.
@@ -487,8 +1276,16 @@ class CWRetinaLaserExposure:
         Integrator = None
         if method == "trap":
             Integrator = GreensFunctionTrapezoidIntegrator(self.G)
+        if method == "simpson":
+            Integrator = GreensFunctionTrapezoidIntegrator(self.G, rule="simpson")
+        if method == "gauss-legendre":
+            Integrator = GreensFunctionTrapezoidIntegrator(self.G, rule="gauss-legendre")
         if method == "quad":
             Integrator = GreensFunctionQuadIntegrator(self.G)
+        if method == "step":
+            Integrator = GreensFunctionStepResponseIntegrator(self.G)
+        if method == "superposition":
+            Integrator = GreensFunctionSuperpositionIntegrator(self.G)
         Integrator.progress.connect(lambda i, n: self.progress.emit(i, n))
 
         return Integrator.temperature_rise(z, r, t, self.make_integrator_config())
@@ -503,6 +1300,7 @@ class PulsedRetinaLaserExposure(CWRetinaLaserExposure):
         self.exposure_duration = self.duration
         self.pulse_duration = config.laser.pulse_duration
         self.pulse_period = config.laser.pulse_period
+        self.contributions = config.laser.contributions
 
     def make_integrator_config(self):
         config = {
@@ -511,4 +1309,21 @@ class PulsedRetinaLaserExposure(CWRetinaLaserExposure):
             "T": self.exposure_duration,
             "ton": self.start,
         }
+        if len(self.contributions) > 0:
+            config["arrival_times"] = [c.arrival_time for c in self.contributions]
+            config["scales"] = [c.scale for c in self.contributions]
         return config
+
+    def temperature_rise(
+        self,
+        z: float | mp.mpf,
+        r: float | mp.mpf,
+        t: list[float] | list[mp.mpf],
+        method="trap",
+    ):
+        # the other integrators only handle regular pulse trains
+        if len(self.contributions) > 0 and method != "superposition":
+            raise RuntimeError(
+                f"Pulse trains given by 'contributions' can only be computed with the 'superposition' method, not '{method}'."
+            )
+        return super().temperature_rise(z, r, t, method)
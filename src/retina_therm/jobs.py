@@ -0,0 +1,1473 @@
+"""
+Configuration models, job processes, and helper functions used by the CLI commands.
+
+These live outside of `retina_therm.cli` so that each command only imports them (and the
+numerical libraries they need) when it runs.
+"""
+
+import copy
+import hashlib
+import math
+import os
+from pathlib import Path, PosixPath
+from typing import List, Literal, Optional
+
+import h5py
+import numpy
+import powerconf
+import yaml
+from fspathtree import fspathtree
+from pydantic import Field
+
+from . import (
+    config,
+    damage,
+    greens_functions,
+    multi_pulse_builder,
+    parallel_jobs,
+    result_cache,
+    signals,
+    units,
+    utils,
+)
+
+
+def path_representer(dumper, data):
+    return dumper.represent_scalar("tag:yaml.org,2002:str", str(data))
+
+
+yaml.add_representer(PosixPath, path_representer)
+
+
+def q2str(p, v):
+    if hasattr(v, "magnitude"):
+        return str(v)
+    return v
+
+
+def get_result_cache_key(config, excluded_paths=[], input_files=[]):
+    """
+    Return the key that a command's result is stored under in a ResultCache.
+
+    The key is the id of the (validated) config without the parameters in `excluded_paths`
+    (and anything below them), which should be the parameters that don't change the result
+    (i.e. output file names), combined with the contents of the `input_files` the result
+    is computed from.
+    """
+    excluded_paths = ["/skip_existing_outputs"] + list(excluded_paths)
+
+    def is_included(p):
+        p = str(p)
+        return not any(map(lambda e: p == e or p.startswith(e + "/"), excluded_paths))
+
+    key = powerconf.utils.get_id(config, is_included)
+    if len(input_files) > 0:
+        h = hashlib.md5(key.encode("utf-8"))
+        for file in input_files:
+            h.update(result_cache.get_file_id(file).encode("utf-8"))
+        key = h.hexdigest()
+    return key
+
+
+def compute_evaluation_times(config):
+    # if times are given in the config, just them
+    if "ts" in config:
+        t = numpy.array([units.Q_(time).to("s").magnitude for time in config["ts"]])
+    else:
+        # we want to support specifying the times as a single range,
+        # i.e. "from tmin to tmax by steps of dt"
+        # or multiple ranges
+        # i.e. "from tmin_1 to tmax_1 by steps of dt_1 AND from tmin_2 to tmax_2 by steps of dt_2"
+        # this is usefull for sampling the start of a long exposure at higher resolution than the end.
+        time_configs = []
+        if type(config.tree) == dict:
+            time_configs.append(config)
+        else:
+            for c in config:
+                time_configs.append(c)
+
+        time_arrays = []
+        for i, time_config in enumerate(time_configs):
+            dt = units.Q_(time_config.get("resolution", "1 us"))
+            # if tmin is given, use it
+            # if it is not given and this is the first config, use 0 s
+            # if it is not given and this is not the first config, use the last config's tmax plus our dt
+            #     if the previous config does not have a tmax, use 10 s...
+            tmin = units.Q_(
+                time_config.get(
+                    "min",
+                    (
+                        units.Q_(time_configs[i - 1].get("max", "10 second")) + dt
+                        if i > 0
+                        else "0 second"
+                    ),
+                )
+            )
+            tmax = units.Q_(time_config.get("max", "10 second"))
+
+            dt = dt.to("s").magnitude
+            tmin = tmin.to("s").magnitude
+            tmax = tmax.to("s").magnitude
+
+            # adding dt/2 here so that tmax will be included in the array
+            t = numpy.arange(tmin, tmax + dt / 2, dt)
+            time_arrays.append(t)
+        t = numpy.concatenate(time_arrays)
+
+    return t
+
+
+def compute_adaptive_evaluation_times(config, temperature_rise):
+    """
+    Compute evaluation times that resolve a temperature history to a given tolerance.
+
+    `temperature_rise` is called with arrays of times and returns the temperature rise at them.
+    See `iter_adaptive_evaluation_times` for details.
+
+    Returns the times and the temperature rise at them.
+    """
+    times = iter_adaptive_evaluation_times(config)
+    try:
+        t = next(times)
+        while True:
+            t = times.send(numpy.asarray(temperature_rise(t)))
+    except StopIteration as e:
+        return e.value
+
+
+def iter_adaptive_evaluation_times(config):
+    """
+    Generator version of `compute_adaptive_evaluation_times`. It yields arrays of times that
+    the temperature rise is needed at and must be sent the temperature rise at them.
+
+    Starting from a coarse grid, with extra times spaced logarithmically after the start, every
+    interval whose midpoint temperature differs from the linear interpolation of its end points
+    by more than atol + rtol*|T| is split in half. This is repeated until all intervals have
+    converged or are shorter than twice the resolution, or the maximum number of times is
+    reached (splitting the intervals with the largest errors first).
+
+    Returns the times and the temperature rise at them.
+    """
+    dt = units.Q_(config.get("resolution", None) or "1 us").to("s").magnitude
+    tmin = units.Q_(config.get("min", None) or "0 second").to("s").magnitude
+    tmax = units.Q_(config.get("max", None) or "10 second").to("s").magnitude
+    rtol = config.get("adaptive/rtol", None) or 1e-3
+    atol = units.Q_(config.get("adaptive/atol", None) or "1 uK").to("K").magnitude
+    max_num_times = config.get("adaptive/max", None) or 10000
+
+    num_decades = max(1, math.ceil(math.log10((tmax - tmin) / dt)))
+    t = numpy.unique(
+        numpy.concatenate(
+            [
+                numpy.linspace(tmin, tmax, 17),
+                tmin + numpy.geomspace(dt, tmax - tmin, 4 * num_decades + 1),
+            ]
+        )
+    )
+    T = yield t
+    # intervals that have already passed the test do not need to be checked again
+    converged = numpy.zeros([len(t) - 1], dtype=bool)
+
+    while len(t) < max_num_times:
+        candidates = numpy.flatnonzero(~converged & (t[1:] - t[:-1] >= 2 * dt))
+        if len(candidates) == 0:
+            break
+        tmid = (t[candidates] + t[candidates + 1]) / 2
+        Tmid = yield tmid
+        # with multiple sensors, the largest error over all sensors is used
+        err = abs(Tmid - (T[candidates] + T[candidates + 1]) / 2)
+        refine = numpy.any(
+            (err > atol + rtol * abs(Tmid)).reshape([len(tmid), -1]), axis=-1
+        )
+        err = numpy.max(err.reshape([len(tmid), -1]), axis=-1)
+        converged[candidates[~refine]] = True
+        if not numpy.any(refine):
+            break
+
+        split = numpy.argsort(-err[refine])[: max_num_times - len(t)]
+        i = candidates[refine][split]
+        order = numpy.argsort(i)
+        i = i[order]
+        t = numpy.insert(t, i + 1, tmid[refine][split][order])
+        T = numpy.insert(T, i + 1, Tmid[refine][split][order])
+        converged = numpy.insert(converged, i + 1, False)
+
+    return t, T
+
+
+temperature_rise_integration_methods = [
+    "quad",
+    "trap",
+    "simpson",
+    "gauss-legendre",
+    "step",
+    "superposition",
+]
+
+
+def compute_tissue_properties(config):
+    """
+    Loops through all tissue property config keys and checks if parameter
+    was given as a model instead of a specific value. If so, we call the model
+    and replace the parameter value with the result of model.
+    """
+    for layer in config.get("layers", []):
+        if "{wavelength}" in layer["mua"]:
+            if "laser/wavelength" not in config:
+                raise RuntimeError(
+                    "Config must include `laser/wavelength` to compute absorption coefficient."
+                )
+            mua = eval(
+                layer["mua"].format(wavelength="'" + config["/laser/wavelength"] + "'")
+            )
+            layer["mua"] = str(mua)  # config validators expect strings for quantities
+    return config
+
+
+#  _____                                   _                  ____  _
+# |_   _|__ _ __ ___  _ __   ___ _ __ __ _| |_ _   _ _ __ ___|  _ \(_)___  ___
+#   | |/ _ \ '_ ` _ \| '_ \ / _ \ '__/ _` | __| | | | '__/ _ \ |_) | / __|/ _ \
+#   | |  __/ | | | | | |_) |  __/ | | (_| | |_| |_| | | |  __/  _ <| \__ \  __/
+#   |_|\___|_| |_| |_| .__/ \___|_|  \__,_|\__|\__,_|_|  \___|_| \_\_|___/\___|
+#                    |_|
+
+
+class SensorConfig(config.BaseModel):
+    # a list of z and/or r values gives a grid of sensors
+    z: config.QuantityWithUnit("cm") | List[config.QuantityWithUnit("cm")]
+    r: config.QuantityWithUnit("cm") | List[config.QuantityWithUnit("cm")]
+
+
+def get_sensor_positions(config):
+    """
+    Return the z and r sensor positions (in cm) as arrays, and the shape of the sensor grid.
+
+    The grid has an axis for z and/or r if they are given as lists, so a single sensor has shape ().
+    """
+    shape = []
+    positions = []
+    for k in ["z", "r"]:
+        value = config[k]
+        if isinstance(value, fspathtree):
+            value = value.tree
+        if type(value) in [list, tuple]:
+            shape.append(len(value))
+        else:
+            value = [value]
+        positions.append(numpy.array([units.Q_(v).to("cm").magnitude for v in value]))
+    return positions[0], positions[1], tuple(shape)
+
+
+class TemperatureRiseConfig(config.BaseModel):
+    output_file: Path
+    output_config_file: Optional[Path] = None
+    output_file_format: Optional[Literal["txt"] | Literal["hdf5"]] = None
+    # number of significant digits written to txt output files (all digits by default)
+    output_file_digits: Optional[int] = Field(default=None, gt=0)
+    sensor: SensorConfig
+    method: Optional[
+        Literal["trap"]
+        | Literal["simpson"]
+        | Literal["gauss-legendre"]
+        | Literal["quad"]
+        | Literal["step"]
+        | Literal["superposition"]
+    ] = "quad"
+    marcum_q_backend: Optional[config.MarcumQBackend] = None
+    time_kernel_cache: config.TimeKernelCacheConfig = config.TimeKernelCacheConfig()
+
+    class TimeConfig(config.BaseModel):
+        max: config.QuantityWithUnit("s")
+        resolution: config.QuantityWithUnit("s")
+
+        class AdaptiveConfig(config.BaseModel):
+            rtol: float = 1e-3
+            atol: config.QuantityWithUnit("K") = Field(
+                default="1 uK", validate_default=True
+            )
+            max: int = 10000
+
+        adaptive: Optional[AdaptiveConfig] = None
+
+    time: Optional[TimeConfig | List[TimeConfig]] = None
+
+
+class TemperatureRiseCmdConfig(config.BaseModel):
+    temperature_rise: TemperatureRiseConfig
+    laser: config.LaserConfig
+    layers: list[config.LayerConfig]
+    thermal: config.ThermalPropertiesConfig
+
+
+class TemperatureRiseGreensFunctionProcess(parallel_jobs.JobProcessorBase):
+    """
+    For running green's functino calculations in a separate process.
+
+    This will return the temperature rise at each time, it will _not_ write to files.
+    If the job contains an `/output_buffer`, the temperature rise is written to the
+    shared array it holds (starting at `offset`) instead, and the number of time points
+    written is returned. The buffer can also give a range of (flattened) sensor indices
+    to compute with `sensor_start` and `sensor_stop`.
+
+    The exposure objects that are constructed for a job are cached (by the id of the
+    configuration without the times and output buffer), so jobs for other chunks of the
+    same configuration don't need to set them up again.
+    """
+
+    max_cached_exposures = 16
+
+    def __init__(self):
+        super().__init__()
+        self.exposures = {}
+
+    def get_exposure(self, config):
+        key = powerconf.utils.compute_id(
+            config,
+            lambda p: not str(p).startswith(
+                ("/temperature_rise/time/", "/output_buffer/", "/simulation/")
+            ),
+        )
+        if key in self.exposures:
+            # move to the end so that the least recently used exposure is evicted first
+            G = self.exposures.pop(key)
+        else:
+            # Greens function classes expect simulation config params to be in /simulation
+            config["/simulation"] = config["/temperature_rise"].tree
+            G = greens_functions.CWRetinaLaserExposure(config.tree)
+            while len(self.exposures) >= self.max_cached_exposures:
+                self.exposures.pop(next(iter(self.exposures)))
+        self.exposures[key] = G
+        return G
+
+    def run_job(self, config):
+        G = self.get_exposure(config)
+        zs, rs, shape = get_sensor_positions(config["/temperature_rise/sensor"])
+        sensors = range(
+            config.get("/output_buffer/sensor_start", 0),
+            config.get("/output_buffer/sensor_stop", len(zs) * len(rs)),
+        )
+
+        # times are already computed by the parent process, we just need to grab them.
+        t = config["/temperature_rise/time/ts"]
+        self.status.emit("Computing temperature rise")
+        # all sensors share the Green's function setup and time grid
+        T = numpy.zeros([len(t), len(sensors)])
+        for n, k in enumerate(sensors):
+            i, j = divmod(k, len(rs))
+            progress_connection = G.progress.connect(
+                lambda m, N, n=n: self.progress.emit(n * N + m, len(sensors) * N)
+            )
+            T[:, n] = G.temperature_rise(
+                zs[i], rs[j], t, method=config["/temperature_rise/method"]
+            )
+            progress_connection.disconnect()
+        self.status.emit("done")
+
+        output_buffer = config.get("/output_buffer/array", None)
+        if output_buffer is None:
+            return T.reshape([len(t), *shape])
+
+        offset = config["/output_buffer/offset"]
+        output = output_buffer.array.reshape([output_buffer.shape[0], -1])
+        output[offset : offset + len(t), sensors.start : sensors.stop] = T
+        del output
+        output_buffer.close()
+        return len(t)
+
+
+def compute_temperature_rise_jobs(config, t, num_jobs):
+    """
+    Generator that yields the jobs for TemperatureRiseGreensFunctionProcess needed to compute
+    the temperature rise for `config` at times `t` and returns the temperature rise.
+
+    The work is split into about `num_jobs` jobs over chunks of time and sensors.
+    The processes write their temperature rise directly into a shared array
+    so that the results don't need to be sent back through a pipe.
+    """
+    zs, rs, shape = get_sensor_positions(config["/temperature_rise/sensor"])
+    num_sensors = len(zs) * len(rs)
+    num_sensor_chunks = max(1, min(num_sensors, num_jobs))
+    num_time_chunks = max(1, min(len(t), math.ceil(num_jobs / num_sensor_chunks)))
+    with parallel_jobs.SharedArray([len(t), *shape]) as output_buffer:
+        jobs = []
+        offset = 0
+        for chunk in numpy.array_split(t, num_time_chunks):
+            for sensors in numpy.array_split(numpy.arange(num_sensors), num_sensor_chunks):
+                c = copy.deepcopy(config)
+                c["/temperature_rise/time"] = {"ts": chunk}
+                c["/output_buffer"] = {
+                    "array": output_buffer,
+                    "offset": offset,
+                    "sensor_start": int(sensors[0]),
+                    "sensor_stop": int(sensors[-1]) + 1,
+                }
+                jobs.append(c)
+            offset += len(chunk)
+
+        # each process returns the number of time points it wrote to the buffer
+        results = yield jobs
+
+        num_computed = sum(filter(lambda n: n is not None, results))
+        if len(t) * num_sensor_chunks != num_computed:  # sanity check...
+            raise RuntimeError(
+                f"Something went wrong. The number of computed temperature returned by subprocesses ({num_computed}) does not match the number of time points ({len(t)}) times the number of sensor chunks ({num_sensor_chunks})"
+            )
+        return output_buffer.array.copy()
+
+
+# parameters that don't change the temperature rise
+temperature_rise_result_cache_excluded_paths = [
+    "/temperature_rise/output_file",
+    "/temperature_rise/output_config_file",
+    "/temperature_rise/output_file_format",
+    "/temperature_rise/output_file_digits",
+    "/temperature_rise/marcum_q_backend",
+]
+
+
+# units of the datasets in temperature history hdf5 files
+temperature_history_units = {"retina-therm": "K", "t": "s", "z": "cm", "r": "cm"}
+
+
+def get_temperature_rise_output(config, batch_file=None):
+    """
+    Return a dict describing where the temperature rise for `config` is written.
+
+    The "file" is the output_file in the config, or `batch_file` if one is given. Results in a
+    batch file are written to a group named by the config id (the id used by the result cache),
+    so all of the configs in a batch can be written to the same (hdf5) file.
+    """
+    if batch_file is not None:
+        output = {
+            "file": Path(batch_file),
+            "format": "hdf5",
+            "group": get_result_cache_key(
+                config, temperature_rise_result_cache_excluded_paths
+            ),
+            "config_file": None,
+        }
+    else:
+        path = Path(config["/temperature_rise/output_file"])
+        config_file = config["/temperature_rise/output_config_file"]
+        output = {
+            "file": path,
+            "format": config["/temperature_rise/output_file_format"]
+            or path.suffix[1:]
+            or "txt",
+            "group": None,
+            "config_file": Path(config_file) if config_file is not None else None,
+        }
+
+    for path in [output["file"], output["config_file"]]:
+        if path is not None and path.parent != Path():
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+    return output
+
+
+def temperature_rise_output_exists(output):
+    if not output["file"].exists():
+        return False
+    if output["config_file"] is not None and not output["config_file"].exists():
+        return False
+    if output["group"] is not None:
+        with h5py.File(output["file"], "r") as f:
+            return output["group"] in f
+    return True
+
+
+def read_temperature_rise_output_config(output):
+    """
+    Return the config that an existing temperature rise output was computed with,
+    or None if it was not saved.
+    """
+    if output["format"] == "hdf5":
+        attrs = utils.read_attrs_from_file(output["file"], output["group"])
+        if "config" in attrs:
+            return fspathtree(yaml.safe_load(attrs["config"]))
+    if output["config_file"] is not None and output["config_file"].exists():
+        return fspathtree(yaml.safe_load(output["config_file"].read_text()))
+    return None
+
+
+def read_temperature_rise_times(output):
+    "Return the times in an existing temperature rise output."
+    if output["format"] == "hdf5":
+        with h5py.File(output["file"], "r") as f:
+            g = f if output["group"] is None else f[output["group"]]
+            if "t" in g:
+                return g["t"][:]
+            return g["retina-therm"][:, 0]
+    return utils.read_txt(output["file"], ndmin=2)[:, 0]
+
+
+def write_temperature_rise_output(config, output, t, T, append=False):
+    """
+    Write the temperature rise to its output, or append it to the end of the output
+    if `append` is True.
+
+    hdf5 outputs store the temperature and times (and sensor positions) in separate datasets
+    with their units, and the config in a "config" attribute. The config is also written to
+    the output_config_file if one is given.
+    """
+    fmt = output["format"]
+    config_text = yaml.dump(config.tree)
+    if output["config_file"] is not None:
+        output["config_file"].write_text(config_text)
+
+    if fmt == "hdf5":
+        # a grid of sensors is written as a 2D/3D dataset (time, [z], [r])
+        axes = {"t": t}
+        if T.ndim > 1 and not append:
+            zs, rs, shape = get_sensor_positions(config["/temperature_rise/sensor"])
+            axes.update({"z": zs, "r": rs})
+        if append:
+            utils.append_to_file(
+                output["file"],
+                T,
+                fmt,
+                axes=axes,
+                attrs={"config": config_text},
+                group=output["group"],
+            )
+        else:
+            utils.write_to_file(
+                output["file"],
+                T,
+                fmt,
+                axes=axes,
+                units=temperature_history_units,
+                attrs={"config": config_text},
+                group=output["group"],
+            )
+        return
+
+    # a grid of sensors is written as a column for each sensor (r varies fastest) in text files.
+    write = utils.append_to_file if append else utils.write_to_file
+    write(
+        output["file"],
+        numpy.c_[t, T.reshape([len(t), math.prod(T.shape[1:])])],
+        fmt,
+        digits=config["/temperature_rise/output_file_digits"],
+    )
+
+
+def get_temperature_rise_extension_times(config, output):
+    """
+    Return the times that need to be computed to extend an existing temperature rise
+    output to the time range in `config`.
+
+    Raises an exception if the output was computed for a different configuration or
+    the existing times are not the start of the times in `config`.
+    """
+    previous_config = read_temperature_rise_output_config(output)
+    if previous_config is None:
+        raise RuntimeError(
+            f"Cannot extend {output['file']}, the configuration it was computed with was not saved."
+        )
+    excluded_paths = temperature_rise_result_cache_excluded_paths + [
+        "/temperature_rise/time"
+    ]
+    if get_result_cache_key(previous_config, excluded_paths) != get_result_cache_key(
+        config, excluded_paths
+    ):
+        raise RuntimeError(
+            f"Cannot extend {output['file']}, it was computed with a different configuration."
+        )
+
+    time_config = config["/temperature_rise/time"]
+    if type(time_config.tree) == dict and time_config.get("adaptive", None):
+        raise RuntimeError("Cannot extend temperature rise with an adaptive time grid.")
+
+    t = compute_evaluation_times(time_config)
+    t_previous = read_temperature_rise_times(output)
+    if len(t_previous) > len(t) or not numpy.allclose(
+        t[: len(t_previous)], t_previous, rtol=1e-9, atol=0
+    ):
+        raise RuntimeError(
+            f"Cannot extend {output['file']}, the times in it are not the start of the configured times."
+        )
+    return t[len(t_previous) :]
+
+
+def temperature_rise_config_jobs(
+    config, num_jobs, cache=None, extend=False, batch_file=None, write=True
+):
+    """
+    Generator for running a full simulation with BatchJobController.run_job_generators.
+
+    It yields the jobs for TemperatureRiseGreensFunctionProcess to do the acual
+    calculations, collects the temperature rise and writes it to the
+    output_file given in the configuration (or a group in `batch_file`, see
+    get_temperature_rise_output). The times and temperature rise are returned,
+    unless the output already existed and was skipped or extended.
+    If `write` is False, nothing is written.
+
+    If a ResultCache is given, the temperature rise is taken from it when it has already
+    been computed for the same configuration (no jobs are yielded), and stored in it otherwise.
+
+    If `extend` is True and the output already exists, only the times after the last
+    time in the output are computed and they are appended to it.
+    """
+    output = get_temperature_rise_output(config, batch_file) if write else None
+    output_exists = output is not None and temperature_rise_output_exists(output)
+
+    if config.get("/skip_existing_outputs", False) and not extend:
+        if output_exists:
+            return
+
+    cached = None
+    if cache is not None:
+        cache_key = get_result_cache_key(
+            config, temperature_rise_result_cache_excluded_paths
+        )
+        cached = cache.get(cache_key)
+
+    if cached is None and extend and output_exists:
+        t = get_temperature_rise_extension_times(config, output)
+        T = numpy.zeros([0, *get_sensor_positions(config["/temperature_rise/sensor"])[2]])
+        if len(t) > 0:
+            T = yield from compute_temperature_rise_jobs(config, t, num_jobs)
+        write_temperature_rise_output(config, output, t, T, append=True)
+        return
+
+    if cached is not None:
+        t, T = cached["t"], cached["T"]
+    else:
+        time_config = config["/temperature_rise/time"]
+        if type(time_config.tree) == dict and time_config.get("adaptive", None):
+            times = iter_adaptive_evaluation_times(time_config)
+            try:
+                t = next(times)
+                while True:
+                    T = yield from compute_temperature_rise_jobs(config, t, num_jobs)
+                    t = times.send(T)
+            except StopIteration as e:
+                t, T = e.value
+        else:
+            t = compute_evaluation_times(time_config)
+            T = yield from compute_temperature_rise_jobs(config, t, num_jobs)
+
+        if cache is not None:
+            cache.put(cache_key, t=t, T=T)
+
+    if write:
+        write_temperature_rise_output(config, output, t, T)
+    return t, T
+
+
+def run_temperature_rise_configs(
+    controller, configs, quiet=False, cache=None, extend=False, batch_file=None
+):
+    """
+    Run temperature rise simulations for a list of configs on a BatchJobController
+    of TemperatureRiseGreensFunctionProcess and return the number of configs that failed.
+    Results are reused from (and stored in) `cache` if a ResultCache is given, and
+    existing outputs are extended if `extend` is True. All results are written to
+    `batch_file` if it is given (see temperature_rise_config_jobs).
+
+    All configs share the controller's pool of processes. Each config is split up into
+    chunks of time and sensors that are placed on one queue, so processes that finish
+    their work pick up chunks from any config that still has work.
+    """
+    num_jobs = len(controller.processes)
+    progress_display = (
+        parallel_jobs.SilentProgressDisplay()
+        if quiet
+        else parallel_jobs.ProgressDisplay()
+    )
+    progress_display.setup_new_bar("Total")
+    progress_display.set_total("Total", len(configs))
+    for i in range(num_jobs):
+        progress_display.setup_new_bar(f"Job-{i:03}")
+    for i in range(num_jobs):
+        progress_display.set_progress(f"Job-{i:03}", 0, 1)
+
+    progress_connection = controller.progress.connect(
+        lambda proc, prog: progress_display.set_progress(f"Job-{proc:03}", *prog)
+    )
+
+    def run_config(config):
+        yield from temperature_rise_config_jobs(
+            config, num_jobs, cache, extend, batch_file
+        )
+        progress_display.update_progress("Total")
+        return True
+
+    results = controller.run_job_generators(list(map(run_config, configs)))
+    progress_connection.disconnect()
+    return results.count(None)
+
+
+#  __  __       _ _   _       _                        _
+# |  \/  |_   _| | |_(_)_ __ | | ___       _ __  _   _| |___  ___
+# | |\/| | | | | | __| | '_ \| |/ _ \_____| '_ \| | | | / __|/ _ \
+# | |  | | |_| | | |_| | |_) | |  __/_____| |_) | |_| | \__ \  __/
+# |_|  |_|\__,_|_|\__|_| .__/|_|\___|     | .__/ \__,_|_|___/\___|
+#                      |_|                |_|
+
+
+class PulseConfig(config.BaseModel):
+    arrival_time: config.QuantityWithUnit("s")
+    duration: config.QuantityWithUnit("s")
+    scale: float
+
+
+class MultiplePulseConfig(config.BaseModel):
+    input_file: Path
+    input_file_format: Optional[Literal["txt"] | Literal["hdf5"] | Literal["rt"]] = None
+    output_file: Path
+    output_file_format: Optional[Literal["txt"] | Literal["hdf5"] | Literal["rt"]] = None
+    # number of significant digits written to txt output files (all digits by default)
+    output_file_digits: Optional[int] = Field(default=None, gt=0)
+    output_config_file: Path
+    pulses: list[PulseConfig]
+
+    class TimeConfig(config.BaseModel):
+        max: Optional[config.QuantityWithUnit("s")] = None
+        resolution: Optional[config.QuantityWithUnit("s")] = None
+
+    time: Optional[TimeConfig] = TimeConfig()
+
+
+class MultiplePulseCmdConfig(config.BaseModel):
+    multiple_pulse: MultiplePulseConfig
+
+
+# parameters that don't change the multiple-pulse temperature history
+multiple_pulse_result_cache_excluded_paths = [
+    "/multiple_pulse/input_file",
+    "/multiple_pulse/input_file_format",
+    "/multiple_pulse/output_file",
+    "/multiple_pulse/output_config_file",
+    "/multiple_pulse/output_file_format",
+    "/multiple_pulse/output_file_digits",
+]
+
+
+def compute_multiple_pulse_history(config, data, status=None, progress=None):
+    """
+    Build the multiple-pulse temperature history for `config` from the (single pulse)
+    temperature history in `data` (a two column array of times and temperatures) and return it
+    as a two column array. `status` and `progress` are optional signals to report to.
+    """
+    status = status or signals.Signal()
+    progress = progress or signals.Signal()
+
+    status.emit("Resampling temeprature history to regularized grid")
+    imax = len(data)
+    tmax = units.Q_(data[-1, 0], "s")
+    # if tmax is given in the config file, we want to trucate
+    # the input data to include the first time >= tmax
+    # this is an optimization reduces the size of the array we
+    # are working.
+    if config["/multiple_pulse/time/max"] is not None:
+        tmax = units.Q_(config["/multiple_pulse/time/max"])
+        if tmax.to("s").magnitude < data[0, 0]:
+            raise RuntimeError(
+                f"/tmax ({tmax}) cannot be less than first time in history ({data[0, 0]})."
+            )
+        if tmax.to("s").magnitude < data[-1, 0]:
+            while imax > 0 and data[imax - 1, 0] > tmax.to("s").magnitude:
+                imax -= 1
+    if imax < len(data):
+        data = data[:imax, :]
+
+    t = data[:, 0]
+    T = data[:, 1]
+
+    # regularize the time samples.
+    # need times to be uniformly spaced apart.
+    resolution = t[1] - t[0]
+    if config["/multiple_pulse/time/resolution"] is not None:
+        resolution = (
+            units.Q_(config["/multiple_pulse/time/resolution"]).to("s").magnitude
+        )
+
+    if not multi_pulse_builder.is_resolution(t, resolution):
+        tp = multi_pulse_builder.regularize_grid(t, resolution)
+        Tp = multi_pulse_builder.interpolate_temperature_history(t, T, tp)
+        t = tp
+        T = Tp
+        data = numpy.zeros([len(tp), 2])
+        data[:, 0] = t
+
+    builder = multi_pulse_builder.MultiPulseBuilder()
+    builder.progress.connect(lambda i, n: progress.emit(i, n))
+
+    builder.set_temperature_history(t, T)
+
+    for pulse in config["/multiple_pulse/pulses"]:
+        t1 = units.Q_(pulse["arrival_time"]).to("s")
+        t2 = t1 + units.Q_(pulse["duration"]).to("s")
+        scale = pulse["scale"]
+        builder.add_contribution(t1.magnitude, scale)
+        builder.add_contribution(t2.magnitude, -scale)
+
+    status.emit("Building temperature history")
+    Tmp = builder.build()
+
+    data[:, 1] = Tmp
+    return data
+
+
+class MultiplePulseProcess(parallel_jobs.JobProcessorBase):
+    def __init__(self, cache=None):
+        super().__init__()
+        self.cache = cache
+
+    def run_job(self, config):
+        # check if output paths exist
+        output_paths = {}
+        for k in ["output_file", "output_config_file"]:
+            filename = config["/multiple_pulse"][k]
+            output_paths[k + "_path"] = Path("/dev/stdout")
+            if filename is not None:
+                path = Path(filename)
+                output_paths[k + "_path"] = path
+                if path.parent != Path():
+                    path.parent.mkdir(parents=True, exist_ok=True)
+
+        if config.get("/skip_existing_outputs", False):
+            if all(map(lambda k: output_paths[k].exists(), output_paths)):
+                self.status.emit("Output files already exists. Skipping.")
+                return
+
+        input_file = Path(config["/multiple_pulse/input_file"])
+        if self.cache is not None:
+            cache_key = get_result_cache_key(
+                config, multiple_pulse_result_cache_excluded_paths, [input_file]
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.status.emit("Using cached temperature history")
+                self.write_output(config, output_paths, cached["data"])
+                return
+
+        self.status.emit(
+            "Loading base temperature history for building multiple-pulse history."
+        )
+        input_fmt = config["/multiple_pulse/input_file_format"] or input_file.suffix[1:]
+        if input_fmt == "rt" and config["/multiple_pulse/time/max"] is not None:
+            # only read the part of the history that we need
+            data = utils.TvstRtFile(input_file).read(
+                tmax=units.Q_(config["/multiple_pulse/time/max"]).to("s").magnitude
+            )
+        else:
+            data = utils.read_from_file(input_file, input_fmt)
+
+        data = compute_multiple_pulse_history(
+            config, data, status=self.status, progress=self.progress
+        )
+        if self.cache is not None:
+            self.cache.put(cache_key, data=data)
+
+        self.write_output(config, output_paths, data)
+
+    def write_output(self, config, output_paths, data):
+        self.status.emit("Writing temperature history")
+        write_multiple_pulse_output(
+            config,
+            data,
+            output_paths["output_file_path"],
+            output_paths["output_config_file_path"],
+        )
+        self.status.emit("done")
+
+
+def write_multiple_pulse_output(config, data, output_file, output_config_file=None):
+    """
+    Write the multiple-pulse temperature history in `data` (a two column array of times and
+    temperatures) to `output_file` and the config to `output_config_file` (if given).
+    """
+    output_file = Path(output_file)
+    if output_config_file is not None:
+        Path(output_config_file).write_text(yaml.dump(config.tree))
+    fmt = config["/multiple_pulse/output_file_format"]
+    if fmt is None:
+        fmt = output_file.suffix[1:]
+    if fmt is None:
+        fmt = "txt"
+
+    if fmt == "hdf5":
+        utils.write_to_file(
+            output_file,
+            data[:, 1],
+            fmt,
+            axes={"t": data[:, 0]},
+            units=temperature_history_units,
+            attrs={"config": yaml.dump(config.tree)},
+        )
+    else:
+        utils.write_to_file(
+            output_file,
+            data,
+            fmt,
+            digits=config["/multiple_pulse/output_file_digits"],
+        )
+
+
+class DamageConfig(config.BaseModel):
+    input_file: Path
+    input_file_format: Optional[Literal["txt"] | Literal["hdf5"] | Literal["rt"]] = None
+    output_config_file: Path
+    output_file: Path
+
+    A: config.QuantityWithUnit("1/s")
+    Ea: config.QuantityWithUnit("J/mol")
+    T0: config.QuantityWithUnit("K")
+
+
+class DamageCmdConfig(config.BaseModel):
+    damage: DamageConfig
+
+
+# parameters that don't change the damage threshold
+damage_result_cache_excluded_paths = [
+    "/damage/input_file",
+    "/damage/input_file_format",
+    "/damage/output_file",
+    "/damage/output_config_file",
+]
+
+
+class DamageProcess(parallel_jobs.JobProcessorBase):
+    """
+    Computes the damage threshold scale for the temperature history in a damage config
+    (see damage.compute_threshold_scale) and returns it.
+    """
+
+    def __init__(self, cache=None, write_threshold_profiles=False):
+        super().__init__()
+        self.cache = cache
+        self.write_threshold_profiles = write_threshold_profiles
+
+    def run_job(self, config):
+        output_paths = {}
+        for k in ["output_file", "output_config_file"]:
+            path = Path(config["/damage"][k])
+            output_paths[k + "_path"] = path
+            if path.parent != Path():
+                path.parent.mkdir(parents=True, exist_ok=True)
+
+        if config.get("/skip_existing_outputs", False):
+            if output_paths["output_file_path"].exists():
+                self.status.emit(
+                    f"Output file `{output_paths['output_file_path']}` already exists. Skipping."
+                )
+                self.status.emit("done")
+                return yaml.safe_load(output_paths["output_file_path"].read_text())[
+                    "scale"
+                ]
+
+        input_file = Path(config["/damage/input_file"])
+        input_fmt = config["/damage/input_file_format"] or input_file.suffix[1:]
+
+        scale = None
+        # threshold profiles are computed from the temperature history, so we have to load it anyway
+        if self.cache is not None and not self.write_threshold_profiles:
+            cache_key = get_result_cache_key(
+                config, damage_result_cache_excluded_paths, [input_file]
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.status.emit(f"Using cached damage threshold for `{input_file}`")
+                scale = float(cached["scale"])
+
+        if scale is None:
+            self.status.emit(f"Computing damage threshold for `{input_file}`")
+            data = utils.read_Tvst_from_file(input_file, input_fmt)
+            scale = compute_damage_threshold_scale(config, data)
+            if self.cache is not None:
+                self.cache.put(
+                    get_result_cache_key(
+                        config, damage_result_cache_excluded_paths, [input_file]
+                    ),
+                    scale=numpy.array(scale),
+                )
+
+            if self.write_threshold_profiles:
+                profile_file = input_file.with_name(
+                    f"{input_file.stem}-threshold_profile{input_file.suffix}"
+                )
+                utils.write_Tvst_to_file(
+                    numpy.c_[data[:, 0], scale * data[:, 1]], profile_file, input_fmt
+                )
+
+        write_damage_output(
+            config,
+            scale,
+            output_paths["output_file_path"],
+            output_paths["output_config_file_path"],
+        )
+        self.status.emit("done")
+        return scale
+
+
+def compute_damage_threshold_scale(config, data):
+    """
+    Return the damage threshold scale for the damage config in `config` and the temperature rise
+    history in `data` (a two column array of times and temperatures).
+    """
+    return damage.compute_threshold_scale(
+        data[:, 0],
+        data[:, 1],
+        units.Q_(config["/damage/A"]).to("1/s").magnitude,
+        units.Q_(config["/damage/Ea"]).to("J/mol").magnitude,
+        units.Q_(config["/damage/T0"]).to("K").magnitude,
+    )
+
+
+def write_damage_output(config, scale, output_file, output_config_file=None):
+    """
+    Write the damage threshold scale to `output_file` and the config to `output_config_file` (if given).
+    """
+    Path(output_file).write_text(f"scale: {scale}\n")
+    if output_config_file is not None:
+        Path(output_config_file).write_text(yaml.dump(config.tree))
+
+
+class TruncateTemperatureProfileProcess(parallel_jobs.JobProcessorBase):
+    def run_job(self, config):
+        file = Path(config["file"])
+        threshold = config["threshold"]
+        fmt = config.get("file_format", None) or file.suffix[1:]
+
+        self.status.emit(f"Truncating temperature_history in {file}.")
+
+        self.progress.emit(0, 4)
+        if fmt == "rt":
+            # rt files are memory-mapped and truncated in place
+            rt = utils.TvstRtFile(file)
+            T = rt.T
+        else:
+            data = utils.read_Tvst_from_file(file, fmt)
+            T = data[:, 1]
+        self.progress.emit(1, 4)
+        threshold = units.Q_(threshold)
+        if threshold.check(""):
+            Tmax = numpy.max(T)
+            Tthreshold = threshold.magnitude * Tmax
+        elif threshold.check("K"):
+            Tthreshold = threshold.magnitude
+
+        if T[-1] > Tthreshold:
+            self.status.emit(f"{file} already trucated...skipping.")
+            self.progress.emit(4, 4)
+            return
+
+        self.progress.emit(2, 4)
+        idx = numpy.argmax(numpy.flip(T) > Tthreshold)
+        N = len(T) - idx
+        self.progress.emit(3, 4)
+        self.status.emit(f"Saving trucated history back to {file}.")
+        if fmt == "rt":
+            del T, rt
+            os.truncate(file, 8 * (N + 1))
+        else:
+            utils.write_Tvst_to_file(data[:N, :], file, fmt)
+        self.progress.emit(4, 4)
+        self.status.emit(f"done")
+
+
+#  ____  _            _ _
+# |  _ \(_)_ __   ___| (_)_ __   ___
+# | |_) | | '_ \ / _ \ | | '_ \ / _ \
+# |  __/| | |_) |  __/ | | | | |  __/
+# |_|   |_| .__/ \___|_|_|_| |_|\___|
+#         |_|
+
+# the stages of a pipeline, in the order they run
+pipeline_stages = {
+    "temperature_rise": {
+        "model": TemperatureRiseCmdConfig,
+        "excluded_paths": temperature_rise_result_cache_excluded_paths,
+    },
+    "multiple_pulse": {
+        "model": MultiplePulseCmdConfig,
+        "excluded_paths": multiple_pulse_result_cache_excluded_paths,
+    },
+    "damage": {
+        "model": DamageCmdConfig,
+        "excluded_paths": damage_result_cache_excluded_paths,
+    },
+}
+
+
+def get_pipeline_stages(config):
+    """
+    Return the stages (temperature_rise, multiple_pulse, and damage) in a (rendered) config,
+    in the order they run, as a list of dicts with the stage name and its validated config.
+
+    The input_file of a stage defaults to the output_file of the stage before it.
+    """
+    stages = []
+    for name, stage in pipeline_stages.items():
+        if config.get(f"/{name}", None) is None:
+            continue
+        tree = copy.deepcopy(config.tree)
+        if len(stages) > 0 and tree[name].get("input_file", None) is None:
+            tree[name]["input_file"] = str(
+                stages[-1]["config"][f"/{stages[-1]['name']}/output_file"]
+            )
+        stage_config = fspathtree(stage["model"](**tree).model_dump())
+        stages.append({"name": name, "config": stage_config})
+    return stages
+
+
+def get_pipeline_stage_key(stage, input_key=None, write=["damage"]):
+    """
+    Return the key that identifies the result of a pipeline stage.
+
+    `input_key` is the key of the stage that computes the stage's input, if it is computed
+    in the pipeline. The key does not depend on the files that are passed between stages, or
+    on the output files of stages that are not in `write`, so stages with the same key
+    compute (and write) the same thing.
+    """
+    name = stage["name"]
+    input_paths = [f"/{name}/input_file", f"/{name}/input_file_format"]
+    excluded_paths = pipeline_stages[name]["excluded_paths"]
+    if name in write:
+        excluded_paths = list(filter(lambda p: p in input_paths, excluded_paths))
+    if input_key is None:
+        # the input is read from a file
+        excluded_paths = list(filter(lambda p: p not in input_paths, excluded_paths))
+    key = get_result_cache_key(stage["config"], excluded_paths)
+    if input_key is not None:
+        key = hashlib.md5((input_key + key).encode("utf-8")).hexdigest()
+    return key
+
+
+def build_pipeline_graph(configs, write=["damage"]):
+    """
+    Return the dependency graph of the stages in a batch of configs as a dict of nodes by key
+    (see get_pipeline_stage_key).
+
+    A stage depends on the stage (in any of the configs) whose output_file is its input_file.
+    Each node has the stage's name and config, the key of the node it depends on as "input"
+    (None if its input is read from a file), and the keys of the nodes that depend on it as
+    "children". Stages that are the same in several configs, i.e. a temperature rise
+    that several multiple-pulse configs use as input, are only included once. Stages that
+    don't write anything or lead to a stage that does are left out.
+    """
+    stages = []
+    producers = {}
+    for config in configs:
+        for stage in get_pipeline_stages(config):
+            output_file = os.path.normpath(
+                stage["config"][f"/{stage['name']}/output_file"]
+            )
+            producers.setdefault(output_file, []).append(len(stages))
+            stages.append(stage)
+
+    keys = [None] * len(stages)
+
+    def get_key(i, visiting=()):
+        if keys[i] is not None:
+            return keys[i]
+        if i in visiting:
+            raise RuntimeError(
+                f"The {stages[i]['name']} stage depends on its own output."
+            )
+        input_key = None
+        name = stages[i]["name"]
+        if name != "temperature_rise":
+            input_file = os.path.normpath(stages[i]["config"][f"/{name}/input_file"])
+            if input_file in producers:
+                input_keys = set(
+                    get_key(j, visiting + (i,)) for j in producers[input_file]
+                )
+                if len(input_keys) > 1:
+                    raise RuntimeError(
+                        f"The input file '{input_file}' is written by more than one stage with different configurations."
+                    )
+                input_key = input_keys.pop()
+        keys[i] = get_pipeline_stage_key(stages[i], input_key, write)
+        stages[i]["input"] = input_key
+        return keys[i]
+
+    nodes = {}
+    for i, stage in enumerate(stages):
+        key = get_key(i)
+        if key not in nodes:
+            nodes[key] = {
+                "name": stage["name"],
+                "config": stage["config"].tree,
+                "key": key,
+                "input": stage["input"],
+                "children": [],
+            }
+    for node in nodes.values():
+        if node["input"] is not None:
+            nodes[node["input"]]["children"].append(node["key"])
+
+    def is_needed(key):
+        node = nodes[key]
+        return node["name"] in write or any(map(is_needed, node["children"]))
+
+    nodes = {key: node for key, node in nodes.items() if is_needed(key)}
+    for node in nodes.values():
+        node["children"] = list(filter(lambda k: k in nodes, node["children"]))
+    return nodes
+
+
+def get_pipeline_node_outputs(node):
+    "Return the output files for a pipeline node."
+    config = fspathtree(node["config"])
+    if node["name"] == "temperature_rise":
+        output = get_temperature_rise_output(config)
+        return list(filter(None, [output["file"], output["config_file"]]))
+    return [
+        Path(config[f"/{node['name']}/output_file"]),
+        Path(config[f"/{node['name']}/output_config_file"]),
+    ]
+
+
+def pipeline_node_is_done(nodes, key, write):
+    """
+    Return True if the outputs of a pipeline node and all of the nodes that depend on it
+    that are in `write` already exist.
+    """
+    node = nodes[key]
+    if node["name"] in write:
+        if not all(map(lambda p: p.exists(), get_pipeline_node_outputs(node))):
+            return False
+    return all(
+        map(lambda k: pipeline_node_is_done(nodes, k, write), node["children"])
+    )
+
+
+def run_pipeline_node(node, data, write, status=None, progress=None):
+    """
+    Run a multiple-pulse or damage pipeline node on the temperature history in `data`
+    (a two column array of times and temperatures), write its outputs if it is in `write`,
+    and return a dict with the multiple-pulse temperature history as "data" or the damage
+    threshold scale as "scale".
+    """
+    status = status or signals.Signal()
+    config = fspathtree(node["config"])
+    result = {"data": None, "scale": None}
+
+    if node["name"] in write:
+        for path in get_pipeline_node_outputs(node):
+            if path.parent != Path():
+                path.parent.mkdir(parents=True, exist_ok=True)
+
+    if node["name"] == "multiple_pulse":
+        result["data"] = compute_multiple_pulse_history(config, data, status, progress)
+        if "multiple_pulse" in write:
+            status.emit("Writing temperature history")
+            write_multiple_pulse_output(
+                config,
+                result["data"],
+                config["/multiple_pulse/output_file"],
+                config["/multiple_pulse/output_config_file"],
+            )
+    elif node["name"] == "damage":
+        status.emit("Computing damage threshold")
+        result["scale"] = compute_damage_threshold_scale(config, data)
+        if "damage" in write:
+            write_damage_output(
+                config,
+                result["scale"],
+                config["/damage/output_file"],
+                config["/damage/output_config_file"],
+            )
+    else:
+        raise RuntimeError(f"Unknown pipeline stage '{node['name']}'.")
+    return result
+
+
+class PipelineProcess(TemperatureRiseGreensFunctionProcess):
+    """
+    Runs the jobs for a pipeline of temperature rise, multiple-pulse, and damage stages.
+
+    Temperature rise jobs are run like TemperatureRiseGreensFunctionProcess does.
+    A job with a `/pipeline/node` runs that (multiple-pulse or damage) node (see
+    run_pipeline_node) on the temperature history in the `/pipeline/input` SharedArray,
+    or the node's input file if there isn't one. If `/pipeline/return_data` is True,
+    the multiple-pulse temperature history is returned in a new SharedArray.
+    """
+
+    def run_job(self, config):
+        if config.get("/pipeline", None) is None:
+            return super().run_job(config)
+
+        node = config["/pipeline/node"].tree
+        input_buffer = config.get("/pipeline/input", None)
+        if input_buffer is None:
+            input_file = Path(node["config"][node["name"]]["input_file"])
+            input_fmt = (
+                node["config"][node["name"]]["input_file_format"]
+                or input_file.suffix[1:]
+            )
+            self.status.emit(f"Loading temperature history from `{input_file}`")
+            data = utils.read_Tvst_from_file(input_file, input_fmt)
+        else:
+            data = input_buffer.array.copy()
+            input_buffer.close()
+
+        result = run_pipeline_node(
+            node, data, config["/pipeline/write"].tree, self.status, self.progress
+        )
+        if result["data"] is not None:
+            result["data"] = (
+                parallel_jobs.SharedArray.from_array(result["data"])
+                if config["/pipeline/return_data"]
+                else None
+            )
+        self.status.emit("done")
+        return result
+
+
+def pipeline_node_jobs(
+    nodes,
+    key,
+    input_result,
+    num_jobs,
+    write=["damage"],
+    skip_existing_outputs=False,
+    cache=None,
+):
+    """
+    Generator for running a pipeline node (see build_pipeline_graph) with
+    BatchJobController.run_job_graph on PipelineProcess's.
+
+    `input_result` is the result of the node it depends on. The result is returned as a dict
+    with the temperature history that the nodes that depend on this one need in a
+    SharedArray as "data" (the caller should unlink it when they are done) and the damage
+    threshold scale as "scale".
+
+    A temperature rise is computed (or taken from `cache`) on all of the processes. The
+    other stages are run as a single job that gets its input through shared memory instead of
+    a file. Stages after the temperature rise are not cached, since their input is not in a file.
+    """
+    node = nodes[key]
+    result = {"data": None, "scale": None}
+    if skip_existing_outputs and pipeline_node_is_done(nodes, key, write):
+        return result
+
+    if node["name"] != "temperature_rise":
+        job = {
+            "pipeline": {
+                "node": {k: node[k] for k in ["name", "config", "key"]},
+                "input": input_result["data"] if input_result is not None else None,
+                "write": list(write),
+                "return_data": len(node["children"]) > 0,
+            }
+        }
+        results = yield [fspathtree(job)]
+        if results[0] is None:
+            raise RuntimeError(f"The {node['name']} stage failed.")
+        return results[0]
+
+    config = fspathtree(node["config"])
+    output = get_temperature_rise_output(config) if skip_existing_outputs else None
+    if output is not None and temperature_rise_output_exists(output):
+        # the stages after this one still need the temperature rise
+        if len(node["children"]) == 0:
+            return result
+        data = utils.read_from_file(
+            output["file"], output["format"], output["group"]
+        )
+    else:
+        t, T = yield from temperature_rise_config_jobs(
+            config, num_jobs, cache, write="temperature_rise" in write
+        )
+        if len(node["children"]) == 0:
+            return result
+        T = T.reshape([len(t), -1])
+        if T.shape[1] != 1:
+            raise RuntimeError(
+                "Multiple-pulse and damage stages can only be run on the temperature rise for a single sensor."
+            )
+        data = numpy.c_[t, T[:, 0]]
+
+    result["data"] = parallel_jobs.SharedArray.from_array(data)
+    return result
+
+
+def run_pipelines(
+    controller,
+    nodes,
+    write=["damage"],
+    quiet=False,
+    skip_existing_outputs=False,
+    cache=None,
+):
+    """
+    Run a pipeline graph (see build_pipeline_graph) on a BatchJobController of PipelineProcess
+    and return the number of nodes that failed or were not run because a node they depend on
+    failed.
+
+    Only the outputs of the stages in `write` (which should be the same as the graph was
+    built with) are written. Each node is started as soon as the node it depends on is
+    finished, and the jobs for all of the running nodes share the controller's pool of
+    processes, so there is no barrier between stages. The temperature history computed by a
+    node is kept in shared memory until all of the nodes that depend on it are finished.
+    """
+    num_jobs = len(controller.processes)
+    progress_display = (
+        parallel_jobs.SilentProgressDisplay()
+        if quiet
+        else parallel_jobs.ProgressDisplay()
+    )
+    progress_display.setup_new_bar("Total")
+    progress_display.set_total("Total", len(nodes))
+    for i in range(num_jobs):
+        progress_display.setup_new_bar(f"Job-{i:03}")
+    for i in range(num_jobs):
+        progress_display.set_progress(f"Job-{i:03}", 0, 1)
+
+    progress_connection = controller.progress.connect(
+        lambda proc, prog: progress_display.set_progress(f"Job-{proc:03}", *prog)
+    )
+
+    results = {}
+    # the number of nodes that still need the result of each node
+    num_users = {key: len(node["children"]) for key, node in nodes.items()}
+
+    def release(key):
+        num_users[key] -= 1
+        if num_users[key] == 0 and results.get(key, None) is not None:
+            if results[key]["data"] is not None:
+                results[key]["data"].unlink()
+
+    def run_node(key):
+        def run(*input_results):
+            try:
+                result = yield from pipeline_node_jobs(
+                    nodes,
+                    key,
+                    input_results[0] if len(input_results) > 0 else None,
+                    num_jobs,
+                    write,
+                    skip_existing_outputs,
+                    cache,
+                )
+            finally:
+                if nodes[key]["input"] is not None:
+                    release(nodes[key]["input"])
+            results[key] = result
+            num_users[key] += 1
+            release(key)
+            progress_display.update_progress("Total")
+            return result
+
+        return run
+
+    try:
+        returns = controller.run_job_graph(
+            {key: run_node(key) for key in nodes},
+            {
+                key: [node["input"]]
+                for key, node in nodes.items()
+                if node["input"] is not None
+            },
+        )
+    finally:
+        progress_connection.disconnect()
+        for result in results.values():
+            if result["data"] is not None:
+                result["data"].unlink()
+    return list(returns.values()).count(None)
@@ -9,10 +9,7 @@ from .signals import Signal
 
 def is_uniform_spaced(x: numpy.array, tol: float = 1e-10):
     dx = x[1] - x[0]
-    for i in range(len(x) - 1):
-        if (x[i + 1] - x[i]) - dx > tol:
-            return False
-    return True
+    return not numpy.any(numpy.diff(x) - dx > tol)
 
 
 def is_resolution(x: numpy.array, res: float, tol: float = 1e-10):
@@ -27,9 +24,7 @@ def regularize_grid(t, dt=None):
     tmax = t[-1]
     tmin = t[0]
     N = int((tmax - tmin) / dt) + 1
-    tp = numpy.zeros([N])
-    for i in range(N):
-        tp[i] = tmin + i * dt
+    tp = tmin + numpy.arange(N) * dt
 
     return tp
 
@@ -39,10 +34,9 @@ def interpolate_temperature_history(t, T, tp):
     Tp = numpy.zeros([len(tp)])
 
     interp = scipy.interpolate.PchipInterpolator(t, T)
-    for i in range(len(tp)):
-        if tp[i] < t[0] or tp[i] > t[-1]:
-            continue
-        Tp[i] = interp(tp[i])
+    # times outside of the history are left at zero
+    inside = (tp >= t[0]) & (tp <= t[-1])
+    Tp[inside] = interp(tp[inside])
 
     return Tp
 
@@ -73,7 +67,29 @@ def find_index_for_time(ts: numpy.array, t: float, tol: float = 1e-6) -> int:
     return None
 
 
+def find_indices_for_times(ts: numpy.array, t: numpy.array) -> numpy.array:
+    """
+    Return the index of the time in the (sorted) array of times `ts` that is closest to each
+    time in `t`. Ties go to the earlier time, like find_index_for_time.
+    """
+    t = numpy.asarray(t, dtype=float)
+    i = numpy.clip(numpy.searchsorted(ts, t), 1, max(len(ts) - 1, 1))
+    return numpy.where(t - ts[i - 1] <= ts[i] - t, i - 1, i)
+
+
 class MultiPulseBuilder:
+    """
+    Builds a multiple-pulse temperature history by adding up scaled and shifted copies of a
+    (single pulse) temperature rise history.
+
+    build() can shift and add the history for each contribution ("direct"), or convolve the
+    history with a train of weighted impulses at the contribution times using FFTs ("fft",
+    see build_fft). The direct method is faster when there are only a few contributions,
+    and "auto" picks the direct method when there are fewer than `max_direct_contributions`.
+    """
+
+    max_direct_contributions = 100
+
     def __init__(self):
         self.T0 = 0
         self.dT = None
@@ -111,7 +127,35 @@ class MultiPulseBuilder:
         self.arrival_times = []
         self.scales = []
 
-    def build(self) -> numpy.array:
+    def get_impulse_train(self) -> numpy.array:
+        """
+        Return the sum of the contribution scales at each time in the temperature history.
+        Each contribution is placed at the time closest to its arrival time, and contributions
+        that arrive after the end of the history are dropped.
+        """
+        t = self.t
+        if len(t) < 2:
+            raise RuntimeError("Temperature history only contains 1 point.")
+
+        arrival_times = numpy.asarray(self.arrival_times, dtype=float)
+        scales = numpy.asarray(self.scales, dtype=float)
+        arrived = arrival_times <= t[-1]
+        arrival_times = arrival_times[arrived]
+        scales = scales[arrived]
+        if numpy.any(arrival_times < t[0]):
+            raise RuntimeError(
+                f"Could not find a time point in the single-pulse exposure that was close enough to {arrival_times[arrival_times < t[0]][0]}. Contributions can't arrive before the start of the temperature history ({t[0]})."
+            )
+
+        offsets = find_indices_for_times(t, arrival_times)
+        return numpy.bincount(offsets, weights=scales, minlength=len(t))
+
+    def build(self, method: str = "auto") -> numpy.array:
+        """
+        Return the multiple-pulse temperature history at the times of the temperature history.
+
+        `method` is "direct", "fft", or "auto" (see MultiPulseBuilder).
+        """
         t = self.t
 
         if not is_uniform_spaced(t):
@@ -119,29 +163,49 @@ class MultiPulseBuilder:
                 "Currently only support uniform spacing of the temperature history."
             )
 
-        T = numpy.zeros([len(t)])
-
-        N = len(self.arrival_times)
-        if len(t) < 2:
-            raise RuntimeError("Temperature history only contains 1 point.")
+        impulses = self.get_impulse_train()
+        offsets = numpy.flatnonzero(impulses)
+        if method == "auto":
+            method = (
+                "direct" if len(offsets) < self.max_direct_contributions else "fft"
+            )
 
-        dt = t[1] - t[0]
-        for i in range(N):
-            if self.arrival_times[i] > t[-1]:
-                continue
-
-            offset = find_index_for_time(t, self.arrival_times[i], dt)
-            if offset is None:
-                raise RuntimeError(
-                    f"Could not find a time point in the single-pulse exposure that was close enough to {self.arrival_times[i]}. This could mean your input data is too low resolution for the pulse duration / pulse period. t = {t}"
-                )
-
-            if offset != 0:
-                T[offset:] += self.scales[i] * self.dT[:-offset]
-            else:
-                T += self.scales[i] * self.dT
-            self.progress.emit(i, N)
+        if method == "direct":
+            T = numpy.zeros([len(t)])
+            for i, offset in enumerate(offsets):
+                if offset != 0:
+                    T[offset:] += impulses[offset] * self.dT[:-offset]
+                else:
+                    T += impulses[offset] * self.dT
+                self.progress.emit(i, len(offsets))
+        elif method == "fft":
+            T = self.build_fft(impulses)
+        else:
+            raise RuntimeError(f"Unknown multiple-pulse build method '{method}'.")
 
         T += self.T0
 
         return T
+
+    def build_fft(self, impulses: numpy.array) -> numpy.array:
+        """
+        Return the temperature rise for a train of impulses (see get_impulse_train), computed
+        by convolving it with the temperature rise history.
+
+        Only the part of the train between the first and last impulse is convolved, using
+        overlap-add when it is much shorter than the history (scipy.signal.oaconvolve), so this
+        takes O(N log N) time for N samples, no matter how many contributions there are.
+        """
+        N = len(impulses)
+        T = numpy.zeros([N])
+        offsets = numpy.flatnonzero(impulses)
+        if len(offsets) == 0:
+            return T
+        first = offsets[0]
+        last = offsets[-1]
+        self.progress.emit(0, 1)
+        T[first:] = scipy.signal.oaconvolve(
+            impulses[first : last + 1], self.dT[: N - first]
+        )[: N - first]
+        self.progress.emit(1, 1)
+        return T
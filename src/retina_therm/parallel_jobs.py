@@ -5,9 +5,12 @@ import os
 import sys
 import time
 import traceback
+import typing
 from collections import deque
+from multiprocessing import connection, resource_tracker, shared_memory
 from typing import Any, Literal
 
+import numpy
 from pydantic import BaseModel
 
 from .progress_display import *
@@ -32,13 +35,113 @@ class JobProcessorMessageModel(BaseModel):
     payload: Any
 
 
+message_types = typing.get_args(JobProcessorMessageModel.model_fields["type"].annotation)
+
+
 def mkmsg(t, p):
     "Create a message of type `t` with payload `p`"
-    msg = JobProcessorMessageModel(type=t, payload=p)
-    # return json.loads(msg.model_dump_json())
+    if t not in message_types:
+        raise RuntimeError(f"Unknown message type '{t}'")
     return {"type": t, "payload": p}
 
 
+def validate_message(msg):
+    """
+    Check that `msg` has the schema described by JobProcessorMessageModel and return it.
+
+    This is called for every message that is received, so it only does the cheap checks
+    instead of building a model.
+    """
+    if type(msg) is not dict or "payload" not in msg:
+        raise RuntimeError(f"Invalid message, msg: {msg}")
+    if msg.get("type", None) not in message_types:
+        raise RuntimeError(f"Unknown message type, msg: {msg}")
+    return msg
+
+
+def _attach_shared_memory(name):
+    "Attach to an existing shared memory block without taking ownership of it."
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # older versions always register the block with the resource tracker. processes started
+    # by JobProcessorBase share their parent's tracker, so this does not cause the block
+    # to be removed when the child exits.
+    return shared_memory.SharedMemory(name=name)
+
+
+class SharedArray:
+    """
+    A numpy array stored in a shared memory block that can be sent between processes.
+
+    Only a small descriptor (the block name, shape, and dtype) is pickled, so a SharedArray
+    can be passed in a job or returned as a result without copying the data through the pipe.
+    The receiving process attaches to the same block, so anything written to `.array` in a
+    child is visible in the parent.
+
+    The process that is done with the block last should call `unlink()` to free it. This is
+    usually the process that created it, which can use the instance as a context manager.
+    Other processes should call `close()` when they no longer need to access the data.
+    """
+
+    def __init__(self, shape, dtype=float):
+        self.shape = tuple(int(n) for n in numpy.atleast_1d(shape))
+        self.dtype = numpy.dtype(dtype)
+        nbytes = int(numpy.prod(self.shape)) * self.dtype.itemsize
+        # zero sized blocks are not allowed
+        self._shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        self.array = numpy.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    @classmethod
+    def from_array(cls, array):
+        "Create a shared array containing a copy of `array`."
+        array = numpy.asarray(array)
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __getstate__(self):
+        return {"name": self._shm.name, "shape": self.shape, "dtype": self.dtype.str}
+
+    def __setstate__(self, state):
+        self.shape = tuple(state["shape"])
+        self.dtype = numpy.dtype(state["dtype"])
+        self._shm = _attach_shared_memory(state["name"])
+        self.array = numpy.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def close(self):
+        """
+        Detach from the shared memory block. `.array` can not be used after this, and any
+        views of it must be deleted first.
+        """
+        if self._shm is not None:
+            self.array = None
+            self._shm.close()
+            self._shm = None
+
+    def unlink(self):
+        "Detach from and free the shared memory block."
+        if self._shm is not None:
+            self._shm.unlink()
+            self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        self.unlink()
+        return False
+
+
 class JobProcessorBase(multiprocessing.Process):
     """
     A class for implementing work that will run in a separate process.
@@ -59,6 +162,9 @@ class JobProcessorBase(multiprocessing.Process):
             'progress': sent back by child to indicate progress
             'status': sent back by child to indicate status
 
+    Large numpy results can be returned without pickling the data by writing them to a
+    `SharedArray` (either one sent with the job or one created by the child).
+
     """
 
     def __init__(self):
@@ -71,6 +177,12 @@ class JobProcessorBase(multiprocessing.Process):
     def run_job(self, config):
         raise RuntimeError("run_job(...) not implemented")
 
+    def start(self):
+        # start the resource tracker before forking so that shared memory blocks
+        # attached by the child are tracked by the same process as the parent.
+        resource_tracker.ensure_running()
+        super().start()
+
     def msg_send(self, msg):
         link = self.parent_link if os.getpid() == self.parent_pid else self.child_link
         link.send(msg)
@@ -98,22 +210,23 @@ class JobProcessorBase(multiprocessing.Process):
         while running:
             msg = self.msg_recv()
             try:
-                msg = JobProcessorMessageModel(**msg)
+                msg = validate_message(msg)
             except Exception as e:
                 self.msg_send(mkmsg("error", str(e)))
                 continue
+            msg_type = msg["type"]
             # legacy message for shutting down
-            if msg.type == "call":
-                if msg.payload == "stop":
-                    msg.type = "shutdown"
+            if msg_type == "call":
+                if isinstance(msg["payload"], str) and msg["payload"] == "stop":
+                    msg_type = "shutdown"
 
-            if msg.type == "shutdown":
+            if msg_type == "shutdown":
                 running = False
                 self._stop()
 
-            if msg.type == "call":
+            if msg_type == "call":
                 try:
-                    result = self.run_job(msg.payload)
+                    result = self.run_job(msg["payload"])
                     self.msg_send(mkmsg("result", result))
                     self.msg_send(mkmsg("reply", "finished"))
                 except Exception as e:
@@ -180,39 +293,168 @@ class BatchJobController:
         """
         Run jobs in subprocesses. Results will be returned in order (in a list) even though
         the jobs do not have to finish in order.
+
+        This blocks until a process sends a message, so waiting for results does not use any CPU.
+        """
+
+        def batch():
+            return (yield jobs)
+
+        return self.run_job_generators([batch()])[0]
+
+    def run_job_generators(self, generators):
+        """
+        Run jobs that are produced by generators in subprocesses.
+
+        Each generator yields a list of jobs and is sent the list of their results (in order)
+        once they have all finished. It can then yield more jobs or return. Jobs from all
+        generators are placed on a single queue, and each process takes the next job from the
+        queue as soon as it is idle, so a generator with a lot of work does not leave processes
+        sitting idle while the others wait on it.
+
+        Returns a list with the value returned by each generator. If a generator raises an
+        exception, it is printed and its return value is None.
         """
-        # running is a list that stores the job number running in each process. -1 means "no job running".
-        # results is a list of results returned by the processes that run a job. it is "ordered".
-        running = [-1] * len(self.processes)
-        results = [None] * len(jobs)
-        # if no jobs are running, then all elements of the running list will be -1
-        # and sum(running) will be -(number of processes)
-        while len(jobs) > 0 or sum(running) > -len(self.processes):
+        returns = self.run_job_graph(
+            {g: (lambda gen=gen: gen) for g, gen in enumerate(generators)}
+        )
+        return [returns[g] for g in range(len(generators))]
+
+    def run_job_graph(self, tasks, dependencies={}):
+        """
+        Run jobs that are produced by a graph of generators in subprocesses.
+
+        `tasks` is a dict of functions that create the generators (see run_job_generators),
+        and `dependencies` gives the names of the tasks that each task depends on. A task's
+        function is called with the values returned by its dependencies (in order) as soon as
+        they have all finished, and its jobs share the queue with the jobs of all of the other
+        running tasks, so there is no barrier between the "levels" of the graph.
+
+        Returns a dict with the value returned by each task. If a task raises an exception,
+        it is printed and its return value is None, and the tasks that depend on it are not run
+        (their return values are None too).
+        """
+        for name, deps in dependencies.items():
+            for dep in deps:
+                if dep not in tasks:
+                    raise RuntimeError(f"Task '{name}' depends on unknown task '{dep}'.")
+
+        queue = deque()
+        generators = {}
+        # the number of jobs that have not finished yet and their results for each generator
+        num_pending = {}
+        batch_results = {}
+        returns = {}
+        # the tasks that are waiting on each task
+        dependents = {name: [] for name in tasks}
+        num_waiting_on = {}
+        for name in tasks:
+            deps = dependencies.get(name, [])
+            num_waiting_on[name] = len(deps)
+            for dep in deps:
+                dependents[dep].append(name)
+
+        def start(g):
+            deps = dependencies.get(g, [])
+            try:
+                generators[g] = tasks[g](*[returns[dep] for dep in deps])
+            except Exception as e:
+                print("There was an exception while creating jobs")
+                print(traceback.format_exc())
+                done(g, None, True)
+                return
+            advance(g, None)
+
+        def done(g, value, error=False):
+            returns[g] = value
+            for d in dependents[g]:
+                num_waiting_on[d] -= 1
+                if error:
+                    # don't run anything that depends on a task that failed
+                    num_waiting_on[d] = -1
+                    if d not in returns:
+                        done(d, None, True)
+                elif num_waiting_on[d] == 0:
+                    start(d)
+
+        def advance(g, value):
+            # get the next batch of jobs from generator g
+            while True:
+                try:
+                    jobs = list(generators[g].send(value))
+                except StopIteration as e:
+                    done(g, e.value)
+                    return
+                except Exception as e:
+                    print("There was an exception while creating jobs")
+                    print(traceback.format_exc())
+                    done(g, None, True)
+                    return
+                if len(jobs) > 0:
+                    break
+                value = []
+            num_pending[g] = len(jobs)
+            batch_results[g] = [None] * len(jobs)
+            queue.extend((g, j, job) for j, job in enumerate(jobs))
+
+        def finish(i):
+            g, j = running[i]
+            running[i] = None
+            num_pending[g] -= 1
+            if num_pending[g] == 0:
+                advance(g, batch_results[g])
+
+        for g in tasks:
+            if num_waiting_on[g] == 0 and g not in returns:
+                start(g)
+
+        # running stores the (generator, job) indices of the job running in each process.
+        # None means "no job running".
+        running = [None] * len(self.processes)
+        links = {p.parent_link: i for i, p in enumerate(self.processes)}
+        while True:
             for i, p in enumerate(self.processes):
-                if len(jobs) > 0 and running[i] < 0:
+                if len(queue) > 0 and running[i] is None:
                     # there is a job to run and this process is not running anything
-                    p.msg_send(mkmsg("call", jobs.pop()))
-                    running[i] = len(jobs)
-                if p.msg_poll():
-                    msg = p.msg_recv()
-                    msg = JobProcessorMessageModel(**msg)
-                    if msg.type == "result":
-                        results[running[i]] = msg.payload
-                    elif msg.type == "reply":
-                        if msg.payload == "finished":
-                            running[i] = -1
-                    elif msg.type == "progress":
-                        self.progress.emit(i, msg.payload)
-                    elif msg.type == "status":
-                        self.status.emit(i, msg.payload)
-                    elif msg.type == "error":
-                        print("There was an error in the in the child process")
-                        print(msg.payload)
-                        running[i] = -1
-                    elif msg.type == "exception":
-                        print("There was an exception in the in the child process")
-                        print(msg.payload)
-                        running[i] = -1
-                    else:
-                        raise RuntimeError(f"Unknown message type, msg: {msg}")
-        return results
+                    g, j, job = queue.popleft()
+                    p.msg_send(mkmsg("call", job))
+                    running[i] = (g, j)
+            busy = [p.parent_link for i, p in enumerate(self.processes) if running[i]]
+            if len(busy) == 0:
+                break
+
+            for link in connection.wait(busy):
+                i = links[link]
+                try:
+                    msg = validate_message(link.recv())
+                except EOFError:
+                    raise RuntimeError(
+                        f"Process {i} exited before it finished running a job"
+                    )
+                msg_type = msg["type"]
+                if msg_type == "result":
+                    g, j = running[i]
+                    batch_results[g][j] = msg["payload"]
+                elif msg_type == "reply":
+                    if msg["payload"] == "finished":
+                        finish(i)
+                elif msg_type == "progress":
+                    self.progress.emit(i, msg["payload"])
+                elif msg_type == "status":
+                    self.status.emit(i, msg["payload"])
+                elif msg_type == "error":
+                    print("There was an error in the in the child process")
+                    print(msg["payload"])
+                    finish(i)
+                elif msg_type == "exception":
+                    print("There was an exception in the in the child process")
+                    print(msg["payload"])
+                    finish(i)
+                else:
+                    raise RuntimeError(f"Unknown message type, msg: {msg}")
+
+        if len(returns) != len(tasks):
+            raise RuntimeError(
+                "Some tasks were never run. Check that the task dependencies do not have cycles."
+            )
+        return returns
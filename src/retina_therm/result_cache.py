@@ -0,0 +1,97 @@
+"""
+A content-addressed cache for computed results.
+"""
+
+import hashlib
+import os
+import pathlib
+import tempfile
+import zipfile
+
+import numpy
+
+
+def get_file_id(path):
+    """
+    Return a hash of the contents of a file, so results computed from it can be
+    identified by what is in the file instead of its name.
+    """
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Stores named numpy arrays in a directory, keyed by a string (usually a configuration id).
+
+    Each entry is stored in a single (uncompressed) .npz file named by its key. Reading an
+    entry updates its modification time, and when the total size of the cache goes over
+    `max_size` bytes the least recently used entries are removed. Entries are written to a
+    temporary file first and then moved into place, so several processes can share a cache.
+    """
+
+    def __init__(self, directory, max_size=2**30):
+        self.directory = pathlib.Path(directory)
+        self.max_size = max_size
+
+    def get_path(self, key):
+        return self.directory / f"{key}.npz"
+
+    def __contains__(self, key):
+        return self.get_path(key).exists()
+
+    def get(self, key):
+        """
+        Return a dict with the arrays stored for `key`, or None if there is no entry for it.
+        """
+        path = self.get_path(key)
+        try:
+            with numpy.load(path) as data:
+                arrays = {k: data[k] for k in data.files}
+            # mark the entry as recently used
+            os.utime(path)
+        except (FileNotFoundError, ValueError, zipfile.BadZipFile):
+            return None
+        return arrays
+
+    def put(self, key, **arrays):
+        """
+        Store the arrays given as keyword arguments for `key`.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                numpy.savez(f, **arrays)
+            os.replace(tmp_path, self.get_path(key))
+        except:
+            pathlib.Path(tmp_path).unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in `max_size` bytes.
+        """
+        entries = []
+        for path in self.directory.glob("*.npz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(map(lambda e: e[1], entries))
+        for mtime, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total_size -= size
+
+    def clear(self):
+        for path in self.directory.glob("*.npz"):
+            path.unlink(missing_ok=True)
@@ -1,7 +1,8 @@
-import copy
+import ctypes
 import importlib.resources
 import itertools
 import math
+import os
 import pathlib
 import struct
 
@@ -10,32 +11,6 @@ import numpy
 import scipy
 from fspathtree import fspathtree
 
-# marcum_q_wasm_module_file = importlib.resources.path(
-#     "retina_therm.wasm", "marcum_q.wasm"
-# )
-# try:
-#     import wasmer
-
-#     have_wasmer_module = True
-# except:
-#     have_wasmer_module = False
-
-# have_marcum_q_wasm_module = False
-# if have_wasmer_module:
-#     if marcum_q_wasm_module_file.exists():
-#         wasm_store = wasmer.Store()
-#         wasm_module = wasmer.Module(wasm_store, marcum_q_wasm_module_file.read_bytes())
-
-#         wasi_version = wasmer.wasi.get_version(wasm_module, strict=True)
-#         wasi_env = wasmer.wasi.StateBuilder("marcum_q").finalize()
-#         wasm_import_object = wasi_env.generate_import_object(wasm_store, wasi_version)
-
-#         wasm_instance = wasmer.Instance(wasm_module, wasm_import_object)
-#         have_marcum_q_wasm_module = True
-# DISABLE FOR NOW
-# getting WASI error when tyring to run large batch configs
-have_marcum_q_wasm_module = False
-
 
 def bisect(f, a, b, tol=1e-8, max_iter=1000):
     lower = f(a)
@@ -59,82 +34,517 @@ def bisect(f, a, b, tol=1e-8, max_iter=1000):
     return (a, b)
 
 
+def erfcx(x):
+    """
+    Scaled complementary error function, exp(x**2) * erfc(x), for floats.
+
+    scipy.special.erfcx works on arrays, but the math module is faster for
+    scalars and does not provide erfcx. For large x erfc(x) underflows, so
+    the asymptotic expansion is used instead.
+    """
+    if x < -26:
+        # exp(x**2) overflows
+        return float("inf")
+    if x < 25:
+        return math.exp(x * x) * math.erfc(x)
+
+    # erfcx(x) ~ 1/(x sqrt(pi)) * (1 - 1/(2x^2) + 3/(2x^2)^2 - 15/(2x^2)^3 + ...)
+    y = 1 / (2 * x * x)
+    term = 1.0
+    total = 1.0
+    for k in range(1, 20):
+        term *= -(2 * k - 1) * y
+        total += term
+        if abs(term) < 1e-17:
+            break
+    return total / (x * math.sqrt(math.pi))
+
+
 def MarcumQFunction_PYTHON(nu, a, b):
     return 1 - scipy.stats.ncx2.cdf(b**2, 2 * nu, a**2)
 
 
-if have_marcum_q_wasm_module:
+# Gauss-Legendre nodes and weights used by MarcumQFunction_NUMPY
+marcum_q_quadrature_nodes, marcum_q_quadrature_weights = (
+    numpy.polynomial.legendre.leggauss(48)
+)
+# half-width of the window around x = a that contains the integrand
+marcum_q_window = 10
+# number of (a,b) pairs evaluated at a time (limits temporary memory usage)
+marcum_q_chunk_size = 2**16
+
+
+def MarcumQFunction_NUMPY(nu, a, b):
+    """
+    Array-native Marcum Q-function for nu = 1.
+
+    a and b can be scalars or (broadcastable) numpy arrays. Q_1(a,b) is computed from
+    its integral definition,
+
+        Q_1(a,b) = int_b^inf x exp(-(x-a)^2/2) i0e(a x) dx,
+
+    where i0e is the exponentially scaled modified Bessel function. The integrand is
+    a bump of width ~1 centered near x = a, so everything outside of
+    [a - 10, a + 10] is less than ~1e-20 and ignored. The integral is taken over
+    the part of this window above b (or below b, and subtracted from one, if b < a)
+    with 48-point Gauss-Legendre quadrature. The absolute error is less than 1e-12
+    for 0 <= a, b <= 1e5 (compared to mpmath). Other orders fall back to MarcumQFunction_PYTHON.
+    """
+    if nu != 1:
+        return MarcumQFunction_PYTHON(nu, a, b)
+
+    scalar = numpy.ndim(a) == 0 and numpy.ndim(b) == 0
+    a, b = numpy.broadcast_arrays(
+        numpy.asarray(a, dtype=float), numpy.asarray(b, dtype=float)
+    )
+    shape = a.shape
+    a = a.ravel()
+    b = b.ravel()
+    Q = numpy.empty(a.shape)
+    for i in range(0, len(a), marcum_q_chunk_size):
+        chunk = slice(i, i + marcum_q_chunk_size)
+        Q[chunk] = _marcum_q_1(a[chunk], b[chunk])
+
+    if scalar:
+        return float(Q[0])
+    return Q.reshape(shape)
+
+
+def _marcum_q_1(a, b):
+    lower = numpy.maximum(a - marcum_q_window, 0)
+    upper = a + marcum_q_window
+    b = numpy.clip(b, lower, upper)
+    above = b >= a
+    # integrate from b to upper if b >= a, otherwise from lower to b
+    x1 = numpy.where(above, b, lower)
+    x2 = numpy.where(above, upper, b)
+
+    h = (x2 - x1) / 2
+    x = (x1 + h)[:, None] + h[:, None] * marcum_q_quadrature_nodes
+    f = (
+        x
+        * numpy.exp(-((x - a[:, None]) ** 2) / 2)
+        * scipy.special.i0e(a[:, None] * x)
+    )
+    integral = h * (f @ marcum_q_quadrature_weights)
+
+    return numpy.where(above, integral, 1 - integral)
+
+
+# Compiled Marcum Q backends.
+#
+# The compiled modules are built from wasm/marcum-q-function/marcum_q.cpp, either as a
+# WASM module (run with wasmer) or as a native shared library (loaded with ctypes).
+# They are loaded lazily, once per process. The batch job controllers fork worker processes,
+# and a wasmer instance created in the parent cannot be used in a child (this caused
+# WASI errors in large batch runs), so the loaded module is keyed by the process id and
+# loaded again if it is used in a different process.
+marcum_q_backends = ["numpy", "python", "native", "wasm"]
+marcum_q_backend_env_var = "RETINA_THERM_MARCUM_Q_BACKEND"
+marcum_q_library_env_var = "RETINA_THERM_MARCUM_Q_LIBRARY"
+marcum_q_wasm_module_file = pathlib.Path(__file__).parent / "wasm" / "marcum_q.wasm"
+marcum_q_native_library_file = (
+    pathlib.Path(__file__).parent / "wasm" / "libmarcum_q.so"
+)
+
+_marcum_q_compiled_modules = {}
+
+
+def load_marcum_q_native_library():
+    """
+    Load the native Marcum Q library, or return None if it is not available.
+
+    The library path can be given with the RETINA_THERM_MARCUM_Q_LIBRARY environment variable.
+    """
+    library_file = pathlib.Path(
+        os.environ.get(marcum_q_library_env_var, marcum_q_native_library_file)
+    )
+    key = ("native", os.getpid(), library_file)
+    if key not in _marcum_q_compiled_modules:
+        library = None
+        try:
+            library = ctypes.CDLL(str(library_file))
+            array = numpy.ctypeslib.ndpointer(dtype=numpy.float64, flags="C_CONTIGUOUS")
+            library.MarcumQFunction.restype = ctypes.c_double
+            library.MarcumQFunction.argtypes = [ctypes.c_double] * 3
+            library.MarcumQFunctionArray.restype = None
+            library.MarcumQFunctionArray.argtypes = [
+                ctypes.c_double,
+                array,
+                array,
+                array,
+                ctypes.c_size_t,
+            ]
+        except (OSError, AttributeError):
+            library = None
+        _marcum_q_compiled_modules[key] = library
+    return _marcum_q_compiled_modules[key]
+
+
+def load_marcum_q_wasm_module():
+    """Instantiate the Marcum Q WASM module, or return None if it is not available."""
+    key = ("wasm", os.getpid())
+    if key not in _marcum_q_compiled_modules:
+        instance = None
+        try:
+            import wasmer
+
+            wasm_store = wasmer.Store()
+            wasm_module = wasmer.Module(
+                wasm_store, marcum_q_wasm_module_file.read_bytes()
+            )
+            wasi_version = wasmer.wasi.get_version(wasm_module, strict=True)
+            wasi_env = wasmer.wasi.StateBuilder("marcum_q").finalize()
+            wasm_import_object = wasi_env.generate_import_object(
+                wasm_store, wasi_version
+            )
+            instance = wasmer.Instance(wasm_module, wasm_import_object)
+        except Exception:
+            instance = None
+        _marcum_q_compiled_modules[key] = instance
+    return _marcum_q_compiled_modules[key]
+
+
+def MarcumQFunction_NATIVE(nu, a, b):
+    library = load_marcum_q_native_library()
+    if library is None:
+        raise RuntimeError(
+            f"Native Marcum Q library could not be loaded from {os.environ.get(marcum_q_library_env_var, marcum_q_native_library_file)}."
+        )
+
+    if numpy.ndim(a) == 0 and numpy.ndim(b) == 0:
+        ret = library.MarcumQFunction(float(nu), float(a), float(b))
+        if math.isnan(ret):
+            ret = MarcumQFunction_NUMPY(nu, a, b)
+        return ret
+
+    a, b = numpy.broadcast_arrays(
+        numpy.asarray(a, dtype=float), numpy.asarray(b, dtype=float)
+    )
+    shape = a.shape
+    a = numpy.ascontiguousarray(a.ravel())
+    b = numpy.ascontiguousarray(b.ravel())
+    Q = numpy.empty(a.shape)
+    library.MarcumQFunctionArray(float(nu), a, b, Q, len(Q))
+
+    # fall back to numpy implementation if we get a nan
+    failed = numpy.isnan(Q)
+    if numpy.any(failed):
+        Q[failed] = MarcumQFunction_NUMPY(nu, a[failed], b[failed])
+
+    return Q.reshape(shape)
 
-    def MarcumQFunction_WASM(nu, a, b):
-        ret = wasm_instance.exports.MarcumQFunction(float(nu), float(a), float(b))
+
+def MarcumQFunction_WASM(nu, a, b):
+    instance = load_marcum_q_wasm_module()
+    if instance is None:
+        raise RuntimeError("Marcum Q WASM module could not be loaded.")
+
+    def call(a, b):
+        return instance.exports.MarcumQFunction(float(nu), float(a), float(b))
+
+    if numpy.ndim(a) == 0 and numpy.ndim(b) == 0:
+        ret = call(a, b)
         if math.isnan(ret):
-            # fall back to python implementation if we get a nan
-            ret = MarcumQFunction_PYTHON(nu, a, b)
+            ret = MarcumQFunction_NUMPY(nu, a, b)
         return ret
 
-    MarcumQFunction = MarcumQFunction_WASM
-else:
-    MarcumQFunction = MarcumQFunction_PYTHON
+    a, b = numpy.broadcast_arrays(
+        numpy.asarray(a, dtype=float), numpy.asarray(b, dtype=float)
+    )
+    Q = numpy.vectorize(call, otypes=[float])(a, b)
+
+    # fall back to numpy implementation if we get a nan
+    failed = numpy.isnan(Q)
+    if numpy.any(failed):
+        Q[failed] = MarcumQFunction_NUMPY(nu, a[failed], b[failed])
+
+    return Q
+
+
+def get_marcum_q_function(backend: str = None):
+    """
+    Return the Marcum Q implementation for `backend`.
+
+    If backend is None, the RETINA_THERM_MARCUM_Q_BACKEND environment variable is used,
+    and if that is not set, the numpy implementation is used. If a compiled backend
+    cannot be loaded in this process, we fall back to the numpy implementation.
+    """
+    if backend is None:
+        backend = os.environ.get(marcum_q_backend_env_var, "numpy")
+    if backend not in marcum_q_backends:
+        raise RuntimeError(
+            f"Unrecognized Marcum Q backend '{backend}'. Available backends are {marcum_q_backends}."
+        )
+
+    if backend == "python":
+        return MarcumQFunction_PYTHON
+    if backend == "native" and load_marcum_q_native_library() is not None:
+        return MarcumQFunction_NATIVE
+    if backend == "wasm" and load_marcum_q_wasm_module() is not None:
+        return MarcumQFunction_WASM
+    return MarcumQFunction_NUMPY
+
+
+def MarcumQFunction(nu, a, b):
+    return get_marcum_q_function()(nu, a, b)
+
+
+def write_txt(file, array: numpy.array, digits: int = None, block_size: int = 2**16):
+    """
+    Write an array to a text file (or an open file) with a row per line.
+
+    This writes the same text as `numpy.savetxt`, but formats a block of rows at a time
+    with a single string formatting operation instead of a row at a time, which is much
+    faster for long temperature histories. The values are written in scientific notation
+    with `digits` significant digits (the default gives the same output as `numpy.savetxt`).
+    """
+    array = numpy.asarray(array, dtype=float)
+    if array.ndim == 1:
+        array = array.reshape([-1, 1])
+    fmt = "%.18e" if digits is None else f"%.{digits-1}e"
+    row_fmt = " ".join([fmt] * array.shape[1]) + "\n"
+
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "w") as f:
+            return write_txt(f, array, digits, block_size)
+
+    for i in range(0, len(array), block_size):
+        block = array[i : i + block_size]
+        file.write((row_fmt * len(block)) % tuple(block.ravel().tolist()))
+
+
+def read_txt(filepath: pathlib.Path, ndmin: int = 0):
+    """
+    Read an array from a text file with a row per line.
+
+    numpy.loadtxt parses the whole file in C (numpy >= 1.23), which is faster than splitting
+    the text and converting it in one operation, so we just use it here. Most of the time
+    is spent converting the text to floats, so files written with fewer digits are faster to read.
+    """
+    return numpy.loadtxt(filepath, ndmin=ndmin)
+
+
+# options for the datasets in hdf5 files. datasets are chunked and can be resized along
+# the first (time) axis so that append_to_file can add to them in place.
+hdf5_dataset_options = {"chunks": True, "compression": "gzip", "shuffle": True}
+
+
+def _create_dataset(group, name, data, units=None):
+    data = numpy.asarray(data)
+    dataset = group.create_dataset(
+        name,
+        data=data,
+        maxshape=(None, *data.shape[1:]) if data.ndim > 0 else None,
+        **(hdf5_dataset_options if data.ndim > 0 else {}),
+    )
+    if units is not None:
+        dataset.attrs["units"] = units
+    return dataset
+
+
+def write_to_file(
+    filepath: pathlib.Path,
+    array: numpy.array,
+    fmt="hdf5",
+    axes: dict = None,
+    units: dict = None,
+    attrs: dict = None,
+    group: str = None,
+    digits: int = None,
+):
+    """
+    Write an array to a file.
+
+    For txt files, `digits` is the number of significant digits to write (see `write_txt`).
+
+    For hdf5 files, `axes` can give extra datasets (i.e. the times and sensor positions)
+    that are written next to the array, `units` can give the units of the datasets by name
+    (the array is named "retina-therm"), and `attrs` gives extra attributes (i.e. the config).
+    If `group` is given, the datasets are written to that group and the rest of the file is
+    left alone, so several results can be written to the same file.
+    """
 
+    if fmt in ["txt"]:
+        write_txt(filepath, array, digits)
+        return
+
+    if fmt in ["rt"]:
+        write_Tvst_to_file_rt(array, filepath)
+        return
 
-def write_to_file(filepath: pathlib.Path, array: numpy.array, fmt="hdf5"):
+    if fmt in ["hdf5"]:
+        units = units or {}
+        with h5py.File(filepath, "w" if group is None else "a") as f:
+            if group is not None:
+                if group in f:
+                    del f[group]
+                g = f.create_group(group)
+            else:
+                g = f
+            _create_dataset(g, "retina-therm", array, units.get("retina-therm", None))
+            for name, axis in (axes or {}).items():
+                _create_dataset(g, name, axis, units.get(name, None))
+            for name, value in (attrs or {}).items():
+                g.attrs[name] = value
+        return
+
+    raise RuntimeError(f"Unrecognized format '{fmt}'")
+
+
+def _append_to_dataset(group, name, array):
+    dataset = group[name]
+    if dataset.maxshape[0] is None:
+        n = dataset.shape[0]
+        dataset.resize(n + len(array), axis=0)
+        dataset[n:] = array
+    else:
+        # files written by older versions can't be resized, so we have to rewrite the dataset
+        attrs = dict(dataset.attrs)
+        array = numpy.concatenate([dataset[:], array])
+        del group[name]
+        _create_dataset(group, name, array).attrs.update(attrs)
+
+
+def append_to_file(
+    filepath: pathlib.Path,
+    array: numpy.array,
+    fmt="hdf5",
+    axes: dict = None,
+    attrs: dict = None,
+    group: str = None,
+    digits: int = None,
+):
+    """
+    Append rows to an array that was written with `write_to_file`.
+
+    For hdf5 files, `axes` gives the rows to append to the extra datasets (i.e. the times).
+    Extra datasets that are not given (i.e. sensor positions) are left alone, and `attrs`
+    replace the existing attributes with the same names.
+    """
 
     if fmt in ["txt"]:
-        numpy.savetxt(filepath, array)
+        with open(filepath, "a") as f:
+            write_txt(f, array, digits)
+        return
+
+    if fmt in ["rt"]:
+        rt = TvstRtFile(filepath)
+        if len(array) > 0 and (
+            not numpy.allclose(array[:, 0], (len(rt) + numpy.arange(len(array))) * rt.dt)
+        ):
+            raise RuntimeError(
+                f"Cannot append to {filepath}, the times are not the next time steps in the file."
+            )
+        with open(filepath, "ab") as f:
+            numpy.ascontiguousarray(array[:, 1], dtype="d").tofile(f)
         return
 
     if fmt in ["hdf5"]:
-        f = h5py.File(filepath, "w")
-        f.create_dataset("retina-therm", data=array)
-        f.close()
+        with h5py.File(filepath, "a") as f:
+            g = f if group is None else f[group]
+            _append_to_dataset(g, "retina-therm", array)
+            for name, axis in (axes or {}).items():
+                _append_to_dataset(g, name, axis)
+            for name, value in (attrs or {}).items():
+                g.attrs[name] = value
         return
 
     raise RuntimeError(f"Unrecognized format '{fmt}'")
 
 
-def read_from_file(filepath: pathlib.Path, fmt="hdf5"):
+def read_from_file(filepath: pathlib.Path, fmt="hdf5", group: str = None):
+    """
+    Read an array from a file.
+
+    Temperature histories in hdf5 files store the temperature ("retina-therm") and the times
+    ("t") in separate datasets. They are returned as two columns, like text files.
+    """
     if fmt in ["txt"]:
-        return numpy.loadtxt(filepath)
+        return read_txt(filepath)
+
+    if fmt in ["rt"]:
+        return TvstRtFile(filepath).read()
 
     if fmt in ["hdf5"]:
-        f = h5py.File(filepath, "r")
-        data = f["retina-therm"][:]
-        f.close()
+        with h5py.File(filepath, "r") as f:
+            g = f if group is None else f[group]
+            data = g["retina-therm"][:]
+            if data.ndim == 1 and "t" in g:
+                data = numpy.c_[g["t"][:], data]
         return data
 
     raise RuntimeError(f"Unrecognized format '{fmt}'")
 
 
+def read_attrs_from_file(filepath: pathlib.Path, group: str = None):
+    "Return the attributes of an hdf5 file (or a group in it) as a dict."
+    with h5py.File(filepath, "r") as f:
+        g = f if group is None else f[group]
+        return dict(g.attrs)
+
+
 def read_Tvst_from_file_txt(filepath: pathlib.Path):
-    return numpy.loadtxt(filepath)
+    return read_txt(filepath, ndmin=2)
 
 
 def read_Tvst_from_file_hdf5(filepath: pathlib.Path):
-    f = h5py.File(filepath, "r")
-    data = f["retina-therm"][:]
-    f.close()
-    return data
+    return read_from_file(filepath, "hdf5")
 
 
-def read_Tvst_from_file_rt(filepath: pathlib.Path):
+class TvstRtFile:
+    """
+    A temperature history stored in an `rt` binary file.
+
+    rt files contain the time step (dt) followed by the temperature at each time step,
+    all as doubles. The temperatures are memory-mapped instead of read, so opening a file is
+    fast regardless of its size, and the times are only computed when they are needed.
+    """
 
-    with open(filepath, "rb") as f:
-        f.seek(0, 2)
-        fs = f.tell()
-        f.seek(0, 0)
-        if fs % 8 > 0:
+    def __init__(self, filepath: pathlib.Path):
+        self.filepath = pathlib.Path(filepath)
+        fs = self.filepath.stat().st_size
+        if fs % 8 > 0 or fs < 8:
             raise RuntimeError(
-                f"Invalid or corrupt file. rt binary file should contain a multiple of 8 bytes. {filepath} contains {fs} bytes."
+                f"Invalid or corrupt file. rt binary file should contain a (non-zero) multiple of 8 bytes. {filepath} contains {fs} bytes."
             )
-        N = int(fs / 8 - 1)
-        dt = struct.unpack("d", f.read(8))[0]
-        Tvst = numpy.zeros((N, 2))
-        Tvst[:, 0] = numpy.arange(0, dt * N, dt)
-        Tvst[:, 1] = list(
-            map(lambda item: item[0], struct.iter_unpack("d", f.read(8 * N)))
-        )
-        # print(Tvst)
-    return Tvst
+        self.dt = float(numpy.fromfile(self.filepath, dtype="d", count=1)[0])
+        N = fs // 8 - 1
+        if N > 0:
+            self.T = numpy.memmap(self.filepath, dtype="d", mode="r", offset=8, shape=(N,))
+        else:
+            # zero-length files can't be memory-mapped
+            self.T = numpy.zeros([0])
+
+    def __len__(self):
+        return len(self.T)
+
+    @property
+    def t(self):
+        return numpy.arange(len(self)) * self.dt
+
+    def get_index_range(self, tmin=None, tmax=None):
+        "Return the range of indices [imin,imax) for the times in [tmin,tmax]."
+        imin = 0
+        imax = len(self)
+        # allow for round off in times that are computed from dt
+        if tmin is not None:
+            imin = max(imin, math.ceil(tmin / self.dt * (1 - 1e-12)))
+        if tmax is not None:
+            imax = min(imax, math.floor(tmax / self.dt * (1 + 1e-12)) + 1)
+        return imin, max(imin, imax)
+
+    def read(self, tmin=None, tmax=None):
+        "Return the times and temperatures in [tmin,tmax] as a two column array."
+        imin, imax = self.get_index_range(tmin, tmax)
+        data = numpy.zeros([imax - imin, 2])
+        data[:, 0] = numpy.arange(imin, imax) * self.dt
+        data[:, 1] = self.T[imin:imax]
+        return data
+
+
+def read_Tvst_from_file_rt(filepath: pathlib.Path):
+    return TvstRtFile(filepath).read()
 
 
 def read_Tvst_from_file(filepath: pathlib.Path, fmt):
@@ -151,28 +561,35 @@ def read_Tvst_from_file(filepath: pathlib.Path, fmt):
 
 
 def write_Tvst_to_file_txt(data: numpy.array, filepath: pathlib.Path):
-    numpy.savetxt(filepath, data)
+    write_txt(filepath, data)
 
 
 def write_Tvst_to_file_hdf5(data: numpy.array, filepath: pathlib.Path):
-    f = h5py.File(filepath, "w")
-    f.create_dataset("retina-therm", data=data)
-    f.close()
+    write_to_file(
+        filepath,
+        data[:, 1],
+        "hdf5",
+        axes={"t": data[:, 0]},
+        units={"t": "s", "retina-therm": "K"},
+    )
 
 
 def write_Tvst_to_file_rt(data: numpy.array, filepath: pathlib.Path):
-    # check that dat is uniform
-    # the difference between consecutive times should be the same, to within 1 picosecond
+    # check that dat is uniform and starts at zero
+    # the difference between consecutive times should be the same, to within 1 nanosecond
     diffs = numpy.diff(data[:, 0])
-    if sum((diffs - diffs[0]) > 1e-9) > 0:
+    if len(diffs) == 0 or numpy.any(abs(diffs - diffs[0]) > 1e-9):
         raise RuntimeError(
             "time-temperature history must be uniformly spaced to save to 'rt' binary file."
         )
+    if abs(data[0, 0]) > 1e-9:
+        raise RuntimeError(
+            "time-temperature history must start at t = 0 to save to 'rt' binary file."
+        )
 
     with open(filepath, "wb") as f:
-        f.write(diffs[0])
-        T = copy.copy(data[:, 1])
-        f.write(T)
+        numpy.array([diffs[0]], dtype="d").tofile(f)
+        numpy.ascontiguousarray(data[:, 1], dtype="d").tofile(f)
 
 
 def write_Tvst_to_file(data: numpy.array, filepath: pathlib.Path, fmt):
@@ -24,7 +24,7 @@ def test_axial_part_retina_long_time_approx():
             "z0": "0 cm",
             "with_units": False,
             "use_multi_precision": True,
-            "use_approximate": False,
+            "use_approximations": False,
         }
     )
     G_approx = greens_functions.LargeBeamAbsorbingLayerGreensFunction(
@@ -133,8 +133,14 @@ def test_axial_part_fast_heat_flow_long_time_approx():
         G_exact(0.00065, 0, 2e-5), rel=0.02
     )
 
-    assert G_exact(0.0006, 0, 3e-5) == 0
-    assert G_exact(0.00065, 0, 3e-5) == 0
+    # the double precision implementation used to cancel to zero here.
+    with mp.workdps(200):
+        assert G_exact(0.0006, 0, 3e-5) == pytest.approx(
+            float(G_exact_mp(0.0006, 0, 3e-5))
+        )
+        assert G_exact(0.00065, 0, 3e-5) == pytest.approx(
+            float(G_exact_mp(0.00065, 0, 3e-5))
+        )
 
     assert G_approx(0.0006, 0, 3e-5) > 0
     assert G_approx(0.00065, 0, 3e-5) > 0
@@ -4,6 +4,7 @@ import numpy
 import pytest
 import scipy
 
+from retina_therm import damage, multi_pulse_builder, parallel_jobs
 from retina_therm.utils import *
 
 
@@ -27,5 +28,251 @@ def test_python_marcum_q(benchmark):
     benchmark(MarcumQFunction_PYTHON, 1, 1, 1)
 
 
-# def test_wasm_marcum_q(benchmark):
-#     benchmark(MarcumQFunction_WASM, 1, 1, 1)
+def test_numpy_marcum_q(benchmark):
+    benchmark(MarcumQFunction_NUMPY, 1, 1, 1)
+
+
+def test_python_marcum_q_batch(benchmark):
+    a = numpy.linspace(0, 100, 1000)
+    benchmark(MarcumQFunction_PYTHON, 1, a, 50)
+
+
+def test_numpy_marcum_q_batch(benchmark):
+    a = numpy.linspace(0, 100, 1000)
+    benchmark(MarcumQFunction_NUMPY, 1, a, 50)
+
+
+@pytest.mark.parametrize("backend", ["native", "wasm"])
+def test_compiled_marcum_q(benchmark, backend):
+    f = get_marcum_q_function(backend)
+    if f is MarcumQFunction_NUMPY:
+        pytest.skip(f"The {backend} Marcum Q backend is not available.")
+    benchmark(f, 1, 1, 1)
+
+
+@pytest.mark.parametrize("backend", ["native", "wasm"])
+def test_compiled_marcum_q_batch(benchmark, backend):
+    f = get_marcum_q_function(backend)
+    if f is MarcumQFunction_NUMPY:
+        pytest.skip(f"The {backend} Marcum Q backend is not available.")
+    a = numpy.linspace(0, 100, 1000)
+    benchmark(f, 1, a, 50)
+
+
+@pytest.fixture
+def layer_greens_function():
+    from retina_therm import greens_functions
+
+    return greens_functions.LargeBeamAbsorbingLayerGreensFunction(
+        {
+            "mua": "720 1/cm",
+            "k": "0.00628 W/cm/K",
+            "rho": "1 g/cm^3",
+            "c": "4.1868 J/g/K",
+            "E0": "1 W/cm^2",
+            "d": "10 um",
+            "z0": "0 um",
+            "with_units": False,
+        }
+    )
+
+
+def test_layer_greens_function_scalar(benchmark, layer_greens_function):
+    t = numpy.arange(0, 0.1, 10e-6)
+    benchmark(lambda: [layer_greens_function(0, 0, tp) for tp in t])
+
+
+def test_layer_greens_function_array(benchmark, layer_greens_function):
+    t = numpy.arange(0, 0.1, 10e-6)
+    benchmark(layer_greens_function, 0, 0, t)
+
+
+@pytest.fixture
+def multi_layer_greens_function_config():
+    return {
+        "laser": {"E0": "1 W/cm^2", "profile": "flattop", "one_over_e_radius": "100 um"},
+        "thermal": {"k": "0.00628 W/cm/K", "rho": "1 g/cm^3", "c": "4.1868 J/g/K"},
+        "layers": [
+            {"mua": "310 1/cm", "d": "10 um", "z0": "0 um"},
+            {"mua": "53 1/cm", "d": "100 um", "z0": "10 um"},
+        ],
+        "simulation": {},
+    }
+
+
+def test_multi_layer_greens_function_array(
+    benchmark, multi_layer_greens_function_config
+):
+    from retina_therm import greens_functions
+
+    G = greens_functions.MultiLayerGreensFunction(multi_layer_greens_function_config)
+    t = numpy.arange(0, 0.01, 1e-6)
+    benchmark(G, 1e-4, 0, t)
+
+
+def test_multi_layer_greens_function_time_kernel_cache(
+    benchmark, multi_layer_greens_function_config
+):
+    from retina_therm import greens_functions
+
+    multi_layer_greens_function_config["simulation"]["time_kernel_cache"] = {
+        "enabled": True
+    }
+    G = greens_functions.MultiLayerGreensFunction(multi_layer_greens_function_config)
+    t = numpy.arange(0, 0.01, 1e-6)
+    # tabulate the kernel before benchmarking
+    G(1e-4, 0, t)
+    benchmark(G, 1e-4, 0, t)
+
+
+@pytest.mark.parametrize(
+    "method", ["superposition", "step", "trap", "simpson", "gauss-legendre"]
+)
+def test_pulsed_exposure_integrators(
+    benchmark, multi_layer_greens_function_config, method
+):
+    from retina_therm import greens_functions
+
+    multi_layer_greens_function_config["laser"].update(
+        {"pulse_duration": "100 us", "pulse_period": "1 ms", "duration": "10 ms"}
+    )
+    exp = greens_functions.PulsedRetinaLaserExposure(multi_layer_greens_function_config)
+    t = numpy.arange(0, 20e-3, 10e-6)
+    benchmark(exp.temperature_rise, 1e-4, 0, t, method=method)
+
+
+@pytest.mark.parametrize("method", ["superposition", "step"])
+def test_high_prf_pulse_train_integrators(
+    benchmark, multi_layer_greens_function_config, method
+):
+    from retina_therm import greens_functions
+
+    # 1000 pulses, with output times that are not aligned with the pulses
+    multi_layer_greens_function_config["laser"].update(
+        {"pulse_duration": "1 us", "pulse_period": "10 us", "duration": "10 ms"}
+    )
+    exp = greens_functions.PulsedRetinaLaserExposure(multi_layer_greens_function_config)
+    t = numpy.arange(0, 20e-3, 3.3e-6)
+    benchmark.pedantic(
+        exp.temperature_rise, (1e-4, 0, t), {"method": method}, rounds=3
+    )
+
+
+class _PipeResultProcess(parallel_jobs.JobProcessorBase):
+    def run_job(self, n):
+        t = numpy.linspace(0, 1, n)
+        return list(zip(t, numpy.sin(t)))
+
+
+class _SharedResultProcess(parallel_jobs.JobProcessorBase):
+    def run_job(self, job):
+        t = numpy.linspace(0, 1, job["n"])
+        job["output"].array[...] = numpy.sin(t)
+        job["output"].close()
+        return job["n"]
+
+
+@pytest.mark.parametrize("transport", ["pipe", "shared"])
+def test_parallel_job_result_transport(benchmark, transport):
+    n = 200_000
+    if transport == "pipe":
+        controller = parallel_jobs.BatchJobController(_PipeResultProcess, njobs=1)
+    else:
+        controller = parallel_jobs.BatchJobController(_SharedResultProcess, njobs=1)
+    controller.start()
+
+    def run():
+        if transport == "pipe":
+            data = controller.run_jobs([n])[0]
+            return numpy.array(list(map(lambda item: item[1], data)))
+        with parallel_jobs.SharedArray(n) as output:
+            controller.run_jobs([{"output": output, "n": n}])
+            return output.array.copy()
+
+    try:
+        T = benchmark(run)
+        assert len(T) == n
+    finally:
+        controller.stop()
+        controller.wait()
+
+
+@pytest.mark.parametrize("method", ["open", "read"])
+def test_rt_reader(benchmark, tmp_path, method):
+    n = 1_000_000
+    t = numpy.arange(n) * 1e-6
+    filepath = tmp_path / "Tvst.rt"
+    write_Tvst_to_file(numpy.c_[t, numpy.exp(-t)], filepath, "rt")
+
+    if method == "open":
+        rt = benchmark(TvstRtFile, filepath)
+        assert len(rt) == n
+    else:
+        data = benchmark(read_Tvst_from_file, filepath, "rt")
+        assert data.shape == (n, 2)
+
+
+@pytest.fixture
+def Tvst_data():
+    t = numpy.arange(100_000) * 1e-6
+    return numpy.c_[t, numpy.exp(-t / 1e-3)]
+
+
+@pytest.mark.parametrize("writer", ["savetxt", "write_txt", "write_txt-9-digits"])
+def test_txt_writer(benchmark, tmp_path, Tvst_data, writer):
+    filepath = tmp_path / "Tvst.txt"
+    if writer == "savetxt":
+        benchmark(numpy.savetxt, filepath, Tvst_data)
+    elif writer == "write_txt":
+        benchmark(write_txt, filepath, Tvst_data)
+    else:
+        benchmark(write_txt, filepath, Tvst_data, digits=9)
+
+
+@pytest.mark.parametrize("digits", [None, 9])
+def test_txt_reader(benchmark, tmp_path, Tvst_data, digits):
+    filepath = tmp_path / "Tvst.txt"
+    write_txt(filepath, Tvst_data, digits=digits)
+    data = benchmark(read_txt, filepath)
+    assert data.shape == Tvst_data.shape
+
+
+@pytest.mark.parametrize("method", ["newton", "bisect"])
+def test_damage_threshold_scale(benchmark, method):
+    t = numpy.arange(100_000) * 1e-6
+    dT = numpy.exp(-t / 1e-2) * (1 - numpy.exp(-t / 1e-3))
+    compute_threshold_scale = (
+        damage.compute_threshold_scale
+        if method == "newton"
+        else damage.compute_threshold_scale_bisect
+    )
+    scale = benchmark(compute_threshold_scale, t, dT, 3.1e99, 6.28e5, 310)
+    assert scale > 0
+
+
+@pytest.mark.parametrize("method", ["batch", "loop"])
+def test_damage_many_scales(benchmark, method):
+    t = numpy.arange(100_000) * 1e-6
+    dT = numpy.exp(-t / 1e-2) * (1 - numpy.exp(-t / 1e-3))
+    scales = numpy.linspace(30, 50, 32)
+    if method == "batch":
+        benchmark(damage.compute_log_damage_batch, t, dT, 3.1e99, 6.28e5, 310, scales)
+    else:
+        benchmark(
+            lambda: [
+                damage.compute_log_damage(t, 310 + s * dT, 3.1e99, 6.28e5)
+                for s in scales
+            ]
+        )
+
+
+@pytest.mark.parametrize("method", ["direct", "fft"])
+def test_multi_pulse_build(benchmark, method):
+    t = numpy.arange(200_000) * 1e-6
+    builder = multi_pulse_builder.MultiPulseBuilder()
+    builder.set_temperature_history(t, 1 - numpy.exp(-t / 1e-3))
+    for n in range(1000):
+        builder.add_contribution(n * 200e-6, 1)
+        builder.add_contribution(n * 200e-6 + 50e-6, -1)
+
+    benchmark(builder.build, method)
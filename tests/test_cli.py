@@ -1,6 +1,7 @@
 import contextlib
 import os
 import pathlib
+import shutil
 
 import pytest
 import yaml
@@ -96,3 +97,726 @@ def test_cli_config_error_in_subprocess(simple_config):
         if result.exit_code != 0:
             print(result.stdout)
         assert result.exit_code != 0
+
+
+def test_compute_adaptive_evaluation_times():
+    import numpy
+    from fspathtree import fspathtree
+
+    from retina_therm.cli import compute_adaptive_evaluation_times
+
+    # a temperature rise with a fast rise and a slow decay
+    f = lambda t: numpy.where(t < 1e-3, 1 - numpy.exp(-t / 1e-4), 1) * numpy.where(
+        t < 1e-3, 1, numpy.exp(-(t - 1e-3) / 0.1)
+    )
+    config = fspathtree(
+        {
+            "max": "1 s",
+            "resolution": "1 us",
+            "adaptive": {"rtol": 1e-3, "atol": "1 uK", "max": 10000},
+        }
+    )
+    t, T = compute_adaptive_evaluation_times(config, f)
+    assert t[0] == 0
+    assert t[-1] == pytest.approx(1)
+    assert numpy.all(numpy.diff(t) > 0)
+    assert T == pytest.approx(f(t))
+    assert len(t) < 1000
+
+    tp = numpy.arange(0, 1, 1e-6)
+    assert numpy.interp(tp, t, T) == pytest.approx(f(tp), abs=5e-3)
+
+    # the number of times is bounded
+    config["adaptive/max"] = 100
+    t, T = compute_adaptive_evaluation_times(config, f)
+    assert len(t) == 100
+
+
+@pytest.mark.timeout(10)
+def test_cli_adaptive_time_grid(simple_config):
+    import numpy
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        simple_config["temperature_rise"]["time"]["adaptive"] = {"rtol": 1e-3}
+        simple_config["temperature_rise"]["method"] = "step"
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(app, ["temperature-rise", "input.yml"])
+        if result.exit_code != 0:
+            print(result.stdout)
+        assert result.exit_code == 0
+        adaptive = numpy.loadtxt("output/CW/output-Tvst.txt")
+
+        del simple_config["temperature_rise"]["time"]["adaptive"]
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(app, ["temperature-rise", "input.yml"])
+        assert result.exit_code == 0
+        uniform = numpy.loadtxt("output/CW/output-Tvst.txt")
+
+        assert len(adaptive) < len(uniform)
+        assert numpy.interp(uniform[:, 0], adaptive[:, 0], adaptive[:, 1]) == pytest.approx(
+            uniform[:, 1], rel=1e-2, abs=1e-3 * max(uniform[:, 1])
+        )
+
+
+@pytest.mark.timeout(20)
+def test_cli_multiple_sensors(simple_config):
+    import h5py
+    import numpy
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        simple_config["temperature_rise"]["method"] = "step"
+        simple_config["temperature_rise"]["output_file_format"] = "hdf5"
+        simple_config["temperature_rise"]["sensor"]["z"] = ["0 um", "5 um", "70 um"]
+        simple_config["temperature_rise"]["sensor"]["r"] = ["0 um", "40 um"]
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(app, ["temperature-rise", "input.yml"])
+        if result.exit_code != 0:
+            print(result.stdout)
+        assert result.exit_code == 0
+
+        with h5py.File("output/CW/output-Tvst.txt") as f:
+            T = f["retina-therm"][:]
+            t = f["t"][:]
+            assert f["z"][:] == pytest.approx([0, 5e-4, 70e-4])
+            assert f["r"][:] == pytest.approx([0, 40e-4])
+        assert T.shape == (len(t), 3, 2)
+
+        # a single sensor gives the same result as the grid
+        simple_config["temperature_rise"]["output_file_format"] = "txt"
+        simple_config["temperature_rise"]["sensor"]["z"] = "5 um"
+        simple_config["temperature_rise"]["sensor"]["r"] = "40 um"
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(app, ["temperature-rise", "input.yml"])
+        assert result.exit_code == 0
+        data = numpy.loadtxt("output/CW/output-Tvst.txt")
+        assert data[:, 0] == pytest.approx(t)
+        assert data[:, 1] == pytest.approx(T[:, 1, 1])
+
+        # a list of depths on axis gives a 2D dataset, or a column per sensor in text files
+        simple_config["temperature_rise"]["sensor"]["z"] = ["0 um", "5 um", "70 um"]
+        simple_config["temperature_rise"]["sensor"]["r"] = "0 um"
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(app, ["temperature-rise", "input.yml"])
+        assert result.exit_code == 0
+        data = numpy.loadtxt("output/CW/output-Tvst.txt")
+        assert data.shape == (len(t), 4)
+        assert data[:, 1:] == pytest.approx(T[:, :, 0])
+
+
+@pytest.mark.timeout(20)
+def test_cli_more_jobs_than_time_points(simple_config):
+    import numpy
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        simple_config["temperature_rise"]["method"] = "step"
+        simple_config["temperature_rise"]["time"]["resolution"] = "5 ms"
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(app, ["temperature-rise", "input.yml", "--njobs", "8"])
+        assert result.exit_code == 0
+        data = numpy.loadtxt("output/CW/output-Tvst.txt")
+        assert data.shape == (5, 2)
+        assert numpy.all(data[1:, 1] > 0)
+
+
+@pytest.mark.timeout(30)
+def test_cli_batch_shares_process_pool(simple_config):
+    import numpy
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        simple_config["temperature_rise"]["method"] = "step"
+        simple_config["temperature_rise"]["sensor"]["r"] = {
+            "@batch": ["0 um", "40 um", "80 um"]
+        }
+        simple_config["temperature_rise"][
+            "output_file"
+        ] = "output/CW/output-$(${/temperature_rise/sensor/r}.to('um').magnitude)-Tvst.txt"
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(app, ["temperature-rise", "input.yml", "--njobs", "2"])
+        assert result.exit_code == 0
+        files = sorted(pathlib.Path("output/CW").glob("output-*-Tvst.txt"))
+        assert len(files) == 3
+        for file in files:
+            assert numpy.loadtxt(file).shape == (201, 2)
+
+
+@pytest.mark.timeout(60)
+def test_cli_worker_pool(simple_config, monkeypatch):
+    import stat
+    import subprocess
+    import sys
+    import time
+    from multiprocessing import connection
+
+    import numpy
+
+    monkeypatch.setenv("RETINA_THERM_POOL_AUTHKEY", "test-key")
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        simple_config["temperature_rise"]["method"] = "step"
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(app, ["temperature-rise", "input.yml", "--njobs", "2"])
+        assert result.exit_code == 0
+        expected = numpy.loadtxt("output/CW/output-Tvst.txt")
+        pathlib.Path("output/CW/output-Tvst.txt").unlink()
+
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "from retina_therm.cli import app; app()",
+                "serve",
+                "pool.sock",
+                "--njobs",
+                "2",
+            ]
+        )
+        try:
+            while not pathlib.Path("pool.sock").exists():
+                assert server.poll() is None
+                time.sleep(0.1)
+
+            # the same workers are used for each run
+            for i in range(2):
+                result = runner.invoke(
+                    app, ["temperature-rise", "input.yml", "--pool", "pool.sock"]
+                )
+                assert result.exit_code == 0
+                assert numpy.loadtxt("output/CW/output-Tvst.txt") == pytest.approx(
+                    expected
+                )
+
+            # only the owner can use the socket
+            assert stat.S_IMODE(os.stat("pool.sock").st_mode) == 0o600
+
+            # clients without the key are turned away
+            with pytest.raises(connection.AuthenticationError):
+                connection.Client("pool.sock", family="AF_UNIX", authkey=b"wrong")
+
+            # bad requests are reported to the client and the server keeps going
+            with connection.Client(
+                "pool.sock", family="AF_UNIX", authkey=b"test-key"
+            ) as conn:
+                conn.send({"command": "temperature-rise", "cwd": "missing", "configs": []})
+                reply = conn.recv()
+            assert reply["failed"] > 0
+            assert "missing" in reply["error"]
+            with connection.Client(
+                "pool.sock", family="AF_UNIX", authkey=b"test-key"
+            ) as conn:
+                conn.send({"command": "frobnicate"})
+                reply = conn.recv()
+            assert reply["failed"] > 0
+            assert "frobnicate" in reply["error"]
+            assert server.poll() is None
+
+            result = runner.invoke(
+                app, ["temperature-rise", "input.yml", "--pool", "pool.sock"]
+            )
+            assert result.exit_code == 0
+
+            result = runner.invoke(app, ["serve-stop", "pool.sock"])
+            assert result.exit_code == 0
+            server.wait(timeout=10)
+            assert server.returncode == 0
+        finally:
+            server.kill()
+
+
+# modules that are only needed to run simulations
+simulation_modules = [
+    "retina_therm.jobs",
+    "retina_therm.greens_functions",
+    "retina_therm.utils",
+    "h5py",
+    "mpmath",
+    "scipy.special",
+    "scipy.integrate",
+]
+
+
+@pytest.mark.parametrize(
+    "args,budget,excluded_modules",
+    [
+        (
+            ["--version"],
+            0.75,
+            simulation_modules + ["powerconf", "pint", "numpy", "pydantic"],
+        ),
+        (["status", "input.yml"], 2.5, simulation_modules),
+        (["report", "input.yml", "report.txt"], 2.5, simulation_modules),
+    ],
+)
+def test_cli_import_time_budget(simple_config, args, budget, excluded_modules):
+    import subprocess
+    import sys
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        simple_config["report"] = {
+            "columns": [
+                {"title": "k", "value": "$(${/thermal/k})", "unit": "W/m/K"},
+                {"title": "output", "value": "$(${/temperature_rise/output_file})"},
+            ]
+        }
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-X",
+                "importtime",
+                "-c",
+                "import sys; from retina_therm.cli import app; sys.argv[0] = 'retina-therm'; app()",
+                *args,
+            ],
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 0
+
+        # lines look like "import time: self [us] | cumulative | imported package"
+        modules = {}
+        for line in result.stderr.splitlines():
+            if line.startswith("import time:") and not line.endswith("imported package"):
+                self_time, cumulative, name = line[len("import time:") :].split("|")
+                modules[name.strip()] = int(self_time)
+
+        for name in excluded_modules:
+            assert name not in modules
+        assert sum(modules.values()) * 1e-6 < budget
+
+
+@pytest.mark.timeout(30)
+def test_cli_result_cache(simple_config):
+    import numpy
+
+    from retina_therm.result_cache import ResultCache
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        simple_config["temperature_rise"]["method"] = "step"
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(
+            app, ["temperature-rise", "input.yml", "--njobs", "2", "--cache-dir", "cache"]
+        )
+        assert result.exit_code == 0
+        expected = numpy.loadtxt("output/CW/output-Tvst.txt")
+        cache = ResultCache("cache")
+        keys = list(map(lambda p: p.stem, pathlib.Path("cache").glob("*.npz")))
+        assert len(keys) == 1
+        assert cache.get(keys[0])["T"] == pytest.approx(expected[:, 1])
+
+        # replace the cached result so we can tell that it is used
+        cache.put(keys[0], t=expected[:, 0], T=10 * expected[:, 1])
+
+        # a config that only differs by output file names uses the cached result
+        simple_config["temperature_rise"]["output_file"] = "other/Tvst.txt"
+        simple_config["temperature_rise"]["output_config_file"] = "other/CONFIG.yml"
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(
+            app, ["temperature-rise", "input.yml", "--cache-dir", "cache"]
+        )
+        assert result.exit_code == 0
+        data = numpy.loadtxt("other/Tvst.txt")
+        assert data[:, 1] == pytest.approx(10 * expected[:, 1])
+        assert pathlib.Path("other/CONFIG.yml").exists()
+
+        # a config with different physics does not
+        simple_config["layers"][0]["mua"] = "200 1/cm"
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(
+            app, ["temperature-rise", "input.yml", "--cache-dir", "cache"]
+        )
+        assert result.exit_code == 0
+        data = numpy.loadtxt("other/Tvst.txt")
+        assert max(data[:, 1]) < 5 * max(expected[:, 1])
+        assert len(list(pathlib.Path("cache").glob("*.npz"))) == 2
+
+
+@pytest.mark.timeout(60)
+@pytest.mark.parametrize("fmt", ["txt", "hdf5"])
+def test_cli_extend(simple_config, fmt):
+    import h5py
+
+    from retina_therm import utils
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        simple_config["temperature_rise"]["method"] = "step"
+        simple_config["temperature_rise"]["output_file_format"] = fmt
+        simple_config["temperature_rise"]["sensor"]["z"] = ["0 um", "70 um"]
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(app, ["temperature-rise", "input.yml"])
+        assert result.exit_code == 0
+        expected = utils.read_from_file("output/CW/output-Tvst.txt", fmt)
+        if fmt == "hdf5":
+            with h5py.File("output/CW/output-Tvst.txt") as f:
+                expected_t = f["t"][:]
+
+        simple_config["temperature_rise"]["time"]["max"] = "10 ms"
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(app, ["temperature-rise", "input.yml"])
+        assert result.exit_code == 0
+
+        simple_config["temperature_rise"]["time"]["max"] = "20 ms"
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(app, ["temperature-rise", "input.yml", "--extend"])
+        assert result.exit_code == 0
+        data = utils.read_from_file("output/CW/output-Tvst.txt", fmt)
+        assert data.shape == expected.shape
+        assert data == pytest.approx(expected)
+        if fmt == "hdf5":
+            with h5py.File("output/CW/output-Tvst.txt") as f:
+                assert f["t"][:] == pytest.approx(expected_t)
+        config = yaml.safe_load(pathlib.Path("output/CW/output-CONFIG.yml").read_text())
+        assert config["temperature_rise"]["time"]["max"] == "0.02 s"
+
+        # extending to the same times does nothing
+        result = runner.invoke(app, ["temperature-rise", "input.yml", "--extend"])
+        assert result.exit_code == 0
+        assert utils.read_from_file("output/CW/output-Tvst.txt", fmt) == pytest.approx(
+            expected
+        )
+
+        # outputs computed with a different configuration can't be extended
+        simple_config["layers"][0]["mua"] = "200 1/cm"
+        simple_config["temperature_rise"]["time"]["max"] = "30 ms"
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(app, ["temperature-rise", "input.yml", "--extend"])
+        assert result.exit_code == 1
+
+
+@pytest.mark.timeout(60)
+def test_cli_batch_file(simple_config):
+    import h5py
+
+    from retina_therm import utils
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        simple_config["temperature_rise"]["method"] = "step"
+        simple_config["temperature_rise"]["sensor"]["r"] = {
+            "@batch": ["0 um", "40 um", "80 um"]
+        }
+        simple_config["temperature_rise"][
+            "output_file"
+        ] = "output/CW/output-$(${/temperature_rise/sensor/r}.to('um').magnitude)-Tvst.txt"
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(
+            app, ["temperature-rise", "input.yml", "--batch-file", "batch.h5"]
+        )
+        assert result.exit_code == 0
+        assert not pathlib.Path("output").exists()
+
+        with h5py.File("batch.h5") as f:
+            groups = list(f.keys())
+            assert len(groups) == 3
+            for group in groups:
+                assert f[group]["retina-therm"].shape == (201,)
+                assert f[group]["t"].attrs["units"] == "s"
+                assert f[group]["retina-therm"].attrs["units"] == "K"
+
+        # each group has the config it was computed with
+        Tmax = {}
+        for group in groups:
+            config = yaml.safe_load(utils.read_attrs_from_file("batch.h5", group)["config"])
+            data = utils.read_from_file("batch.h5", "hdf5", group)
+            Tmax[config["temperature_rise"]["sensor"]["r"]] = max(data[:, 1])
+        assert len(Tmax) == 3
+        assert Tmax["0.0 cm"] > Tmax["0.008 cm"]
+
+        # existing results are skipped
+        mtime = pathlib.Path("batch.h5").stat().st_mtime
+        result = runner.invoke(
+            app,
+            [
+                "temperature-rise",
+                "input.yml",
+                "--batch-file",
+                "batch.h5",
+                "--skip-existing-outputs",
+            ],
+        )
+        assert result.exit_code == 0
+        assert pathlib.Path("batch.h5").stat().st_mtime == mtime
+
+
+@pytest.mark.timeout(60)
+def test_cli_rt_files(simple_config):
+    import numpy
+
+    from retina_therm import utils
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        t = numpy.arange(2001) * 1e-5
+        T = numpy.where(t < 1e-3, t / 1e-3, numpy.exp(-(t - 1e-3) / 1e-3))
+        utils.write_Tvst_to_file(numpy.c_[t, T], "Tvst.rt", "rt")
+
+        config = {
+            "multiple_pulse": {
+                "input_file": "Tvst.rt",
+                "output_file": "MP-Tvst.rt",
+                "output_config_file": "MP-CONFIG.yml",
+                "pulses": [
+                    {"arrival_time": "0 s", "duration": "1 ms", "scale": 1},
+                    {"arrival_time": "5 ms", "duration": "1 ms", "scale": 1},
+                ],
+                "time": {"max": "10 ms"},
+            }
+        }
+        pathlib.Path("input.yml").write_text(yaml.dump(config))
+        result = runner.invoke(app, ["multiple-pulse", "input.yml", "--njobs", "1"])
+        assert result.exit_code == 0
+        mp = utils.read_Tvst_from_file("MP-Tvst.rt", "rt")
+        assert mp[-1, 0] == pytest.approx(10e-3)
+        assert len(mp) == 1001
+
+        # the same history read from a text file
+        utils.write_Tvst_to_file(numpy.c_[t, T], "Tvst.txt", "txt")
+        config["multiple_pulse"]["input_file"] = "Tvst.txt"
+        config["multiple_pulse"]["output_file"] = "MP-Tvst.txt"
+        pathlib.Path("input.yml").write_text(yaml.dump(config))
+        result = runner.invoke(app, ["multiple-pulse", "input.yml", "--njobs", "1"])
+        assert result.exit_code == 0
+        assert mp == pytest.approx(numpy.loadtxt("MP-Tvst.txt"))
+
+        result = runner.invoke(
+            app, ["truncate-temperature-history-file", "Tvst.rt", "--threshold", "0.1"]
+        )
+        assert result.exit_code == 0
+        truncated = utils.read_Tvst_from_file("Tvst.rt", "rt")
+        assert len(truncated) < len(t)
+        assert truncated[-1, 1] > 0.1
+        assert truncated == pytest.approx(numpy.c_[t, T][: len(truncated)])
+        assert numpy.all(T[len(truncated) :] <= 0.1)
+
+
+@pytest.mark.timeout(60)
+def test_cli_truncate_rt_file_fractional_threshold():
+    import numpy
+
+    from retina_therm import utils
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        # a long history, so Tmax has to be found without stepping through the samples in python
+        t = numpy.arange(2_000_000) * 1e-6
+        T = 4 * numpy.exp(-t / 0.1)
+        utils.write_Tvst_to_file(numpy.c_[t, T], "Tvst.rt", "rt")
+
+        result = runner.invoke(
+            app, ["truncate-temperature-history-file", "Tvst.rt", "--threshold", "0.25"]
+        )
+        assert result.exit_code == 0
+        truncated = utils.read_Tvst_from_file("Tvst.rt", "rt")
+        # the threshold is 0.25 * Tmax = 1 K
+        assert len(truncated) == numpy.count_nonzero(T > 1)
+        assert truncated[-1, 1] > 1
+        assert truncated == pytest.approx(numpy.c_[t, T][: len(truncated)])
+
+
+@pytest.mark.timeout(20)
+def test_cli_output_file_digits(simple_config):
+    import numpy
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        simple_config["temperature_rise"]["method"] = "step"
+        simple_config["temperature_rise"]["output_file_digits"] = 6
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+        result = runner.invoke(app, ["temperature-rise", "input.yml"])
+        assert result.exit_code == 0
+        lines = pathlib.Path("output/CW/output-Tvst.txt").read_text().split("\n")
+        assert lines[1].split()[0] == "1.00000e-04"
+        assert numpy.loadtxt("output/CW/output-Tvst.txt").shape == (201, 2)
+
+
+@pytest.mark.timeout(60)
+def test_cli_damage():
+    import math
+
+    import numpy
+
+    from retina_therm import damage, utils
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        t = numpy.arange(1001) * 1e-6
+        dT = numpy.where(t > 0, 10, 0)
+        dT[-1] = 0
+        utils.write_Tvst_to_file(numpy.c_[t, dT], "Tvst.txt", "txt")
+        utils.write_Tvst_to_file(numpy.c_[t, dT], "Tvst.rt", "rt")
+
+        config = {
+            "damage": {
+                "input_file": {"@batch": ["Tvst.txt", "Tvst.rt"]},
+                "output_file": "$(str(${input_file}).split('.')[-1])-DAMAGE.yml",
+                "output_config_file": "$(str(${input_file}).split('.')[-1])-CONFIG.yml",
+                "A": "3.1e99 1/s",
+                "Ea": "6.28e5 J/mol",
+                "T0": "310 K",
+            }
+        }
+        pathlib.Path("input.yml").write_text(yaml.dump(config))
+        result = runner.invoke(
+            app, ["damage", "input.yml", "--njobs", "2", "--cache-dir", "cache"]
+        )
+        assert result.exit_code == 0
+
+        expected = damage.compute_threshold_scale(t, dT, 3.1e99, 6.28e5, 310)
+        for fmt in ["txt", "rt"]:
+            scale = yaml.safe_load(pathlib.Path(f"{fmt}-DAMAGE.yml").read_text())["scale"]
+            assert scale == pytest.approx(expected)
+            assert pathlib.Path(f"{fmt}-CONFIG.yml").exists()
+        assert len(list(pathlib.Path("cache").glob("*.npz"))) == 2
+
+        result = runner.invoke(app, ["damage", "input.yml", "--write-threshold-profiles"])
+        assert result.exit_code == 0
+        profile = utils.read_Tvst_from_file("Tvst-threshold_profile.txt", "txt")
+        assert profile[:, 1] == pytest.approx(expected * dT)
+        assert pathlib.Path("Tvst-threshold_profile.rt").exists()
+
+        # a history that never rises can't be used
+        utils.write_Tvst_to_file(numpy.c_[t, 0 * dT], "Tvst.txt", "txt")
+        result = runner.invoke(app, ["damage", "input.yml"])
+        assert result.exit_code == 1
+
+
+@pytest.mark.timeout(60)
+def test_cli_pipeline(simple_config):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        simple_config["multiple_pulse"] = {
+            "input_file": "$(${/temperature_rise/output_file})",
+            "output_file": "output/MP/Tvst-$(${N}).txt",
+            "output_config_file": "output/MP/CONFIG-$(${N}).yml",
+            "N": {"@batch": [1, 2, 4]},
+            "pulses": "$( [ {'arrival_time': f'{2*n} ms', 'duration': '1 ms', 'scale': 1} for n in range(${N}) ] )",
+            "time": {"max": "15 ms"},
+        }
+        simple_config["damage"] = {
+            "input_file": "$(${/multiple_pulse/output_file})",
+            "output_file": "output/DAMAGE/$(${/multiple_pulse/N}).yml",
+            "output_config_file": "output/DAMAGE/CONFIG-$(${/multiple_pulse/N}).yml",
+            "A": "3.1e99 1/s",
+            "Ea": "6.28e5 J/mol",
+            "T0": "310 K",
+        }
+        pathlib.Path("input.yml").write_text(yaml.dump(simple_config))
+
+        # only the damage thresholds are written, and the temperature rise is only computed once
+        result = runner.invoke(
+            app, ["pipeline", "input.yml", "--njobs", "2", "--verbose"]
+        )
+        assert result.exit_code == 0
+        assert "Running 3 configuration(s) as 7 stage(s)" in result.stdout
+        assert not pathlib.Path("output/CW").exists()
+        assert not pathlib.Path("output/MP").exists()
+        scales = {}
+        for N in [1, 2, 4]:
+            scales[N] = yaml.safe_load(
+                pathlib.Path(f"output/DAMAGE/{N}.yml").read_text()
+            )["scale"]
+            assert pathlib.Path(f"output/DAMAGE/CONFIG-{N}.yml").exists()
+        assert scales[1] > scales[2] > scales[4]
+
+        # the same thresholds are computed by running the commands separately
+        for cmd in ["temperature-rise", "multiple-pulse", "damage"]:
+            result = runner.invoke(app, [cmd, "input.yml", "--njobs", "2"])
+            assert result.exit_code == 0
+        for N in [1, 2, 4]:
+            scale = yaml.safe_load(pathlib.Path(f"output/DAMAGE/{N}.yml").read_text())[
+                "scale"
+            ]
+            assert scale == pytest.approx(scales[N], rel=1e-8)
+
+        # intermediate outputs can be written too
+        shutil.rmtree("output")
+        result = runner.invoke(
+            app,
+            [
+                "pipeline",
+                "input.yml",
+                "--write",
+                "temperature_rise",
+                "--write",
+                "multiple_pulse",
+            ],
+        )
+        assert result.exit_code == 0
+        assert pathlib.Path("output/CW/output-Tvst.txt").exists()
+        assert len(list(pathlib.Path("output/MP").glob("Tvst-*.txt"))) == 3
+        assert not pathlib.Path("output/DAMAGE").exists()
+
+        result = runner.invoke(app, ["pipeline", "input.yml", "--write", "nothing"])
+        assert result.exit_code != 0
+
+
+def test_pipeline_graph(simple_config):
+    import copy
+
+    from fspathtree import fspathtree
+
+    from retina_therm.jobs import build_pipeline_graph
+
+    mp = {
+        "input_file": "output/CW/output-Tvst.txt",
+        "output_file": "output/MP/Tvst.txt",
+        "output_config_file": "output/MP/CONFIG.yml",
+        "pulses": [{"arrival_time": "0 s", "duration": "1 ms", "scale": 1}],
+    }
+    dmg = {
+        "input_file": "output/MP/Tvst.txt",
+        "output_file": "output/DAMAGE.yml",
+        "output_config_file": "output/DAMAGE-CONFIG.yml",
+        "A": "3.1e99 1/s",
+        "Ea": "6.28e5 J/mol",
+        "T0": "310 K",
+    }
+    # the configs are not rendered here
+    simple_config["laser"]["one_over_e_radius"] = "50 um"
+    other_cw = copy.deepcopy(simple_config)
+    other_cw["temperature_rise"]["output_file"] = "output/CW/other-Tvst.txt"
+    from_file = {"damage": dict(dmg, input_file="Tvst.txt", output_file="other.yml")}
+    # stages are connected by their input and output files, even across configs
+    configs = list(
+        map(
+            fspathtree,
+            [
+                simple_config,
+                other_cw,
+                {"multiple_pulse": mp},
+                {"damage": dmg},
+                from_file,
+            ],
+        )
+    )
+
+    nodes = build_pipeline_graph(configs)
+    names = sorted(n["name"] for n in nodes.values())
+    # the temperature rise is the same for both configs since it isn't written
+    assert names == ["damage", "damage", "multiple_pulse", "temperature_rise"]
+    by_name = {n["name"]: n for n in nodes.values() if n["input"] is not None}
+    assert nodes[by_name["multiple_pulse"]["input"]]["name"] == "temperature_rise"
+    assert by_name["damage"]["input"] == by_name["multiple_pulse"]["key"]
+    roots = [n for n in nodes.values() if n["input"] is None and n["name"] == "damage"]
+    assert len(roots) == 1
+    assert roots[0]["config"]["damage"]["output_file"] == pathlib.Path("other.yml")
+
+    # both temperature rises are written
+    nodes = build_pipeline_graph(configs, ["temperature_rise", "damage"])
+    assert len(nodes) == 5
+
+    # nothing depends on the temperature rise if it isn't written
+    nodes = build_pipeline_graph(configs[:2], ["damage"])
+    assert len(nodes) == 0
+
+    # a stage can't depend on itself
+    with pytest.raises(RuntimeError):
+        build_pipeline_graph(
+            [fspathtree({"multiple_pulse": dict(mp, input_file=mp["output_file"])})]
+        )
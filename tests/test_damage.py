@@ -0,0 +1,90 @@
+import math
+
+import numpy
+import pytest
+
+from retina_therm import damage
+
+# damage parameters for the retina (Welch and Polhamus)
+A = 3.1e99
+Ea = 6.28e5
+T0 = 310
+
+
+def test_trapezoid_weights():
+    t = numpy.array([0, 1, 3, 6])
+    w = damage.get_trapezoid_weights(t)
+    assert w == pytest.approx([0.5, 1.5, 2.5, 1.5])
+    assert sum(w * t**2) == pytest.approx(numpy.trapezoid(t**2, t))
+
+
+def test_damage_integral():
+    t = numpy.linspace(0, 1e-3, 1001)
+    T = numpy.ones(len(t)) * 340
+
+    expected = A * 1e-3 * math.exp(-Ea / (damage.R * 340))
+    assert damage.compute_damage(t, T, A, Ea) == pytest.approx(expected)
+    assert damage.compute_log_damage(t, T, A, Ea) == pytest.approx(math.log(expected))
+
+    history = damage.compute_damage_history(t, T, A, Ea)
+    assert history[0] == 0
+    assert history[-1] == pytest.approx(expected)
+    assert history[500] == pytest.approx(expected / 2)
+
+    # the log damage does not underflow at body temperature
+    assert damage.compute_damage(t, T0 * numpy.ones(len(t)), A, Ea) > 0
+    assert math.isfinite(damage.compute_log_damage(t, 1 * numpy.ones(len(t)), A, Ea))
+
+
+@pytest.mark.parametrize("dT", [0.1, 10, 1000])
+def test_threshold_scale(dT):
+    tau = 1e-3
+    t = numpy.linspace(0, tau, 101)
+    # a constant temperature rise has an analytic threshold
+    expected = (Ea / (damage.R * math.log(A * tau)) - T0) / dT
+    scale = damage.compute_threshold_scale(t, dT * numpy.ones(len(t)), A, Ea, T0)
+    assert scale == pytest.approx(expected, rel=1e-9)
+    assert damage.compute_damage(t, T0 + scale * dT, A, Ea) == pytest.approx(1)
+
+
+@pytest.mark.parametrize(
+    "method", [damage.compute_threshold_scale, damage.compute_threshold_scale_bisect]
+)
+def test_threshold_scale_errors(method):
+    t = numpy.linspace(0, 1e-3, 101)
+    with pytest.raises(RuntimeError):
+        method(t, numpy.zeros(len(t)), A, Ea, T0)
+    # the baseline temperature is above the threshold
+    with pytest.raises(RuntimeError):
+        method(t, numpy.ones(len(t)), A, Ea, 400)
+
+
+def test_batched_damage():
+    t = numpy.arange(100_001) * 1e-6
+    dT = numpy.exp(-t / 1e-2) * (1 - numpy.exp(-t / 1e-3))
+    scales = numpy.geomspace(10, 1000, 20)
+
+    log_damage = damage.compute_log_damage_batch(t, dT, A, Ea, T0, scales)
+    expected = [damage.compute_log_damage(t, T0 + s * dT, A, Ea) for s in scales]
+    assert log_damage == pytest.approx(expected, rel=1e-12)
+    assert log_damage == pytest.approx(
+        damage.compute_log_damage_batch(t, dT, A, Ea, T0, scales, rtol=None), rel=1e-12
+    )
+
+    # at high temperatures only the samples near the peak contribute
+    keep = damage.get_significant_samples(
+        numpy.log(damage.get_trapezoid_weights(t)), dT, A, Ea, T0, [200, 300], 1e-12
+    )
+    assert keep[numpy.argmax(dT)]
+    assert sum(keep) < len(t) / 4
+
+
+@pytest.mark.parametrize("tau", [1e-6, 1e-3, 1])
+def test_threshold_scale_methods(tau):
+    t = numpy.linspace(0, 5 * tau, 10_001)
+    dT = numpy.where(t < tau, t / tau, numpy.exp(-(t - tau) / tau))
+    scale = damage.compute_threshold_scale(t, dT, A, Ea, T0)
+    assert scale == pytest.approx(
+        damage.compute_threshold_scale_bisect(t, dT, A, Ea, T0), rel=1e-9
+    )
+    assert damage.compute_damage(t, T0 + scale * dT, A, Ea) == pytest.approx(1, rel=1e-6)
@@ -410,3 +410,197 @@ def test_derivation_bug():
 
     assert G1(0, 0, 1e-8) == G2(10e-4, 0, 1e-8)
     assert G1(0, 0, 1e-3) == G2(10e-4, 0, 1e-3)
+
+
+def test_array_evaluation_matches_scalar_evaluation():
+    config = {
+        "mua": "720 1/cm",
+        "k": "0.00628 W/cm/K",
+        "rho": "1 g/cm^3",
+        "c": "4.1868 J/g/K",
+        "E0": "1 W/cm^2",
+        "d": "10 um",
+        "z0": "0 um",
+        "one_over_e_radius": "50 um",
+        "with_units": False,
+    }
+    t = numpy.concatenate([[0], numpy.logspace(-9, 1, 100)])
+
+    for use_approximations in [True, False]:
+        config["use_approximations"] = use_approximations
+        for G in [
+            greens_functions.LargeBeamAbsorbingLayerGreensFunction(config),
+            greens_functions.FlatTopBeamAbsorbingLayerGreensFunction(config),
+        ]:
+            for z, r in [(0, 0), (-0.001, 0), (5e-4, 0.001), (0.002, 0.01)]:
+                T = G(z, r, t)
+                assert type(T) == numpy.ndarray
+                assert len(T) == len(t)
+                for i in range(len(t)):
+                    assert T[i] == pytest.approx(G(z, r, t[i]), rel=1e-9, nan_ok=True)
+
+    # z and r broadcast against tp
+    G = greens_functions.FlatTopBeamAbsorbingLayerGreensFunction(config)
+    z = numpy.array([0, 5e-4, 1e-3])
+    T = G(z[:, None], 0, t[None, :])
+    assert T.shape == (3, len(t))
+    assert T[1, 10] == pytest.approx(G(z[1], 0, t[10]), rel=1e-9)
+
+
+def test_float_kernel_vs_multi_precision_for_highly_absorbing_layer():
+    # the double precision kernel should not overflow for large mua and long times,
+    # and should agree with the multi-precision implementation.
+    config = {
+        "mua": "720 1/cm",
+        "k": "0.00628 W/cm/K",
+        "rho": "1 g/cm^3",
+        "c": "4.1868 J/g/K",
+        "E0": "1 W/cm^2",
+        "d": "10 um",
+        "z0": "0 um",
+        "with_units": False,
+        "use_approximations": False,
+    }
+    G_float = greens_functions.LargeBeamAbsorbingLayerGreensFunction(config)
+    config["use_multi_precision"] = True
+    G_mp = greens_functions.LargeBeamAbsorbingLayerGreensFunction(config)
+
+    zs = numpy.linspace(-0.005, 0.005, 11)
+    ts = numpy.logspace(-9, 1, 21)
+    T = G_float(zs[:, None], 0, ts[None, :])
+    assert numpy.all(numpy.isfinite(T))
+
+    # mpmath needs more than 1500 digits to resolve times longer than 1 s
+    ts = ts[ts <= 1]
+    T = T[:, : len(ts)]
+    with mp.workdps(1500):
+        for i, z in enumerate(zs):
+            for j, t in enumerate(ts):
+                exact = float(G_mp(float(z), 0, float(t)))
+                assert G_float(z, 0, t) == pytest.approx(exact, rel=1e-10, abs=1e-250)
+                assert T[i, j] == pytest.approx(exact, rel=1e-10, abs=1e-250)
+
+
+def test_time_kernel_cache():
+    config = {
+        "laser": {"E0": "1 W/cm^2", "profile": "flattop", "one_over_e_radius": "100 um"},
+        "thermal": {"k": "0.00628 W/cm/K", "rho": "1 g/cm^3", "c": "4.1868 J/g/K"},
+        "layers": [
+            {"mua": "310 1/cm", "d": "10 um", "z0": "0 um"},
+            {"mua": "53 1/cm", "d": "100 um", "z0": "10 um"},
+        ],
+        "simulation": {"time_kernel_cache": {"enabled": True}},
+    }
+    greens_functions.clear_time_kernel_cache()
+
+    G = greens_functions.MultiLayerGreensFunction(config)
+    t = numpy.concatenate([[0], numpy.logspace(-10, 0, 200)])
+    for z, r in [(1e-4, 0), (0, 0.005), (-0.001, 0), (0.02, 0.05)]:
+        T = G(z, r, t)
+        T_exact = G.evaluate(z, r, t)
+        assert T == pytest.approx(T_exact, rel=0, abs=1e-6 * max(abs(T_exact)))
+        assert G(z, r, 1e-3) == pytest.approx(G.evaluate(z, r, 1e-3), rel=1e-6)
+        assert G(z, r, 0) == G.evaluate(z, r, 0)
+
+    # the table is extended when later times are requested
+    assert G(1e-4, 0, 10) == pytest.approx(G.evaluate(1e-4, 0, 10), rel=1e-6)
+    assert G.time_kernel(1e-4, 0).tmax >= 10
+
+    # the kernel is shared with other instances that only differ in irradiance
+    num_kernels = len(greens_functions._time_kernel_cache)
+    config["laser"]["E0"] = "2 W/cm^2"
+    G2 = greens_functions.MultiLayerGreensFunction(config)
+    assert G2(1e-4, 0, 1e-3) == pytest.approx(2 * G(1e-4, 0, 1e-3))
+    assert G2.time_kernel(1e-4, 0) is G.time_kernel(1e-4, 0)
+    assert len(greens_functions._time_kernel_cache) == num_kernels
+
+    # but not with instances that have different physics
+    config["thermal"]["k"] = "0.01 W/cm/K"
+    G3 = greens_functions.MultiLayerGreensFunction(config)
+    assert G3.time_kernel(1e-4, 0) is not G.time_kernel(1e-4, 0)
+
+    # the cache size is bounded
+    for i in range(greens_functions.time_kernel_cache_max_size + 1):
+        G.time_kernel(1e-4, i * 1e-4)
+    assert (
+        len(greens_functions._time_kernel_cache)
+        == greens_functions.time_kernel_cache_max_size
+    )
+
+    config["simulation"]["use_multi_precision"] = True
+    with pytest.raises(RuntimeError):
+        greens_functions.MultiLayerGreensFunction(config)
+
+    greens_functions.clear_time_kernel_cache()
+
+
+def test_time_kernel_without_enough_refinements():
+    calls = []
+
+    def f(t):
+        calls.append(len(t))
+        return numpy.sin(1e3 * t) * numpy.exp(-t)
+
+    # the grid cannot resolve f without refinements
+    kernel = greens_functions.TabulatedTimeKernel(f, 1e-6, rtol=1e-12, max_refinements=0)
+    t = numpy.logspace(-6, 1, 101)
+    assert kernel(t) == pytest.approx(f(t), rel=1e-15, abs=0)
+    assert not kernel.converged
+    assert kernel.error > 1e-12
+
+    # later times are evaluated directly too, without trying to build the table again
+    calls.clear()
+    T = kernel(100.0)
+    assert calls == [1]
+    assert T == f(numpy.array([100.0]))[0]
+
+    # with enough refinements the table is used
+    kernel = greens_functions.TabulatedTimeKernel(
+        lambda t: numpy.exp(-t), 1e-6, rtol=1e-6
+    )
+    assert kernel(t) == pytest.approx(numpy.exp(-t), rel=1e-5)
+    assert kernel.converged
+
+
+def test_step_response_matches_numerical_integration():
+    config = {
+        "mua": "720 1/cm",
+        "k": "0.00628 W/cm/K",
+        "rho": "1 g/cm^3",
+        "c": "4.1868 J/g/K",
+        "E0": "1 W/cm^2",
+        "d": "10 um",
+        "z0": "0 um",
+        "one_over_e_radius": "50 um",
+        "with_units": False,
+    }
+    ts = numpy.array([1e-8, 1e-6, 1e-4, 1e-2, 1])
+
+    for mua in ["720 1/cm", "1 1/cm"]:
+        config["mua"] = mua
+        for G in [
+            greens_functions.LargeBeamAbsorbingLayerGreensFunction(config),
+            greens_functions.FlatTopBeamAbsorbingLayerGreensFunction(config),
+            greens_functions.GaussianBeamAbsorbingLayerGreensFunction(config),
+        ]:
+            # compare relative to the temperature rise in the layer
+            # so that we don't compare round off error far from the layer.
+            scale = G.mua * G.E0 / G.rho / G.c * ts
+            for z, r in [(-1e-4, 0), (0, 0), (5e-4, 20e-4), (5e-4, 80e-4)]:
+                S = G.step_response(z, r, ts)
+                assert type(S) == numpy.ndarray
+                assert len(S) == len(ts)
+                for i, t in enumerate(ts):
+                    expected = scipy.integrate.quad(
+                        lambda tp: G(z, r, tp),
+                        0,
+                        t,
+                        epsabs=1e-12 * scale[i],
+                        epsrel=1e-10,
+                        limit=1000,
+                        points=[t * 1e-6, t * 1e-3],
+                    )[0]
+                    assert S[i] == pytest.approx(expected, rel=1e-7, abs=1e-9 * scale[i])
+
+                assert G.step_response(z, r, ts[2]) == pytest.approx(S[2])
+                assert G.step_response(z, r, 0) == 0
@@ -111,3 +111,41 @@ def test_finding_index_for_time():
     assert multi_pulse_builder.find_index_for_time(t, 3e-6) == 5
     assert multi_pulse_builder.find_index_for_time(t, 4e-6) is None
     assert multi_pulse_builder.find_index_for_time(t, 5e-6) is None
+
+
+def test_finding_indices_for_times():
+    t = numpy.array([0, 0.5e-6, 1e-6, 1.5e-6, 2e-6, 3e-6])
+    times = numpy.array([0, 0.2e-6, 0.25e-6, 0.3e-6, 1e-6, 2e-6, 2.9e-6, 3e-6])
+
+    indices = multi_pulse_builder.find_indices_for_times(t, times)
+    assert list(indices) == [0, 0, 0, 1, 2, 4, 5, 5]
+    for i, time in zip(indices, times):
+        assert i == multi_pulse_builder.find_index_for_time(t, time, 0.5e-6)
+
+
+@pytest.mark.parametrize("method", ["direct", "fft", "auto"])
+def test_build_methods(method):
+    t = numpy.arange(0, 10 + 0.01, 0.01)
+    T = 37 + 1 - numpy.exp(-t)
+
+    mp_builder = multi_pulse_builder.MultiPulseBuilder()
+    mp_builder.set_temperature_history(t, T)
+    expected = numpy.zeros(len(t))
+    for n in range(40):
+        # arrival times that are not on the grid are rounded to the closest time
+        mp_builder.add_contribution(0.25 * n + 0.001, 1)
+        mp_builder.add_contribution(0.25 * n + 0.1, -0.5)
+        i = round(25 * n)
+        expected[i:] += 1 - numpy.exp(-t[: len(t) - i])
+        expected[i + 10 :] -= 0.5 * (1 - numpy.exp(-t[: len(t) - i - 10]))
+    # contributions after the end of the history are ignored
+    mp_builder.add_contribution(20, 1)
+
+    assert mp_builder.build(method) == pytest.approx(37 + expected, abs=1e-12)
+
+    mp_builder.add_contribution(-1, 1)
+    with pytest.raises(RuntimeError):
+        mp_builder.build(method)
+
+    with pytest.raises(RuntimeError):
+        mp_builder.build("unknown")
@@ -252,3 +252,157 @@ def test_parallel_job_processor_throwing_exception_in_child():
         r = p.msg_recv()
         assert r["type"] == "exception"
         assert "I can't do work" in r["payload"]
+
+
+def test_parallel_shared_array_results():
+    import pickle
+
+    import numpy
+
+    with SharedArray([3, 2]) as a:
+        a.array[...] = numpy.arange(6).reshape([3, 2])
+        # only the descriptor is pickled
+        assert len(pickle.dumps(a)) < 200
+        b = pickle.loads(pickle.dumps(a))
+        assert b.name == a.name
+        assert b.shape == (3, 2)
+        assert numpy.all(b.array == a.array)
+        b.array[0, 0] = 10
+        assert a.array[0, 0] == 10
+        b.close()
+
+    class FillProcess(JobProcessorBase):
+        def run_job(self, job):
+            output = job["output"]
+            output.array[job["offset"] : job["offset"] + job["n"]] = job["offset"]
+            output.close()
+            return job["n"]
+
+    class ReturnProcess(JobProcessorBase):
+        def run_job(self, n):
+            return SharedArray.from_array(numpy.arange(n))
+
+    try:
+        # children write into a block owned by the parent
+        controller = BatchJobController(FillProcess, njobs=2)
+        controller.start()
+        with SharedArray(100) as output:
+            jobs = [{"output": output, "offset": i, "n": 10} for i in range(0, 100, 10)]
+            results = controller.run_jobs(jobs)
+            assert results == [10] * 10
+            assert numpy.all(output.array == numpy.repeat(numpy.arange(0, 100, 10), 10))
+        controller.stop()
+        controller.wait()
+
+        # children return a block that the parent frees
+        controller = BatchJobController(ReturnProcess, njobs=2)
+        controller.start()
+        results = controller.run_jobs([5, 10])
+        assert numpy.all(results[0].array == numpy.arange(5))
+        assert numpy.all(results[1].array == numpy.arange(10))
+        for r in results:
+            r.unlink()
+        controller.stop()
+        controller.wait()
+    finally:
+        controller.kill()
+
+
+def test_parallel_job_graph():
+    class SleepProcess(JobProcessorBase):
+        def run_job(self, t):
+            time.sleep(t)
+            return t
+
+    def task(t, extra=0):
+        def run(*inputs):
+            results = yield [t]
+            return sum(inputs) + results[0] + extra
+
+        return run
+
+    def failing_task():
+        raise RuntimeError("failed")
+        yield []
+
+    try:
+        controller = BatchJobController(SleepProcess, njobs=2)
+        controller.start()
+        start = time.perf_counter()
+        results = controller.run_job_graph(
+            {
+                "a": task(0.5),
+                "b": task(0.5),
+                "c": task(1),
+                "d": task(0, 1),
+                "e": failing_task,
+                "f": task(0),
+                "g": task(0),
+            },
+            {"b": ["a"], "d": ["b", "c"], "f": ["e"], "g": ["f"]},
+        )
+        end = time.perf_counter()
+
+        # b starts as soon as a is done, while c is still running
+        assert end - start < 1.4
+        assert results["a"] == 0.5
+        assert results["b"] == 1
+        assert results["c"] == 1
+        assert results["d"] == 3
+        # tasks that depend on a failed task are not run
+        assert results["e"] is None
+        assert results["f"] is None
+        assert results["g"] is None
+
+        with pytest.raises(RuntimeError):
+            controller.run_job_graph({"a": task(0)}, {"a": ["b"]})
+        with pytest.raises(RuntimeError):
+            controller.run_job_graph({"a": task(0), "b": task(0)}, {"a": ["b"], "b": ["a"]})
+
+        controller.stop()
+        controller.wait()
+    finally:
+        controller.kill()
+
+
+def test_parallel_batch_job_controller_waits_without_polling():
+    class SleepProcess(JobProcessorBase):
+        def run_job(self, t):
+            time.sleep(t)
+            return t
+
+    try:
+        controller = BatchJobController(SleepProcess, njobs=2)
+        controller.start()
+        start = time.process_time()
+        results = controller.run_jobs([0.5, 0.5, 0.5, 0.5])
+        end = time.process_time()
+        controller.stop()
+        controller.wait()
+
+        assert results == [0.5] * 4
+        # the parent should be idle while the children work
+        assert end - start < 0.2
+    finally:
+        controller.kill()
+
+
+def test_parallel_message_validation():
+    assert validate_message(mkmsg("call", 1)) == {"type": "call", "payload": 1}
+    with pytest.raises(RuntimeError):
+        mkmsg("missing", 1)
+    with pytest.raises(RuntimeError):
+        validate_message({"type": "missing", "payload": 1})
+    with pytest.raises(RuntimeError):
+        validate_message({"type": "call"})
+    with pytest.raises(RuntimeError):
+        validate_message("call")
+
+    class myProcess(JobProcessorBase):
+        def run_job(self, arg=None):
+            return arg
+
+    with myProcess() as p:
+        p.msg_send({"type": "missing", "payload": None})
+        r = p.msg_recv()
+        assert r["type"] == "error"
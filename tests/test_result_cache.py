@@ -0,0 +1,55 @@
+import os
+import time
+
+import numpy
+import pytest
+
+from retina_therm.result_cache import *
+
+
+def test_result_cache(tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+    assert cache.get("missing") is None
+    assert "missing" not in cache
+
+    cache.put("a", t=numpy.arange(3), T=numpy.ones([3, 2]))
+    assert "a" in cache
+    data = cache.get("a")
+    assert numpy.all(data["t"] == [0, 1, 2])
+    assert data["T"].shape == (3, 2)
+
+    # entries are replaced
+    cache.put("a", t=numpy.arange(4))
+    assert len(cache.get("a")["t"]) == 4
+    assert list(cache.get("a").keys()) == ["t"]
+
+    cache.clear()
+    assert "a" not in cache
+
+
+def test_result_cache_lru_eviction(tmp_path):
+    array = numpy.zeros([1000])
+    cache = ResultCache(tmp_path, max_size=3.5 * array.nbytes)
+
+    for key in ["a", "b", "c"]:
+        cache.put(key, x=array)
+        # make sure modification times differ
+        mtime = time.time() - 100 + len(os.listdir(tmp_path))
+        os.utime(cache.get_path(key), (mtime, mtime))
+    assert all(map(lambda k: k in cache, ["a", "b", "c"]))
+
+    # reading "a" makes "b" the least recently used entry
+    assert cache.get("a") is not None
+    cache.put("d", x=array)
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert "d" in cache
+
+
+def test_file_id(tmp_path):
+    (tmp_path / "a.txt").write_text("1 2\n")
+    (tmp_path / "b.txt").write_text("1 2\n")
+    (tmp_path / "c.txt").write_text("1 3\n")
+    assert get_file_id(tmp_path / "a.txt") == get_file_id(tmp_path / "b.txt")
+    assert get_file_id(tmp_path / "a.txt") != get_file_id(tmp_path / "c.txt")
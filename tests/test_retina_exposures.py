@@ -186,3 +186,204 @@ def test_gf_integrators():
         0, 0, numpy.arange(0, 0.001, 0.0001), {"duration": "0.001 s"}
     )
     assert len(T) == 10
+
+
+def test_step_response_integrator():
+    config = {
+        "laser": {
+            "E0": "1 W/cm^2",
+            "profile": "flattop",
+            "one_over_e_radius": "100 um",
+            "pulse_duration": "100 us",
+            "pulse_period": "1 ms",
+            "duration": "5 ms",
+        },
+        "thermal": {"k": "0.00628 W/cm/K", "rho": "1 g/cm^3", "c": "4.1868 J/g/K"},
+        "layers": [
+            {"mua": "310 1/cm", "d": "10 um", "z0": "0 um"},
+            {"mua": "53 1/cm", "d": "100 um", "z0": "10 um"},
+        ],
+        "simulation": {},
+    }
+    t = numpy.arange(0, 10e-3, 100e-6)
+    for exp in [
+        greens_functions.CWRetinaLaserExposure(config),
+        greens_functions.PulsedRetinaLaserExposure(config),
+    ]:
+        for z, r in [(1e-4, 0), (1e-4, 80e-4)]:
+            T_step = exp.temperature_rise(z, r, t, method="step")
+            T_quad = exp.temperature_rise(z, r, t, method="quad")
+            assert len(T_step) == len(t)
+            assert T_step == pytest.approx(T_quad, rel=1e-6, abs=1e-7 * max(T_quad))
+
+    # the step response requires float evaluation
+    config["simulation"]["use_multi_precision"] = True
+    exp = greens_functions.CWRetinaLaserExposure(config)
+    with pytest.raises(RuntimeError):
+        exp.temperature_rise(0, 0, t, method="step")
+
+
+def test_superposition_integrator():
+    config = {
+        "laser": {
+            "E0": "1 W/cm^2",
+            "profile": "flattop",
+            "one_over_e_radius": "100 um",
+            "pulse_duration": "1 us",
+            "pulse_period": "10 us",
+            "duration": "1 ms",
+        },
+        "thermal": {"k": "0.00628 W/cm/K", "rho": "1 g/cm^3", "c": "4.1868 J/g/K"},
+        "layers": [
+            {"mua": "310 1/cm", "d": "10 um", "z0": "0 um"},
+            {"mua": "53 1/cm", "d": "100 um", "z0": "10 um"},
+        ],
+        "simulation": {},
+    }
+    # regular pulse train
+    exp = greens_functions.PulsedRetinaLaserExposure(config)
+    for t in [numpy.arange(0, 2e-3, 10e-6), numpy.arange(0, 2e-3, 3.3e-6)]:
+        for z, r in [(1e-4, 0), (1e-4, 80e-4)]:
+            T_superposition = exp.temperature_rise(z, r, t, method="superposition")
+            T_step = exp.temperature_rise(z, r, t, method="step")
+            assert len(T_superposition) == len(t)
+            assert T_superposition == pytest.approx(
+                T_step, rel=1e-6, abs=1e-8 * max(T_step)
+            )
+
+    # arbitrary arrival times
+    integrator = greens_functions.GreensFunctionSuperpositionIntegrator(exp.G)
+    t = numpy.arange(0, 1e-3, 1e-6)
+    T = integrator.temperature_rise(
+        1e-4,
+        0,
+        t,
+        {
+            "tau": "10 us",
+            "arrival_times": ["0 us", "105.5 us", "0.25 ms"],
+            "scales": [1, 0.5, 2],
+        },
+    )
+    S = lambda t: exp.G.step_response(1e-4, 0, numpy.clip(t, 0, None))
+    T_expected = sum(
+        scale * (S(t - arrival) - S(t - arrival - 10e-6))
+        for arrival, scale in [(0, 1), (105.5e-6, 0.5), (250e-6, 2)]
+    )
+    assert T == pytest.approx(T_expected, rel=1e-3, abs=1e-4 * max(T_expected))
+    assert T[t < 105e-6] == pytest.approx(
+        T_expected[t < 105e-6], rel=1e-6, abs=1e-8 * max(T_expected)
+    )
+
+    # arbitrary arrival times given in the laser config
+    config["laser"]["pulse_duration"] = "10 us"
+    config["laser"]["contributions"] = [
+        {"arrival_time": "0 us", "scale": 1},
+        {"arrival_time": "105.5 us", "scale": 0.5},
+        {"arrival_time": "0.25 ms", "scale": 2},
+    ]
+    exp = greens_functions.PulsedRetinaLaserExposure(config)
+    assert exp.temperature_rise(1e-4, 0, t, method="superposition") == pytest.approx(T)
+    with pytest.raises(RuntimeError):
+        exp.temperature_rise(1e-4, 0, t, method="step")
+
+
+def test_superposition_integrator_long_pulse_trains():
+    config = {
+        "laser": {
+            "E0": "1 W/cm^2",
+            "profile": "flattop",
+            "one_over_e_radius": "100 um",
+            "pulse_duration": "10 ns",
+            "pulse_period": "10 us",
+            "duration": "5 ms",
+        },
+        "thermal": {"k": "0.00628 W/cm/K", "rho": "1 g/cm^3", "c": "4.1868 J/g/K"},
+        "layers": [
+            {"mua": "310 1/cm", "d": "10 um", "z0": "0 um"},
+            {"mua": "53 1/cm", "d": "100 um", "z0": "10 um"},
+        ],
+        "simulation": {},
+    }
+    exp = greens_functions.PulsedRetinaLaserExposure(config)
+    integrator = greens_functions.GreensFunctionSuperpositionIntegrator(exp.G)
+    integrator.max_grid_points = 2**12
+
+    # the step response is only evaluated on a bounded number of points
+    sizes = []
+
+    def record_step_response_sizes(G):
+        step_response = G.step_response
+
+        def recording_step_response(z, r, t):
+            sizes.append(len(t))
+            return step_response(z, r, t)
+
+        G.step_response = recording_step_response
+
+    # a grid that resolves the pulses would need 5e5 points
+    t = numpy.linspace(0, 8e-3, 237)
+    for z, r in [(1e-4, 0), (1e-4, 80e-4)]:
+        T = integrator.temperature_rise(z, r, t, exp.make_integrator_config())
+        T_step = exp.temperature_rise(z, r, t, method="step")
+        assert T == pytest.approx(T_step, rel=1e-4, abs=1e-4 * max(T_step))
+
+    # 1e5 pulses over 1 s would need 1e9 points
+    config["laser"]["duration"] = "1 s"
+    exp = greens_functions.PulsedRetinaLaserExposure(config)
+    record_step_response_sizes(exp.G)
+    t = numpy.linspace(0, 1, 1001)
+    T = {}
+    for max_grid_points in [2**12, 2**14]:
+        integrator = greens_functions.GreensFunctionSuperpositionIntegrator(exp.G)
+        integrator.max_grid_points = max_grid_points
+        sizes.clear()
+        T[max_grid_points] = integrator.temperature_rise(
+            1e-4, 0, t, exp.make_integrator_config()
+        )
+        bound = 2 * (max_grid_points + 3 * integrator.num_table_points)
+        assert max(sizes) <= bound
+    assert T[2**12] == pytest.approx(T[2**14], rel=1e-4, abs=1e-4 * max(T[2**14]))
+
+
+def test_trapezoid_integrator_rules():
+    config = {
+        "laser": {
+            "E0": "1 W/cm^2",
+            "profile": "flattop",
+            "one_over_e_radius": "100 um",
+            "pulse_duration": "100 us",
+            "pulse_period": "1 ms",
+            "duration": "5 ms",
+            "start": "0.35 ms",
+        },
+        "thermal": {"k": "0.00628 W/cm/K", "rho": "1 g/cm^3", "c": "4.1868 J/g/K"},
+        "layers": [
+            {"mua": "310 1/cm", "d": "10 um", "z0": "0 um"},
+            {"mua": "53 1/cm", "d": "100 um", "z0": "10 um"},
+        ],
+        "simulation": {},
+    }
+    exp = greens_functions.PulsedRetinaLaserExposure(config)
+    t = numpy.arange(0, 10e-3, 10e-6)
+    T_step = exp.temperature_rise(1e-4, 80e-4, t, method="step")
+
+    for rule, dt, rel in [
+        ("trapezoid", "1 us", 2e-3),
+        ("simpson", "1 us", 2e-3),
+        ("gauss-legendre", "1 us", 1e-6),
+        ("gauss-legendre", "10 us", 1e-3),
+    ]:
+        integrator = greens_functions.GreensFunctionTrapezoidIntegrator(exp.G, rule)
+        integrator.dt = Q_(dt)
+        T = integrator.temperature_rise(1e-4, 80e-4, t, exp.make_integrator_config())
+        assert len(T) == len(t)
+        assert T == pytest.approx(T_step, rel=0, abs=rel * max(T_step))
+
+    # times do not have to start at zero
+    integrator = greens_functions.GreensFunctionTrapezoidIntegrator(exp.G, "gauss-legendre")
+    integrator.dt = Q_("1 us")
+    T = integrator.temperature_rise(1e-4, 80e-4, t[500:], exp.make_integrator_config())
+    assert T == pytest.approx(T_step[500:], rel=0, abs=1e-6 * max(T_step))
+
+    with pytest.raises(RuntimeError):
+        greens_functions.GreensFunctionTrapezoidIntegrator(exp.G, "missing")
@@ -113,3 +113,115 @@ def test_writing_arrays_to_file(tmp_path):
 
 
 
+
+
+def test_hdf5_layout(tmp_path):
+    import h5py
+
+    with working_directory(tmp_path):
+        t = numpy.linspace(0, 1, 11)
+        T = 2 * t
+
+        retina_therm.utils.write_to_file(
+            "data.hdf5",
+            T,
+            fmt="hdf5",
+            axes={"t": t},
+            units={"t": "s", "retina-therm": "K"},
+            attrs={"config": "a: 1"},
+        )
+        with h5py.File("data.hdf5") as f:
+            assert f["t"].attrs["units"] == "s"
+            assert f["retina-therm"].attrs["units"] == "K"
+            assert f["retina-therm"].compression == "gzip"
+            assert f["retina-therm"].maxshape == (None,)
+        assert retina_therm.utils.read_attrs_from_file("data.hdf5")["config"] == "a: 1"
+
+        # times and temperatures are read back as columns
+        data = retina_therm.utils.read_from_file("data.hdf5", fmt="hdf5")
+        assert data.shape == (11, 2)
+        assert data[:, 0] == pytest.approx(t)
+        assert data[:, 1] == pytest.approx(T)
+
+        retina_therm.utils.append_to_file(
+            "data.hdf5", 2 * (t + 1.1), fmt="hdf5", axes={"t": t + 1.1}
+        )
+        data = retina_therm.utils.read_from_file("data.hdf5", fmt="hdf5")
+        assert data.shape == (22, 2)
+        assert data[:, 1] == pytest.approx(2 * data[:, 0])
+
+        # several results can be written to groups in one file
+        for i in range(3):
+            retina_therm.utils.write_to_file(
+                "batch.hdf5", i * T, fmt="hdf5", axes={"t": t}, group=f"config-{i}"
+            )
+        retina_therm.utils.write_to_file(
+            "batch.hdf5", 10 * T, fmt="hdf5", axes={"t": t}, group="config-1"
+        )
+        with h5py.File("batch.hdf5") as f:
+            assert sorted(f.keys()) == ["config-0", "config-1", "config-2"]
+        data = retina_therm.utils.read_from_file(
+            "batch.hdf5", fmt="hdf5", group="config-1"
+        )
+        assert data[:, 1] == pytest.approx(10 * T)
+
+
+def test_rt_files(tmp_path):
+    with working_directory(tmp_path):
+        t = numpy.arange(1001) * 1e-6
+        T = numpy.sin(t / 1e-4)
+        retina_therm.utils.write_Tvst_to_file(numpy.c_[t, T], "Tvst.rt", "rt")
+        assert pathlib.Path("Tvst.rt").stat().st_size == 8 * 1002
+
+        data = retina_therm.utils.read_Tvst_from_file("Tvst.rt", "rt")
+        assert data.shape == (1001, 2)
+        assert data[:, 0] == pytest.approx(t)
+        assert data[:, 1] == pytest.approx(T)
+        assert retina_therm.utils.read_from_file("Tvst.rt", "rt") == pytest.approx(data)
+
+        rt = retina_therm.utils.TvstRtFile("Tvst.rt")
+        assert len(rt) == 1001
+        assert rt.dt == pytest.approx(1e-6)
+        assert isinstance(rt.T, numpy.memmap)
+        window = rt.read(tmin=10e-6, tmax=20e-6)
+        assert window.shape == (11, 2)
+        assert window[:, 0] == pytest.approx(t[10:21])
+        assert window[:, 1] == pytest.approx(T[10:21])
+        assert rt.read(tmax=1).shape == (1001, 2)
+        assert rt.read(tmin=1).shape == (0, 2)
+
+        retina_therm.utils.append_to_file(
+            "Tvst.rt", numpy.c_[t[-1] + t[1:11], T[:10]], "rt"
+        )
+        assert len(retina_therm.utils.TvstRtFile("Tvst.rt")) == 1011
+        with pytest.raises(RuntimeError):
+            retina_therm.utils.append_to_file("Tvst.rt", numpy.c_[t[:10], T[:10]], "rt")
+
+        # rt files can only store uniform histories that start at zero
+        with pytest.raises(RuntimeError):
+            retina_therm.utils.write_Tvst_to_file(numpy.c_[t**2, T], "bad.rt", "rt")
+        with pytest.raises(RuntimeError):
+            retina_therm.utils.write_Tvst_to_file(numpy.c_[t + 1, T], "bad.rt", "rt")
+
+        pathlib.Path("bad.rt").write_bytes(b"1234")
+        with pytest.raises(RuntimeError):
+            retina_therm.utils.TvstRtFile("bad.rt")
+
+
+def test_txt_codec(tmp_path):
+    with working_directory(tmp_path):
+        t = numpy.arange(100_001) * 1e-6
+        data = numpy.c_[t, numpy.exp(-t / 1e-3)]
+
+        # the same output as savetxt
+        retina_therm.utils.write_txt("Tvst.txt", data, block_size=1000)
+        numpy.savetxt("Tvst-savetxt.txt", data)
+        assert (
+            pathlib.Path("Tvst.txt").read_bytes()
+            == pathlib.Path("Tvst-savetxt.txt").read_bytes()
+        )
+        assert (retina_therm.utils.read_txt("Tvst.txt") == data).all()
+
+        retina_therm.utils.write_txt("Tvst.txt", data, digits=4)
+        assert pathlib.Path("Tvst.txt").read_text().split("\n")[1] == "1.000e-06 9.990e-01"
+        assert retina_therm.utils.read_txt("Tvst.txt") == pytest.approx(data, rel=1e-3)
@@ -1,18 +1,58 @@
 #include <cmath>
+#include <cstddef>
+#include <limits>
 
 #include <boost/math/distributions/non_central_chi_squared.hpp>
 
+// this file is compiled to a WASM module with emscripten,
+// or to a native shared library that is loaded with ctypes.
+#ifdef __EMSCRIPTEN__
 #include <emscripten.h>
+#define MARCUM_Q_EXPORT EMSCRIPTEN_KEEPALIVE
+#else
+#define MARCUM_Q_EXPORT
+#endif
+
 extern "C" {
 
-EMSCRIPTEN_KEEPALIVE
+// returns nan if the function cannot be computed, so that exceptions
+// never cross the C interface.
+MARCUM_Q_EXPORT
 double MarcumQFunction(double a_v, double a_a, double b_b)
 {
-  boost::math::non_central_chi_squared dist(2 * a_v, a_a * a_a);
-  return 1 - boost::math::cdf(dist, b_b * b_b);
+  if (b_b == 0) {
+    // boost gives 0 for the complement at x = 0
+    return 1;
+  }
+  try {
+    boost::math::non_central_chi_squared dist(2 * a_v, a_a * a_a);
+    return boost::math::cdf(boost::math::complement(dist, b_b * b_b));
+  } catch (...) {
+    return std::numeric_limits<double>::quiet_NaN();
+  }
+}
+
+// evaluate the Marcum Q function for n (a,b) pairs.
+// entries that cannot be computed are set to nan.
+MARCUM_Q_EXPORT
+void MarcumQFunctionArray(double a_v, const double* a_a, const double* a_b, double* a_q, size_t n)
+{
+  for (size_t i = 0; i < n; ++i) {
+    if (a_b[i] == 0) {
+      // boost gives 0 for the complement at x = 0
+      a_q[i] = 1;
+      continue;
+    }
+    try {
+      boost::math::non_central_chi_squared dist(2 * a_v, a_a[i] * a_a[i]);
+      a_q[i] = boost::math::cdf(boost::math::complement(dist, a_b[i] * a_b[i]));
+    } catch (...) {
+      a_q[i] = std::numeric_limits<double>::quiet_NaN();
+    }
+  }
 }
 
-EMSCRIPTEN_KEEPALIVE
+MARCUM_Q_EXPORT
 double MarcumQFunction10(double b_b)
 {
   return std::exp(-b_b * b_b / 2);